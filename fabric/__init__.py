@@ -1,5 +1,15 @@
 # flake8: noqa
 from ._version import __version_info__, __version__
 from .connection import Config, Connection
+from .retry import RetryPolicy
 from .runners import Remote, Result
-from .group import Group, SerialGroup, ThreadingGroup, GroupResult
+from .group import (
+    Group,
+    SerialGroup,
+    ThreadingGroup,
+    ProcessGroup,
+    GroupResult,
+    HostSpec,
+    LazySerialGroup,
+    LazyThreadingGroup,
+)
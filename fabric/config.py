@@ -80,6 +80,7 @@ class Config(InvokeConfig):
         # This needs doing before super __init__ as that calls our post_init
         explicit = ssh_config is not None
         self._set(_given_explicit_object=explicit)
+        self._set(_loaded_ssh_files=False)
 
         # Arrive at some non-None SSHConfig object (upon which to run .parse()
         # later, in _load_ssh_file())
@@ -124,6 +125,7 @@ class Config(InvokeConfig):
         # __init__
         if not self._given_explicit_object:
             self._load_ssh_files()
+            self._loaded_ssh_files = True
 
     def clone(self, *args, **kwargs):
         # TODO: clone() at this point kinda-sorta feels like it's retreading
@@ -146,8 +148,11 @@ class Config(InvokeConfig):
         ):
             setattr(new, attr, getattr(self, attr))
         # Load SSH configs, in case they weren't prior to now (e.g. a vanilla
-        # Invoke clone(into), instead of a us-to-us clone.)
-        self.load_ssh_config()
+        # Invoke clone(into), instead of a us-to-us clone.) But only then:
+        # loading them again would re-parse the same files, duplicating their
+        # rules in our SSHConfig (once per clone.)
+        if not self._loaded_ssh_files:
+            self.load_ssh_config()
         # All done
         return new
 
@@ -237,15 +242,38 @@ class Config(InvokeConfig):
             "connect_kwargs": {},
             "forward_agent": False,
             "gateway": None,
+            "group": {
+                "batch_size": None,
+                "canary": None,
+                "coalesce": False,
+                "concurrency": None,
+                "deadline": None,
+                "host_timeout": None,
+                "max_failures": None,
+                "output": {
+                    "buffer": False,
+                    "multiplex": False,
+                    "prefix": "[{host}] ",
+                },
+                "processes": None,
+                "retry": {},
+            },
             "load_ssh_configs": True,
             "port": 22,
-            "run": {"replace_env": True},
+            "run": {
+                "binary": False,
+                "compress_output": False,
+                "env_mode": "request",
+                "replace_env": True,
+                "stdin": None,
+            },
             "runners": {"remote": Remote},
             "ssh_config_path": None,
             "tasks": {"collection_name": "fabfile"},
-            # TODO: this becomes an override/extend once Invoke grows execution
-            # timeouts (which should be timeouts.execute)
-            "timeouts": {"connect": None},
+            # NOTE: 'command' matches the name Invoke itself uses in versions
+            # which grew execution timeouts; it's handled by Remote either way.
+            "timeouts": {"command": None, "connect": None},
+            "transfer": {"manifest": None, "method": "sftp"},
             "user": get_local_user(),
         }
         merge_dicts(defaults, ours)
@@ -30,6 +30,36 @@ def opens(method, self, *args, **kwargs):
     return method(self, *args, **kwargs)
 
 
+def derive_shorthand(host_string):
+    """
+    Parse ``[user@]host[:port]`` shorthand into a dict of its three parts.
+
+    Absent parts are ``None``; see `.Connection.__init__` for details.
+
+    .. versionadded:: 2.1
+    """
+    user_hostport = host_string.rsplit("@", 1)
+    hostport = user_hostport.pop()
+    user = user_hostport[0] if user_hostport and user_hostport[0] else None
+
+    # IPv6: can't reliably tell where addr ends and port begins, so don't
+    # try (and don't bother adding special syntax either, user should avoid
+    # this situation by using port=).
+    if hostport.count(":") > 1:
+        host = hostport
+        port = None
+    # IPv4: can split on ':' reliably.
+    else:
+        host_port = hostport.rsplit(":", 1)
+        host = host_port.pop(0) or None
+        port = host_port[0] if host_port and host_port[0] else None
+
+    if port is not None:
+        port = int(port)
+
+    return {"user": user, "host": host, "port": port}
+
+
 class Connection(Context):
     """
     A connection to an SSH daemon, with methods for commands and file transfer.
@@ -290,13 +320,14 @@ class Connection(Context):
                 for hop in hops:
                     # Happily, ProxyJump uses identical format to our host
                     # shorthand...
+                    # NOTE: hops share our config, so SSH config files are
+                    # neither re-read nor loaded when we were told not to.
                     if prev_gw is None:
-                        # TODO: this isn't persisting config! which among other
-                        # things can lead to not honoring skipping ssh config
-                        # file loads...
-                        cxn = Connection(hop)
+                        cxn = Connection(hop, config=self.config)
                     else:
-                        cxn = Connection(hop, gateway=prev_gw)
+                        cxn = Connection(
+                            hop, gateway=prev_gw, config=self.config
+                        )
                     prev_gw = cxn
                 gateway = prev_gw
             elif "proxycommand" in self.ssh_config:
@@ -353,7 +384,9 @@ class Connection(Context):
             # We're doing open() for now in case e.g. someone manually modifies
             # .connect_kwargs attributewise, but otherwise it feels better to
             # do it early instead of late.
-            connect_kwargs = self.config.connect_kwargs
+            # NOTE: copied, as the config may be shared with other
+            # connections (e.g. within a Group) and we modify it below.
+            connect_kwargs = dict(self.config.connect_kwargs)
         # Special case: key_filename gets merged instead of overridden.
         # TODO: probably want some sorta smart merging generally, special cases
         # are bad.
@@ -367,10 +400,11 @@ class Connection(Context):
         # SSH config identityfile values come last in the key_filename
         # 'hierarchy'.
         if "identityfile" in self.ssh_config:
-            connect_kwargs.setdefault("key_filename", [])
-            connect_kwargs["key_filename"].extend(
-                self.ssh_config["identityfile"]
-            )
+            # NOTE: a new list, so the original value (which may also live in
+            # a shared config) is left alone.
+            connect_kwargs["key_filename"] = list(
+                connect_kwargs.get("key_filename", [])
+            ) + list(self.ssh_config["identityfile"])
 
         return connect_kwargs
 
@@ -416,26 +450,7 @@ class Connection(Context):
         return hash(self._identity())
 
     def derive_shorthand(self, host_string):
-        user_hostport = host_string.rsplit("@", 1)
-        hostport = user_hostport.pop()
-        user = user_hostport[0] if user_hostport and user_hostport[0] else None
-
-        # IPv6: can't reliably tell where addr ends and port begins, so don't
-        # try (and don't bother adding special syntax either, user should avoid
-        # this situation by using port=).
-        if hostport.count(":") > 1:
-            host = hostport
-            port = None
-        # IPv4: can split on ':' reliably.
-        else:
-            host_port = hostport.rsplit(":", 1)
-            host = host_port.pop(0) or None
-            port = host_port[0] if host_port and host_port[0] else None
-
-        if port is not None:
-            port = int(port)
-
-        return {"user": user, "host": host, "port": port}
+        return derive_shorthand(host_string)
 
     @property
     def is_connected(self):
@@ -1,3 +1,12 @@
+from invoke.exceptions import Failure
+
+try:
+    # Invoke 1.3+, which times out local commands, has its own.
+    from invoke.exceptions import CommandTimedOut as _InvokeCommandTimedOut
+except ImportError:
+    _InvokeCommandTimedOut = Failure
+
+
 # TODO: this may want to move to Invoke if we can find a use for it there too?
 # Or make it _more_ narrowly focused and stay here?
 class NothingToDo(Exception):
@@ -13,3 +22,118 @@ class GroupException(Exception):
 
     def __init__(self, result):
         self.result = result
+
+
+class MapException(Exception):
+    """
+    Raised by `.Group.map` when some items couldn't be processed on any host.
+
+    ``results`` is the list `.Group.map` would otherwise have returned, with
+    each failed item's (last) exception in place of its value; ``failed``
+    maps the indices of those items to the same exceptions.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, results, failed):
+        super(MapException, self).__init__(results, failed)
+        self.results = results
+        self.failed = failed
+
+
+class TransferFailed(Exception):
+    """
+    Raised when the remote command performing a file transfer fails.
+
+    ``result`` is the transfer's `.transfer.Result`, whose ``exited`` and
+    ``stderr`` attributes hold the command's exit status and error output.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, result):
+        super(TransferFailed, self).__init__(result)
+        self.result = result
+
+    def __str__(self):
+        template = "Transfer via {} exited with status {}!\n\nStderr:{}\n"
+        return template.format(
+            self.result.method, self.result.exited, _tail(self.result.stderr)
+        )
+
+
+class CommandTimedOut(_InvokeCommandTimedOut):
+    """
+    Raised when a remote command fails to complete within its ``timeout``.
+
+    The remote channel has already been closed by the time this is raised;
+    ``result`` holds whatever output was received up to that point, and
+    ``timeout`` the (exceeded) timeout value, in seconds.
+
+    Where Invoke has its own `~invoke.exceptions.CommandTimedOut` (1.3 and
+    up), this is a subclass of it, so handlers written for local commands'
+    timeouts catch remote ones too; otherwise, it is a plain
+    `~invoke.exceptions.Failure`.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, result, timeout):
+        # Invoke's own takes (and sets) timeout too, but Failure doesn't.
+        Failure.__init__(self, result)
+        self.timeout = timeout
+
+    def __str__(self):
+        template = """Command did not complete within {} seconds!
+
+Command: {!r}
+
+Stdout (partial):{}
+
+Stderr (partial):{}
+
+"""
+        return template.format(
+            self.timeout,
+            self.result.command,
+            _tail(self.result.stdout),
+            _tail(self.result.stderr),
+        )
+
+    def __repr__(self):
+        return "<{}: cmd={!r} timeout={}>".format(
+            self.__class__.__name__, self.result.command, self.timeout
+        )
+
+
+def _tail(stream, count=10):
+    return "\n\n" + "\n".join(stream.splitlines()[-count:])
+
+
+class HostTimedOut(Exception):
+    """
+    Recorded in a `.GroupResult` for a host given up on for taking too long.
+
+    ``setting`` names the limit that was hit (``"host_timeout"`` or
+    ``"deadline"``; see `.ThreadingGroup`), ``timeout`` is its value in
+    seconds, and ``started`` says whether work on the host had begun at all.
+    The host's connection has been closed.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, setting, timeout, started=True):
+        # Passed up so instances survive pickling (see `.ProcessGroup`).
+        super(HostTimedOut, self).__init__(setting, timeout, started)
+        self.setting = setting
+        self.timeout = timeout
+        self.started = started
+
+    def __str__(self):
+        if self.setting == "deadline":
+            msg = "Group deadline of {} seconds passed"
+            if not self.started:
+                msg += " before this host was started"
+        else:
+            msg = "Host did not finish within {} seconds"
+        return msg.format(self.timeout) + "!"
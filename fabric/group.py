@@ -1,12 +1,34 @@
+from array import array
+from collections import Counter, OrderedDict, deque, namedtuple
+import csv
+from itertools import chain
+import json
+import math
+import multiprocessing
+import pickle
+from threading import Condition, Lock
+import time
+
 try:
-    from invoke.vendor.six.moves.queue import Queue
+    from invoke.vendor.six import string_types
+    from invoke.vendor.six.moves.queue import Empty, Queue
 except ImportError:
-    from six.moves.queue import Queue
+    from six import string_types
+    from six.moves.queue import Empty, Queue
 
+from invoke.config import copy_dict
+from invoke.exceptions import Failure
+from invoke.runners import normalize_hide
 from invoke.util import ExceptionHandlingThread
+from paramiko.config import SSHConfig
 
-from .connection import Connection
-from .exceptions import GroupException
+from .config import Config
+from .connection import Connection, derive_shorthand
+from .exceptions import GroupException, HostTimedOut, MapException
+from .output import OutputMultiplexer
+from .retry import RetryPolicy
+from .runners import Result
+from .transfer import Result as TransferResult
 
 
 class Group(list):
@@ -58,43 +80,334 @@ class Group(list):
     .. versionadded:: 2.0
     """
 
-    def __init__(self, *hosts):
+    _config = None
+
+    #: Batch size used when neither ``batch_size`` nor the
+    #: ``group.batch_size`` setting is given; ``None`` means all at once.
+    default_batch_size = None
+
+    #: While executing, the reason (if any) for skipping connections not yet
+    #: started; set once ``max_failures`` is exceeded. Subclasses which can
+    #: stop part way through a batch should check it (as `.ThreadingGroup`
+    #: does.)
+    _halted = None
+
+    def __init__(self, *hosts, **kwargs):
         """
         Create a group of connections from one or more shorthand strings.
 
         See `.Connection` for details on the format of these strings - they
         will be used as the first positional argument of `.Connection`
         constructors.
+
+        Each of those connections gets its own clone of a single `.Config` -
+        given as ``config``, or else created once - which also becomes this
+        group's own `config`. Configuration files, including SSH config
+        files, are therefore loaded (at most) once per group, not once per
+        host; yet changing one connection's config (e.g. setting
+        ``group[0].config.sudo.password``) affects only that connection.
+
+        :param config:
+            The `.Config` to clone for each connection. Default: ``None`` (a
+            new `.Config`.)
+
+        The remaining (keyword-only) parameters control rolling execution;
+        each defaults to the like-named ``group.*`` setting, whose own default
+        is ``None`` (disabled.)
+
+        :param int canary:
+            Operate on this many connections, from the front of the group,
+            before all others, as a batch of their own; if any of them fail,
+            no other connections are touched.
+
+        :param int batch_size:
+            Operate on (the remaining) connections this many at a time, in
+            group order, each batch finishing before the next one starts. How
+            the members of a single batch are handled (e.g. concurrently) is
+            up to the concrete subclass.
+
+        :param max_failures:
+            Once more than this many connections have failed, stop starting
+            new batches. May be an integer count, or a string percentage of
+            the group's size (not counting coalesced connections), such as
+            ``"10%"``. A `.ThreadingGroup` with a ``concurrency`` limit also
+            stops handing the current batch's connections to its workers
+            (though each worker may have started on one more by the time it
+            does.)
+
+        Connections left untouched due to ``canary`` or ``max_failures`` map
+        to `.Skipped` objects in the resulting `.GroupResult`.
+
+        :param bool coalesce:
+            Whether to operate only once per distinct target, when the group
+            contains several connections to the same host, user and port
+            (e.g. a host listed twice, or under two SSH config aliases.) The
+            first such connection is used; as connections to the same
+            target compare equal, every one of them still finds the shared
+            result in the `.GroupResult`. Default: the ``group.coalesce``
+            setting, itself defaulting to ``False``.
+
+        :param retry:
+            A `.RetryPolicy` governing retries of connections which fail
+            transiently, or a dict of arguments for creating one. Default:
+            the ``group.retry`` setting, itself defaulting to ``{}`` (no
+            retries.)
+
+        .. versionchanged:: 2.1
+            Added the ``config``, ``canary``, ``batch_size``,
+            ``max_failures``, ``coalesce`` and ``retry`` arguments.
         """
+        config = kwargs.pop("config", None)
+        if config is not None:
+            # As in Connection; but done once, so the result can be cloned.
+            if not isinstance(config, Config):
+                config = config.clone(into=Config)
+            self.config = config
+        self._canary = kwargs.pop("canary", None)
+        self._coalesce = kwargs.pop("coalesce", None)
+        self._batch_size = kwargs.pop("batch_size", None)
+        self._max_failures = kwargs.pop("max_failures", None)
+        self._retry = kwargs.pop("retry", None)
+        if kwargs:
+            err = "__init__() got unexpected keyword arguments: {}"
+            raise TypeError(err.format(", ".join(sorted(kwargs))))
         # TODO: #563, #388 (could be here or higher up in Program area)
-        self.extend(map(Connection, hosts))
+        if hosts:
+            config = self.config
+            self.extend(Connection(x, config=config.clone()) for x in hosts)
 
     @classmethod
-    def from_connections(cls, connections):
+    def from_connections(cls, connections, **kwargs):
         """
         Alternate constructor accepting `.Connection` objects.
 
+        Any keyword arguments are handed to the class' ``__init__``.
+
         .. versionadded:: 2.0
+        .. versionchanged:: 2.1
+            Added ``**kwargs``.
         """
         # TODO: *args here too; or maybe just fold into __init__ and type
         # check?
-        group = cls()
+        group = cls(**kwargs)
         group.extend(connections)
         return group
 
-    def run(self, *args, **kwargs):
+    @property
+    def config(self):
         """
-        Executes `.Connection.run` on all member `Connections <.Connection>`.
+        The `.Config` consulted for group-level settings.
+
+        Unless set explicitly, an anonymous `.Config` is created (and
+        remembered) the first time this is accessed.
+
+        .. versionadded:: 2.1
+        """
+        if self._config is None:
+            self._config = Config()
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        self._config = value
+
+    def _setting(self, name):
+        value = getattr(self, "_" + name)
+        if value is None:
+            value = self.config.group[name]
+        return value
+
+    def _targets(self):
+        """
+        The member connections to operate on, minus any coalesced ones.
+        """
+        if not self._setting("coalesce"):
+            return list(self)
+        # Connections hash & compare by their target, so this keeps the
+        # first connection for each.
+        seen = set()
+        targets = []
+        for cxn in self:
+            if cxn not in seen:
+                seen.add(cxn)
+                targets.append(cxn)
+        return targets
+
+    def _batches(self):
+        cxns = self._targets()
+        batches = []
+        canary = self._setting("canary")
+        if canary:
+            batches.append(cxns[:canary])
+            cxns = cxns[canary:]
+        size = self._setting("batch_size") or self.default_batch_size
+        size = max(size or len(cxns), 1)
+        batches.extend(cxns[i:i + size] for i in range(0, len(cxns), size))
+        # Empty groups still get (trivially) executed.
+        return batches or [cxns]
+
+    def _failure_limit(self):
+        value = self._setting("max_failures")
+        if isinstance(value, string_types) and value.endswith("%"):
+            return len(self._targets()) * float(value[:-1]) / 100
+        return value
+
+    def _retry_policy(self):
+        policy = self._setting("retry")
+        if not policy:
+            return None
+        if not isinstance(policy, RetryPolicy):
+            # Kept, so its failure counts (see RetryPolicy) persist.
+            policy = self._retry = RetryPolicy(**dict(policy.items()))
+        return policy
+
+    def _retrying(self, execute, method, cxns, args, kwargs):
+        """
+        Yield ``(connection, value)`` pairs from ``execute``, with retries.
+
+        ``execute`` takes the same arguments as `_execute_iter`. Without a
+        retry policy, this simply calls it once; see `.RetryPolicy` for what
+        happens otherwise.
+        """
+        policy = self._retry_policy()
+        if policy is None:
+            for pair in execute(method, cxns, args, kwargs):
+                yield pair
+            return
+        if policy.idempotent:
+            for pair in self._retry_rounds(
+                policy, execute, method, cxns, args, kwargs
+            ):
+                yield pair
+            return
+        # Only connecting is safe to retry. Executors do so for each
+        # connection just before calling the method on it, so that it holds
+        # no more connections open at once than it otherwise would.
+        for pair in execute(method, cxns, args, kwargs, retry=policy):
+            yield pair
+
+    def _retry_rounds(self, policy, execute, method, cxns, args, kwargs):
+        for attempt in range(1, policy.attempts + 1):
+            retries = []
+            for cxn, value in execute(method, cxns, args, kwargs):
+                failed = isinstance(value, BaseException)
+                policy.record(cxn, failed)
+                if (
+                    failed
+                    and attempt < policy.attempts
+                    and policy.retryable(value)
+                    and not policy.tripped(cxn)
+                    and self._halted is None
+                ):
+                    retries.append(cxn)
+                else:
+                    yield cxn, value
+            if not retries:
+                return
+            cxns = retries
+            time.sleep(policy.delay(attempt))
+
+    def _rolling(self, execute):
+        """
+        Yield ``(connection, value)`` pairs from ``execute``, batch by batch.
+
+        ``execute`` is called with each batch (see `__init__`) in turn and
+        must return an iterable of pairs for that batch; once the canary
+        fails or ``max_failures`` is exceeded, the remaining connections are
+        yielded with `.Skipped` values instead.
+        """
+        limit = self._failure_limit()
+        exceeded = "max_failures ({}) exceeded".format(
+            self._setting("max_failures")
+        )
+        canary = self._setting("canary")
+        batches = self._batches()
+        failures = 0
+        self._halted = None
+        try:
+            for index, batch in enumerate(batches):
+                failed = 0
+                for cxn, value in execute(batch):
+                    if isinstance(value, BaseException):
+                        failed += 1
+                        if limit is not None and failures + failed > limit:
+                            # Lets executors skip the rest of this batch too.
+                            self._halted = exceeded
+                    yield cxn, value
+                failures += failed
+                reason = None
+                if canary and index == 0 and failed:
+                    reason = "canary failed"
+                elif limit is not None and failures > limit:
+                    reason = exceeded
+                if reason is not None:
+                    for cxn in chain.from_iterable(batches[index + 1:]):
+                        yield cxn, Skipped(reason)
+                    return
+        finally:
+            self._halted = None
+
+    def _do(self, method, *args, **kwargs):
+        """
+        Call ``method`` (by name) on all member `Connections <.Connection>`.
+
+        This is the single execution engine behind `run`, `sudo`, `put` and
+        `get`: it splits the group into batches (see `__init__`), handing each
+        to `_execute`, and decides when to stop.
 
         :returns: a `.GroupResult`.
 
-        .. versionadded:: 2.0
+        .. versionadded:: 2.1
+        """
+        results = GroupResult()
+        failed = False
+
+        def execute(method, cxns, args, kwargs, retry=None):
+            if self._setting("max_failures") is not None:
+                # So that _rolling may stop part way through a batch.
+                return self._execute_iter(method, cxns, args, kwargs, retry)
+            return self._execute(method, cxns, args, kwargs, retry).items()
+
+        pairs = self._rolling(
+            lambda batch: self._retrying(
+                execute, method, batch, args, kwargs
+            )
+        )
+        for cxn, value in pairs:
+            results[cxn] = value
+            failed = failed or isinstance(value, BaseException)
+        if failed:
+            raise GroupException(results)
+        return results
+
+    def _do_iter(self, method, *args, **kwargs):
+        """
+        Like `_do`, but yielding pairs as `_execute_iter` produces them.
+
+        .. versionadded:: 2.1
+        """
+        return self._rolling(
+            lambda batch: self._retrying(
+                self._execute_iter, method, batch, args, kwargs
+            )
+        )
+
+    def _execute(self, method, cxns, args, kwargs, retry=None):
+        """
+        Call ``method`` on each of ``cxns``, returning a `.GroupResult`.
+
+        Concrete subclasses implement this to determine how (serially,
+        concurrently, etc) that happens. Exceptions raised by individual
+        connections must be captured as their result values, not raised.
+
+        Given a `.RetryPolicy` as ``retry``, each connection is to be opened
+        (see `_connect`) right before ``method`` is called on it.
+
+        .. versionadded:: 2.1
         """
-        # TODO: probably best to suck it up & match actual run() sig?
         # TODO: how to change method of execution across contents? subclass,
         # kwargs, additional methods, inject an executor? Doing subclass for
         # now, but not 100% sure it's the best route.
-        # TODO: also need way to deal with duplicate connections (see THOUGHTS)
         # TODO: and errors - probably FailureSet? How to handle other,
         # regular, non Failure, exceptions though? Still need an aggregate
         # exception type either way, whether it is FailureSet or what...
@@ -107,8 +420,59 @@ class Group(list):
         # exception just being the signal that Shit Broke?
         raise NotImplementedError
 
-    # TODO: how to handle sudo? Probably just an inner worker method that takes
-    # the method name to actually call (run, sudo, etc)?
+    def _execute_iter(self, method, cxns, args, kwargs, retry=None):
+        """
+        Like `_execute`, but returning an iterable of ``(cxn, value)`` pairs.
+
+        Subclasses able to should yield each pair as soon as its connection
+        is finished; by default, nothing is yielded until all of them are.
+
+        .. versionadded:: 2.1
+        """
+        return iter(self._execute(method, cxns, args, kwargs, retry).items())
+
+    def run(self, *args, **kwargs):
+        """
+        Executes `.Connection.run` on all member `Connections <.Connection>`.
+
+        :returns: a `.GroupResult`.
+
+        .. versionadded:: 2.0
+        """
+        # TODO: probably best to suck it up & match actual run() sig?
+        return self._do("run", *args, **kwargs)
+
+    def run_iter(self, *args, **kwargs):
+        """
+        Executes `.Connection.run`, yielding results as connections finish.
+
+        Takes the same arguments as `run`, but instead of waiting for every
+        connection before returning a `.GroupResult`, returns an iterator of
+        ``(connection, value)`` two-tuples, produced in order of completion
+        (to the extent the concrete subclass allows), so callers can act on
+        early finishers while stragglers are still running. As with
+        `.GroupResult` values, ``value`` is a `.runners.Result`, an exception
+        or a `.Skipped`; no `.GroupException` is raised.
+
+        Since work starts only when iteration does, be sure to exhaust (or
+        close) the iterator; closing it early waits for in-flight connections
+        to finish, but nothing further is started.
+
+        .. versionadded:: 2.1
+        """
+        return self._do_iter("run", *args, **kwargs)
+
+    def sudo(self, *args, **kwargs):
+        """
+        Executes `.Connection.sudo` on all member `Connections <.Connection>`.
+
+        :returns: a `.GroupResult`.
+
+        .. versionadded:: 2.1
+        """
+        # TODO: (in concurrent subclasses) configurability around interactive
+        # prompting resulting in an exception instead, as in v1
+        return self._do("sudo", *args, **kwargs)
 
     # TODO: this all needs to mesh well with similar strategies applied to
     # entire tasks - so that may still end up factored out into Executors or
@@ -118,20 +482,125 @@ class Group(list):
     # would be distinct from Group. (May want to switch Group to use that,
     # though, whatever it ends up being?)
 
-    # TODO: mirror Connection's close()?
+    def put(self, *args, **kwargs):
+        """
+        Executes `.Connection.put` on all member `Connections <.Connection>`.
+
+        This is a straightforward application: aside from the behavior of the
+        concrete group class (serial, threaded, etc), the same local file is
+        uploaded to every connection.
+
+        :returns: a `.GroupResult`.
+
+        .. versionadded:: 2.1
+        """
+        return self._do("put", *args, **kwargs)
 
     def get(self, *args, **kwargs):
         """
         Executes `.Connection.get` on all member `Connections <.Connection>`.
 
+        Since downloading the same remote path from many hosts into a single
+        local path would have each host overwrite the last, ``local`` may
+        contain ``{host}``, ``{user}`` and/or ``{port}`` placeholders, which
+        are filled in per connection (see `.Transfer.get`). When ``local`` is
+        not given at all, it defaults to ``"{host}/"``, i.e. each host's file
+        lands in a directory named after that host, relative to the current
+        working directory.
+
         :returns: a `.GroupResult`.
 
         .. versionadded:: 2.0
+        .. versionchanged:: 2.1
+            Implemented on the concrete subclasses; added the ``{host}/``
+            default for ``local``.
         """
         # TODO: probably best to suck it up & match actual get() sig?
-        # TODO: actually implement on subclasses
+        if len(args) < 2 and "local" not in kwargs:
+            kwargs["local"] = "{host}/"
+        return self._do("get", *args, **kwargs)
+
+    def map(self, fn, items, per_host_concurrency=1, attempts=None):
+        """
+        Spread calls of ``fn`` over ``items`` across member connections.
+
+        Where `run` and friends do the same thing on every connection, this
+        handles a set of interchangeable work items (shards, tenants, files,
+        ...) which any connection could process: each item is processed
+        once, by calling ``fn(connection, item)`` for whichever connection
+        is free (so faster hosts end up processing more items), and an item
+        whose call raised an exception is retried on a connection which
+        hasn't yet tried it.
+
+        How connections are kept busy (e.g. serially or concurrently) is up
+        to the concrete subclass. Coalescing (see `__init__`) applies, but
+        no other rolling execution settings do.
+
+        :param fn:
+            Callable taking a `.Connection` and an item; its return value
+            becomes that item's result.
+
+        :param items: Iterable of work items.
+
+        :param int per_host_concurrency:
+            Number of items each connection may process at once (where the
+            subclass supports concurrency at all.) Default: ``1``.
+
+        :param int attempts:
+            Maximum number of connections to try each item on. Default:
+            ``None``, meaning every connection (once.)
+
+        :returns:
+            A list of ``fn``'s return values, in the order of ``items``.
+
+        :raises:
+            `.MapException`, if any item failed on every connection it was
+            tried on.
+
+        .. versionadded:: 2.1
+        """
+        items = list(items)
+        cxns = self._targets()
+        if items and not cxns:
+            raise ValueError("Can't map items over an empty group!")
+        attempts = min(attempts or len(cxns), len(cxns))
+        values, failed = self._map(
+            fn, cxns, items, max(per_host_concurrency, 1), attempts
+        )
+        if failed:
+            raise MapException(values, failed)
+        return values
+
+    def _map(self, fn, cxns, items, per_host_concurrency, attempts):
+        """
+        Do the work of `map`, returning its values and any failures.
+
+        The latter are a dict of item indices to exceptions; values for
+        those items are the same exceptions.
+
+        .. versionadded:: 2.1
+        """
         raise NotImplementedError
 
+    def close(self):
+        """
+        Executes `.Connection.close` on all member `Connections <.Connection>`.
+
+        Concurrent subclasses close their connections concurrently, so
+        shutting down a large group doesn't cost one round of network
+        teardown per host in sequence.
+
+        :returns: a `.GroupResult`.
+
+        .. versionadded:: 2.1
+        """
+        # Batching, failure thresholds and coalescing make no sense for
+        # teardown.
+        results = self._execute("close", list(self), (), {})
+        if results.failed:
+            raise GroupException(results)
+        return results
+
 
 class SerialGroup(Group):
     """
@@ -140,51 +609,414 @@ class SerialGroup(Group):
     .. versionadded:: 2.0
     """
 
-    def run(self, *args, **kwargs):
+    # Lets failure thresholds take effect between any two connections.
+    default_batch_size = 1
+
+    def _execute(self, method, cxns, args, kwargs, retry=None):
         results = GroupResult()
-        excepted = False
-        for cxn in self:
+        pairs = self._execute_iter(method, cxns, args, kwargs, retry)
+        for cxn, value in pairs:
+            results[cxn] = value
+        return results
+
+    def _execute_iter(self, method, cxns, args, kwargs, retry=None):
+        for cxn in cxns:
             try:
-                results[cxn] = cxn.run(*args, **kwargs)
+                _connect(cxn, retry)
+                yield cxn, getattr(cxn, method)(*args, **kwargs)
             except Exception as e:
-                results[cxn] = e
-                excepted = True
-        if excepted:
-            raise GroupException(results)
-        return results
+                yield cxn, e
 
+    def _map(self, fn, cxns, items, per_host_concurrency, attempts):
+        values, failed = [], {}
+        for index, item in enumerate(items):
+            # Nobody's ever busy here, so simply take turns; retries go to
+            # the next connection(s) along.
+            for attempt in range(attempts):
+                cxn = cxns[(index + attempt) % len(cxns)]
+                try:
+                    value = fn(cxn, item)
+                except Exception as e:
+                    value = failed[index] = e
+                else:
+                    failed.pop(index, None)
+                    break
+            values.append(value)
+        return values, failed
 
-def thread_worker(cxn, queue, args, kwargs):
-    result = cxn.run(*args, **kwargs)
+
+def _open(cxn, policy, key=None):
+    """
+    Open ``cxn``, retrying transient failures as `.RetryPolicy` ``policy``
+    allows. Attempts are recorded against ``key`` (default: ``cxn``.)
+    """
+    key = cxn if key is None else key
+    for attempt in range(1, policy.attempts + 1):
+        try:
+            cxn.open()
+        except Exception as e:
+            policy.record(key, True)
+            if (
+                attempt == policy.attempts
+                or not policy.retryable(e)
+                or policy.tripped(key)
+            ):
+                raise
+            time.sleep(policy.delay(attempt))
+        else:
+            policy.record(key, False)
+            return
+
+
+def _connect(cxn, retry):
+    # Readies 'cxn' for an operation, given a retry policy (see
+    # Group._retrying); lazy groups' stand-ins connect anew for every call,
+    # so retry within each of those instead.
+    if retry is not None and not isinstance(cxn, _Materializer):
+        _open(cxn, retry)
+
+
+def thread_worker(
+    cxn, queue, method, args, kwargs, source=None, running=None, retry=None
+):
+    # 'running' (when given) maps connection ids to their start times while
+    # they're in progress, and to None once they're not.
+    if running is not None:
+        running[id(cxn)] = time.time()
+    try:
+        _connect(cxn, retry)
+        result = getattr(cxn, method)(*args, **kwargs)
+    finally:
+        if source is not None:
+            source.close()
+        if running is not None:
+            running[id(cxn)] = None
     # TODO: namedtuple or attrs object?
     queue.put((cxn, result))
 
 
+def pool_worker(jobs, queue, method, args, running=None, retry=None):
+    # Unlike thread_worker, outlives any single connection, so exceptions are
+    # captured per connection & handed back alongside regular results.
+    while True:
+        try:
+            cxn, kwargs, source = jobs.get(block=False)
+        except Empty:
+            return
+        if running is not None:
+            running[id(cxn)] = time.time()
+        try:
+            _connect(cxn, retry)
+            result = getattr(cxn, method)(*args, **kwargs)
+        except Exception as e:
+            result = e
+        finally:
+            if source is not None:
+                source.close()
+            if running is not None:
+                running[id(cxn)] = None
+        queue.put((cxn, result))
+
+
+class _MapPool(object):
+    """
+    Items of a `.Group.map` call shared by the worker threads processing them.
+
+    Workers `take` item indices (failed items awaiting a retry first, then
+    fresh ones) and report back via `finish`. A failed item is only handed
+    to workers whose connection hasn't tried it yet, until it has been tried
+    on ``attempts`` connections, at which point its failure is final.
+    """
+
+    def __init__(self, count, attempts):
+        self.condition = Condition()
+        self.fresh = deque(range(count))
+        self.retrying = []
+        self.tried = {}
+        self.in_flight = 0
+        self.attempts = attempts
+        self.values = [None] * count
+        self.failed = {}
+
+    def take(self, key):
+        """
+        Return the index of an item for connection ``key`` to process.
+
+        Blocks while there is nothing for it to do, but other items are in
+        progress (and may yet fail); returns ``None`` once there's nothing
+        left for it at all.
+        """
+        with self.condition:
+            while True:
+                for index in self.retrying:
+                    if key not in self.tried[index]:
+                        self.retrying.remove(index)
+                        break
+                else:
+                    index = self.fresh.popleft() if self.fresh else None
+                if index is not None:
+                    self.in_flight += 1
+                    return index
+                # Anything still awaiting a retry is some other connection's
+                # to take, so we're only needed if in-progress items fail.
+                if not self.in_flight:
+                    return None
+                self.condition.wait()
+
+    def finish(self, index, key, value=None, error=None):
+        with self.condition:
+            self.in_flight -= 1
+            if error is None:
+                self.values[index] = value
+            else:
+                tried = self.tried.setdefault(index, set())
+                tried.add(key)
+                if len(tried) >= self.attempts:
+                    self.values[index] = self.failed[index] = error
+                else:
+                    self.retrying.append(index)
+            self.condition.notify_all()
+
+
+def map_worker(cxn, pool, fn, items, opener=None):
+    key = id(cxn)
+    while True:
+        index = pool.take(key)
+        if index is None:
+            return
+        try:
+            # Several workers sharing a connection mustn't all open it.
+            if opener is not None and not cxn.is_connected:
+                with opener:
+                    cxn.open()
+            value = fn(cxn, items[index])
+        except Exception as e:
+            pool.finish(index, key, error=e)
+        else:
+            pool.finish(index, key, value=value)
+
+
 class ThreadingGroup(Group):
     """
     Subclass of `.Group` which uses threading to execute concurrently.
 
+    When the ``group.output.multiplex`` setting is enabled, any output which
+    would otherwise be written straight to the local terminal by every
+    host's threads at once, is instead funneled through a single
+    `.OutputMultiplexer`, which writes whole lines prefixed with
+    ``group.output.prefix`` (formatted with the host's ``host``, ``user`` and
+    ``port``) and, if ``group.output.buffer`` is set, holds each host's
+    output until that host is done. Streams which are hidden, or given
+    explicitly via ``out_stream``/``err_stream``, are left alone.
+
+    Hosts exceeding the ``host_timeout`` or ``deadline`` limits (see
+    `__init__`) are given up on: their connections are closed, and they map
+    to `.HostTimedOut` exceptions in the resulting `.GroupResult`, while
+    every other host's result is kept. Their threads are abandoned rather
+    than waited for.
+
     .. versionadded:: 2.0
     """
 
-    def run(self, *args, **kwargs):
-        results = GroupResult()
-        queue = Queue()
+    #: Seconds `run_iter` waits on results before checking for dead threads.
+    poll_interval = 0.01
+
+    def __init__(self, *hosts, **kwargs):
+        """
+        Create a group of connections, as with `.Group.__init__`.
+
+        :param int concurrency:
+            Maximum number of connections to operate on at once. When given
+            (and smaller than the group), a fixed pool of that many worker
+            threads pulls connections off a shared queue, instead of one
+            thread being started per connection; this keeps thread counts,
+            open sockets and simultaneous handshakes bounded regardless of
+            group size. Default: the ``group.concurrency`` setting, itself
+            defaulting to ``None`` (no limit.)
+
+        :param float host_timeout:
+            Seconds any single host may take, from when work on it starts.
+            Default: the ``group.host_timeout`` setting, itself defaulting to
+            ``None`` (no limit.)
+
+        :param float deadline:
+            Seconds the whole operation (or, when batching, each batch) may
+            take; hosts unfinished or, with ``concurrency``, not yet started
+            by then are given up on. Default: the ``group.deadline`` setting,
+            itself defaulting to ``None`` (no limit.)
+
+        .. versionadded:: 2.1
+        """
+        self._concurrency = kwargs.pop("concurrency", None)
+        self._host_timeout = kwargs.pop("host_timeout", None)
+        self._deadline = kwargs.pop("deadline", None)
+        super(ThreadingGroup, self).__init__(*hosts, **kwargs)
+
+    @property
+    def concurrency(self):
+        """
+        The effective worker limit; see ``concurrency`` in `__init__`.
+
+        .. versionadded:: 2.1
+        """
+        if self._concurrency is not None:
+            return self._concurrency
+        return self.config.group.concurrency
+
+    @concurrency.setter
+    def concurrency(self, value):
+        self._concurrency = value
+
+    def _spawn(
+        self, method, cxns, args, kwargs, queue, running=None, retry=None
+    ):
+        """
+        Start worker threads calling ``method`` on ``cxns``.
+
+        :returns: Three-tuple of the threads, the `.OutputMultiplexer` (or
+            ``None``) in use, and the queue of jobs pooled workers pull from
+            (or ``None``, if not pooling.)
+        """
         threads = []
-        for cxn in self:
-            my_kwargs = dict(cxn=cxn, queue=queue, args=args, kwargs=kwargs)
-            thread = ExceptionHandlingThread(
-                target=thread_worker, kwargs=my_kwargs
+        work = None
+        multiplexer, streams = self._multiplexer(method, kwargs)
+        jobs = []
+        for cxn in cxns:
+            my_kwargs, source = kwargs, None
+            if multiplexer is not None:
+                source = multiplexer.register(self._output_prefix(cxn))
+                my_kwargs = dict(
+                    kwargs,
+                    **{x + "_stream": getattr(source, x) for x in streams}
+                )
+            jobs.append((cxn, my_kwargs, source))
+        concurrency = self.concurrency
+        if concurrency is not None and concurrency < len(jobs):
+            work = Queue()
+            for job in jobs:
+                work.put(job)
+            pool_kwargs = dict(
+                jobs=work, queue=queue, method=method, args=args
             )
-            threads.append(thread)
+            if running is not None:
+                pool_kwargs["running"] = running
+            if retry is not None:
+                pool_kwargs["retry"] = retry
+            for _ in range(max(concurrency, 1)):
+                thread = ExceptionHandlingThread(
+                    target=pool_worker, kwargs=pool_kwargs
+                )
+                threads.append(thread)
+        else:
+            for cxn, my_kwargs, source in jobs:
+                thread_kwargs = dict(
+                    cxn=cxn,
+                    queue=queue,
+                    method=method,
+                    args=args,
+                    kwargs=my_kwargs,
+                )
+                if source is not None:
+                    thread_kwargs["source"] = source
+                if running is not None:
+                    thread_kwargs["running"] = running
+                if retry is not None:
+                    thread_kwargs["retry"] = retry
+                thread = ExceptionHandlingThread(
+                    target=thread_worker, kwargs=thread_kwargs
+                )
+                threads.append(thread)
         for thread in threads:
             thread.start()
+        return threads, multiplexer, work
+
+    def _limits(self):
+        return self._setting("host_timeout"), self._setting("deadline")
+
+    def _expire(self, cxns, running, expired, began, work):
+        """
+        Give up on any of ``cxns`` which have run out of time.
+
+        Closes their connections, records their ids in ``expired`` and
+        returns ``(cxn, HostTimedOut)`` pairs for them.
+        """
+        host_timeout, deadline = self._limits()
+        now = time.time()
+        late = deadline is not None and now - began >= deadline
+        pairs = []
+        for cxn in cxns:
+            start = running.get(id(cxn))
+            # Not yet started, or already finished.
+            if start is None or id(cxn) in expired:
+                continue
+            if late:
+                pairs.append((cxn, HostTimedOut("deadline", deadline)))
+            elif host_timeout is not None and now - start >= host_timeout:
+                error = HostTimedOut("host_timeout", host_timeout)
+                pairs.append((cxn, error))
+        if late and work is not None:
+            for cxn in self._unqueue(work):
+                error = HostTimedOut("deadline", deadline, started=False)
+                pairs.append((cxn, error))
+        for cxn, _ in pairs:
+            expired.add(id(cxn))
+            # Typically wakes up the stuck thread, though we don't wait on it.
+            cxn.close()
+        return pairs
+
+    def _unqueue(self, work):
+        """
+        Empty pooled workers' job queue, so they start nothing else.
+
+        :returns: The connections of the jobs removed.
+        """
+        cxns = []
+        while True:
+            try:
+                cxn, _, source = work.get(block=False)
+            except Empty:
+                return cxns
+            if source is not None:
+                source.close()
+            cxns.append(cxn)
+
+    def _thread_failure(self, thread):
+        """
+        Return ``(cxn, exception)`` if ``thread`` died, else ``None``.
+
+        Errors which aren't about any one connection are simply raised.
+        """
+        wrapper = thread.exception()
+        if wrapper is None:
+            return None
+        # Outer kwargs is Thread instantiation kwargs, inner is kwargs
+        # passed to thread target/body.
+        cxn = wrapper.kwargs["kwargs"].get("cxn")
+        # Pool workers only die on non-Exception errors (such as
+        # KeyboardInterrupt), which should propagate as usual.
+        if cxn is None:
+            raise wrapper.value
+        return cxn, wrapper.value
+
+    def _execute(self, method, cxns, args, kwargs, retry=None):
+        results = GroupResult()
+        if any(x is not None for x in self._limits()):
+            # Needs watching as it goes, which _execute_iter already does.
+            pairs = self._execute_iter(method, cxns, args, kwargs, retry)
+            for cxn, value in pairs:
+                results[cxn] = value
+            return results
+        queue = Queue()
+        threads, multiplexer, _ = self._spawn(
+            method, cxns, args, kwargs, queue, retry=retry
+        )
         for thread in threads:
             # TODO: configurable join timeout
-            # TODO: (in sudo's version) configurability around interactive
-            # prompting resulting in an exception instead, as in v1
             thread.join()
-        # Get non-exception results from queue
+        if multiplexer is not None:
+            multiplexer.close()
+        # Get results from queue (which, for pooled workers, includes any
+        # exceptions)
         while not queue.empty():
             # TODO: io-sleep? shouldn't matter if all threads are now joined
             cxn, result = queue.get(block=False)
@@ -197,20 +1029,748 @@ class ThreadingGroup(Group):
         # - a queue if using multiprocessing
         # - some other state-passing mechanism if using e.g. coroutines
         # - ???
-        excepted = False
+        for thread in threads:
+            failure = self._thread_failure(thread)
+            if failure is not None:
+                cxn, error = failure
+                results[cxn] = error
+        return results
+
+    def _execute_iter(self, method, cxns, args, kwargs, retry=None):
+        supervised = any(x is not None for x in self._limits())
+        running = {} if supervised else None
+        expired = set()
+        began = checked = time.time()
+        queue = Queue()
+        threads, multiplexer, work = self._spawn(
+            method, cxns, args, kwargs, queue, running, retry
+        )
+        try:
+            # Every connection produces exactly one queued result, or (for
+            # unpooled threads) dies trying - or is given up on.
+            remaining = len(cxns)
+            unchecked = list(threads)
+            while remaining:
+                if self._halted is not None and work is not None:
+                    for cxn in self._unqueue(work):
+                        remaining -= 1
+                        yield cxn, Skipped(self._halted)
+                    if not remaining:
+                        break
+                try:
+                    cxn, result = queue.get(timeout=self.poll_interval)
+                except Empty:
+                    for thread in [x for x in unchecked if not x.is_alive()]:
+                        unchecked.remove(thread)
+                        failure = self._thread_failure(thread)
+                        if failure is None or id(failure[0]) in expired:
+                            continue
+                        remaining -= 1
+                        yield failure
+                else:
+                    if id(cxn) not in expired:
+                        remaining -= 1
+                        yield cxn, result
+                if supervised and time.time() - checked >= self.poll_interval:
+                    checked = time.time()
+                    for pair in self._expire(
+                        cxns, running, expired, began, work
+                    ):
+                        remaining -= 1
+                        yield pair
+        finally:
+            # Closed early, pooled workers mustn't go on to start the rest.
+            if work is not None:
+                self._unqueue(work)
+            # Threads stuck on expired hosts are abandoned, not waited for.
+            timeout = self.poll_interval if expired else None
+            for thread in threads:
+                thread.join(timeout)
+            if multiplexer is not None:
+                multiplexer.close()
+
+    def _map(self, fn, cxns, items, per_host_concurrency, attempts):
+        # NOTE: output multiplexing & time limits don't apply here; 'fn' is
+        # arbitrary code.
+        pool = _MapPool(len(items), attempts)
+        threads = []
+        for cxn in cxns:
+            kwargs = dict(cxn=cxn, pool=pool, fn=fn, items=items)
+            if per_host_concurrency > 1 and isinstance(cxn, Connection):
+                kwargs["opener"] = Lock()
+            for _ in range(per_host_concurrency):
+                threads.append(
+                    ExceptionHandlingThread(target=map_worker, kwargs=kwargs)
+                )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Workers only die on non-Exception errors (such as
+        # KeyboardInterrupt), which should propagate as usual.
         for thread in threads:
             wrapper = thread.exception()
             if wrapper is not None:
-                # Outer kwargs is Thread instantiation kwargs, inner is kwargs
-                # passed to thread target/body.
-                cxn = wrapper.kwargs["kwargs"]["cxn"]
-                results[cxn] = wrapper.value
-                excepted = True
-        if excepted:
+                raise wrapper.value
+        return pool.values, pool.failed
+
+    def _multiplexer(self, method, kwargs):
+        """
+        Start & return an `.OutputMultiplexer` if one is configured & useful.
+
+        Only command execution (``run`` and ``sudo``) produces output worth
+        multiplexing.
+
+        :returns:
+            Two-tuple of the multiplexer (or ``None``) and the names (``out``
+            and/or ``err``) of the streams it should handle.
+        """
+        settings = self.config.group.output
+        if method not in ("run", "sudo") or not settings.multiplex:
+            return None, []
+        hide = normalize_hide(kwargs.get("hide", self.config.run.hide))
+        streams = [
+            name
+            for name, stream in (("out", "stdout"), ("err", "stderr"))
+            if stream not in hide and kwargs.get(name + "_stream") is None
+        ]
+        if not streams:
+            return None, []
+        multiplexer = OutputMultiplexer(buffer=settings.buffer)
+        multiplexer.start()
+        return multiplexer, streams
+
+    def _output_prefix(self, cxn):
+        return self.config.group.output.prefix.format(
+            host=cxn.host, user=cxn.user, port=cxn.port
+        )
+
+
+# What talking to a dead worker process looks like.
+_pipe_errors = (EOFError, IOError, OSError)
+
+# Picklable stand-in for a per-host return value or exception; see _pack().
+_Packed = namedtuple("_Packed", "kind data")
+
+_result_fields = (
+    "stdout",
+    "stderr",
+    "encoding",
+    "command",
+    "shell",
+    "env",
+    "exited",
+    "pty",
+    "hide",
+    "compress",
+    "duration",
+)
+
+
+def _config_spec(config):
+    return copy_dict(config._config), config.base_ssh_config._config
+
+
+def _config_from_spec(spec):
+    data, rules = spec
+    # An explicit SSHConfig means no SSH config files get (re)loaded; the
+    # merged data becomes the new object's overrides, so nothing else is
+    # loaded either.
+    ssh_config = SSHConfig()
+    ssh_config._config = rules
+    return Config(overrides=data, ssh_config=ssh_config, lazy=True)
+
+
+def _connection_spec(cxn, memo=None):
+    # 'memo' maps config ids to specs, so a config shared by many connections
+    # is copied (and pickled) just once. Group members' configs are clones of
+    # one another, and usually still equal; those share one spec, too.
+    memo = {} if memo is None else memo
+    gateway = cxn.gateway
+    if isinstance(gateway, Connection):
+        gateway = _connection_spec(gateway, memo)
+    key = id(cxn.config)
+    if key not in memo:
+        spec = _config_spec(cxn.config)
+        distinct = memo.setdefault(None, [])
+        memo[key] = next((x for x in distinct if x == spec), spec)
+        if memo[key] is spec:
+            distinct.append(spec)
+    return dict(
+        host=cxn.original_host,
+        user=cxn.user,
+        port=cxn.port,
+        config=memo[key],
+        gateway=gateway,
+        forward_agent=cxn.forward_agent,
+        connect_timeout=cxn.connect_timeout,
+        connect_kwargs=cxn.connect_kwargs,
+    )
+
+
+def _connection_from_spec(spec, memo=None):
+    # Likewise, specs sharing a config (still shared after unpickling) yield
+    # connections with clones of one Config, as in Group.__init__.
+    memo = {} if memo is None else memo
+    key = id(spec["config"])
+    if key not in memo:
+        memo[key] = _config_from_spec(spec["config"])
+    spec = dict(spec, config=memo[key].clone())
+    if isinstance(spec["gateway"], dict):
+        spec["gateway"] = _connection_from_spec(spec["gateway"], memo)
+    # Already resolved (i.e. merged with configured & SSH config key files)
+    # by the original connection; resolving them again would duplicate them.
+    connect_kwargs = spec.pop("connect_kwargs")
+    cxn = Connection(**spec)
+    cxn.connect_kwargs = connect_kwargs
+    return cxn
+
+
+def _pack(value):
+    """
+    Make a per-host return value or exception safe to send between processes.
+
+    Anything referencing a `.Connection` (which holds live sockets & threads)
+    is reduced to plain data, to be rebuilt around the parent process' own
+    `.Connection` by `_unpack`.
+    """
+    if isinstance(value, Result):
+        data = {
+            x: getattr(value, x) for x in _result_fields if hasattr(value, x)
+        }
+        return _Packed("result", data)
+    if isinstance(value, TransferResult):
+        data = {}
+        for name in ("local", "orig_local", "remote", "orig_remote"):
+            path = getattr(value, name)
+            # File-like objects only exist in the worker process anyhow.
+            is_path = path is None or isinstance(path, string_types)
+            data[name] = path if is_path else None
+        return _Packed("transfer", data)
+    if isinstance(value, Failure):
+        attrs = dict(value.__dict__, result=_pack(value.result))
+        return _Packed("failure", (type(value), attrs))
+    if isinstance(value, BaseException):
+        try:
+            pickle.loads(pickle.dumps(value))
+        except Exception:
+            return Exception("{}: {}".format(type(value).__name__, value))
+    return value
+
+
+def _unpack(value, cxn):
+    if not isinstance(value, _Packed):
+        return value
+    if value.kind == "result":
+        return Result(connection=cxn, **value.data)
+    if value.kind == "transfer":
+        return TransferResult(connection=cxn, **value.data)
+    # Failures generally can't be re-instantiated without their result, so
+    # skip __init__ entirely & restore their attributes directly.
+    type_, attrs = value.data
+    exception = type_.__new__(type_)
+    exception.__dict__.update(attrs)
+    exception.result = _unpack(attrs["result"], cxn)
+    return exception
+
+
+def process_worker(pipe, specs, config_spec):
+    memo = {}
+    cxns = [_connection_from_spec(x, memo) for x in specs]
+    group = ThreadingGroup.from_connections(cxns)
+    group.config = _config_from_spec(config_spec)
+    try:
+        while True:
+            try:
+                job = pipe.recv()
+            except EOFError:
+                return
+            if job is None:
+                return
+            method, args, kwargs, indices = job
+            subset = [cxns[x] for x in indices]
+            # Batching etc is the parent's business; just execute.
+            results = group._execute(method, subset, args, kwargs)
+            pipe.send([_pack(results[cxn]) for cxn in subset])
+    finally:
+        for cxn in cxns:
+            cxn.close()
+
+
+class ProcessGroup(Group):
+    """
+    Subclass of `.Group` which shards its connections across processes.
+
+    Paramiko's key exchange, encryption and MACs are CPU bound and hold the
+    GIL, so a `.ThreadingGroup` tops out at one core's worth of handshakes and
+    bulk data. This class instead splits its connections across a number of
+    worker processes, each of which operates on its share using a
+    `.ThreadingGroup` (so the ``group.*`` settings, including
+    ``group.concurrency``, apply within each worker.) Workers are started on
+    first use and keep their connections open between calls, until `close`.
+
+    Since connections, arguments and results must cross process boundaries:
+
+    - member connections are re-created in the workers from their host,
+      user, port, gateway, connect settings and (a snapshot of) their
+      configuration - all of which, including ``connect_kwargs``, must be
+      picklable;
+    - arguments to `run` and friends must also be picklable (so e.g. explicit
+      ``out_stream`` objects or file-like objects for `get` won't work);
+    - results and exceptions are rebuilt in this process, referencing this
+      group's own `.Connection` objects. Exceptions which can't be pickled
+      are replaced by a plain `Exception` with the same message.
+
+    For the same reason, `map` is not supported (it raises `TypeError`.)
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, *hosts, **kwargs):
+        """
+        Create a group of connections, as with `.Group.__init__`.
+
+        :param int processes:
+            Number of worker processes to use (never more than the number of
+            connections.) Default: the ``group.processes`` setting, itself
+            defaulting to ``None``, meaning the number of CPUs on this system.
+
+        .. versionadded:: 2.1
+        """
+        self._processes = kwargs.pop("processes", None)
+        self._shards = None
+        self._sharded = None
+        super(ProcessGroup, self).__init__(*hosts, **kwargs)
+
+    @property
+    def processes(self):
+        """
+        The effective number of worker processes; see `__init__`.
+
+        .. versionadded:: 2.1
+        """
+        processes = self._processes
+        if processes is None:
+            processes = self.config.group.processes
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        return max(1, min(processes, len(self)))
+
+    def _start(self):
+        # Re-shard if membership changed since the workers were started.
+        if self._shards is not None:
+            unchanged = self._sharded == list(self)
+            if unchanged and len(self._shards) == self.processes:
+                return
+            self._stop()
+        self._sharded = list(self)
+        count = self.processes
+        config_spec = _config_spec(self.config)
+        memo = {id(self.config): config_spec}
+        self._shards = []
+        for index in range(count):
+            cxns = self[index::count]
+            pipe, child_pipe = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=process_worker,
+                args=(
+                    child_pipe,
+                    [_connection_spec(x, memo) for x in cxns],
+                    config_spec,
+                ),
+            )
+            process.daemon = True
+            process.start()
+            child_pipe.close()
+            self._shards.append((cxns, pipe, process))
+
+    def _stop(self):
+        shards, self._shards = self._shards or [], None
+        for _, pipe, _ in shards:
+            try:
+                pipe.send(None)
+            except _pipe_errors:
+                pass
+            pipe.close()
+        for _, _, process in shards:
+            process.join()
+
+    def _execute(self, method, cxns, args, kwargs, retry=None):
+        results = GroupResult()
+        if not cxns:
+            return results
+        if retry is not None:
+            # Policies can't cross into the workers, so open connections
+            # first (which costs nothing extra: workers keep them open
+            # between calls anyway), then do the rest as usual.
+            opened = []
+            pairs = self._retry_rounds(
+                retry,
+                lambda *a: self._execute(*a).items(),
+                "open",
+                cxns,
+                (),
+                {},
+            )
+            for cxn, value in pairs:
+                if isinstance(value, BaseException):
+                    results[cxn] = value
+                else:
+                    opened.append(cxn)
+            results.update(self._execute(method, opened, args, kwargs))
+            return results
+        self._start()
+        wanted = set(map(id, cxns))
+        # Hand out all the work before waiting on any of it.
+        work = []
+        for cxns_, pipe, process in self._shards:
+            indices = [i for i, x in enumerate(cxns_) if id(x) in wanted]
+            if not indices:
+                continue
+            try:
+                pipe.send((method, args, kwargs, indices))
+            except _pipe_errors:
+                pipe = None
+            work.append(([cxns_[x] for x in indices], pipe, process))
+        for subset, pipe, process in work:
+            try:
+                if pipe is None:
+                    raise EOFError
+                values = pipe.recv()
+            except _pipe_errors:
+                process.join()
+                err = "Worker process died (exit code {}) during {}()!"
+                error = RuntimeError(err.format(process.exitcode, method))
+                values = [error] * len(subset)
+            for cxn, value in zip(subset, values):
+                results[cxn] = _unpack(value, cxn)
+        return results
+
+    def _map(self, fn, cxns, items, per_host_concurrency, attempts):
+        # Workers would need to call 'fn', whose results (and side effects)
+        # are meant for this process; it can't usefully cross over.
+        err = "ProcessGroup doesn't support map(), as fn can't cross into its worker processes; use a ThreadingGroup instead."  # noqa
+        raise TypeError(err)
+
+    def close(self):
+        """
+        Close all member connections and shut down the worker processes.
+
+        .. versionadded:: 2.1
+        """
+        try:
+            if self._shards is None:
+                return SerialGroup.from_connections(self).close()
+            return super(ProcessGroup, self).close()
+        finally:
+            self._stop()
+
+
+class HostSpec(object):
+    """
+    A lightweight description of a host, to be turned into a `.Connection`.
+
+    Holds only what `.Connection` needs to be created later on - its
+    ``host``, ``user``, ``port`` and ``gateway`` arguments, plus a dict of
+    any other keyword arguments for it (``overrides``, e.g.
+    ``connect_timeout`` or ``connect_kwargs``) - in a ``__slots__`` object
+    costing a small fraction of the memory of a `.Connection` (which, being
+    a full `~invoke.context.Context`, carries its own configuration, SSH
+    client and so forth from the moment it's created.) This makes specs
+    suitable for holding very large inventories; see `.LazyGroup`.
+
+    ``host`` may use the same ``user@host:port`` shorthand as `.Connection`.
+    Unlike with `.Connection`, though, absent users and ports remain
+    ``None`` until `materialize` time, when configuration and SSH config
+    fill them in.
+
+    Specs compare equal (and hash alike) when their host, user and port
+    (as given) are equal.
+
+    .. versionadded:: 2.1
+    """
+
+    __slots__ = ("host", "user", "port", "gateway", "overrides")
+
+    def __init__(
+        self, host, user=None, port=None, gateway=None, overrides=None
+    ):
+        shorthand = derive_shorthand(host)
+        err = "You supplied the {} via both shorthand and kwarg! Please pick one."  # noqa
+        if shorthand["user"] is not None:
+            if user is not None:
+                raise ValueError(err.format("user"))
+            user = shorthand["user"]
+        if shorthand["port"] is not None:
+            if port is not None:
+                raise ValueError(err.format("port"))
+            port = shorthand["port"]
+        self.host = shorthand["host"]
+        self.user = user
+        self.port = port
+        #: Like `.Connection`'s ``gateway``; may also be another `.HostSpec`.
+        self.gateway = gateway
+        self.overrides = overrides
+
+    def materialize(self, config=None):
+        """
+        Create a `.Connection` (not yet opened) from this spec.
+
+        :param config:
+            The `.Config` to give the connection (and any `.HostSpec`
+            gateway.) Default: ``None`` (a new `.Config` per call.)
+
+        :returns: A `.Connection`.
+        """
+        gateway = self.gateway
+        if isinstance(gateway, HostSpec):
+            gateway = gateway.materialize(config)
+        return Connection(
+            self.host,
+            user=self.user,
+            port=self.port,
+            gateway=gateway,
+            config=config,
+            **(self.overrides or {})
+        )
+
+    def _identity(self):
+        return (self.host, self.user, self.port)
+
+    def __eq__(self, other):
+        if not isinstance(other, HostSpec):
+            return False
+        return self._identity() == other._identity()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._identity())
+
+    def __repr__(self):
+        bits = [("host", self.host)]
+        for name in ("user", "port"):
+            if getattr(self, name) is not None:
+                bits.append((name, getattr(self, name)))
+        return "<HostSpec {}>".format(
+            " ".join("{}={}".format(*x) for x in bits)
+        )
+
+
+class _Materializer(object):
+    """
+    Stand-in for a `.Connection`, handed by lazy groups to their workers.
+
+    Calling any method materializes the real connection from its
+    `.HostSpec`, then closes and drops it once that method returns; `close`
+    closes whichever connections are currently materialized, if any. (Calls
+    may be concurrent, e.g. from `.Group.map` with ``per_host_concurrency``;
+    each gets its own connection.)
+
+    Given a (non-idempotent) `.RetryPolicy` as ``retry``, the connection is
+    opened - retrying as the policy allows - before calling the method.
+    """
+
+    __slots__ = ("spec", "config", "connections", "retry")
+
+    def __init__(self, spec, config, retry=None):
+        self.spec = spec
+        self.config = config
+        self.connections = []
+        self.retry = retry
+
+    # For output prefixes and the like; not necessarily what SSH config
+    # would make of them.
+    @property
+    def host(self):
+        return self.spec.host
+
+    @property
+    def user(self):
+        return self.spec.user or self.config.user
+
+    @property
+    def port(self):
+        return self.spec.port or self.config.port
+
+    def close(self):
+        for cxn in list(self.connections):
+            cxn.close()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            cxn = self.spec.materialize(self.config.clone())
+            self.connections.append(cxn)
+            try:
+                if self.retry is not None:
+                    _open(cxn, self.retry, self.spec)
+                return getattr(cxn, name)(*args, **kwargs)
+            finally:
+                self.connections.remove(cxn)
+                cxn.close()
+
+        return call
+
+
+class LazyGroup(Group):
+    """
+    A `.Group` of `HostSpecs <.HostSpec>`, materializing connections lazily.
+
+    Each member's `.Connection` is created only when a worker starts on that
+    member, and closed and released as soon as the worker is done with it,
+    so at any given time only as many connections exist as are actually in
+    use (e.g. at most ``concurrency`` of them, in a `.LazyThreadingGroup`.)
+    Together with `.HostSpec`'s small footprint, this allows holding, and
+    cheaply iterating over, inventories of many thousands of hosts.
+
+    All connections are created using clones of this group's `config` (as
+    in `.Group`), and are opened anew on every call - nothing persists
+    between calls, so `close` has nothing to do for specs.
+
+    Keys of resulting `GroupResults <.GroupResult>` are the member specs;
+    values are as usual (and so, e.g., `.runners.Result` objects still
+    reference their - by then closed - `.Connection`.)
+
+    As with `.Group`, use one of the concrete subclasses, `.LazySerialGroup`
+    or `.LazyThreadingGroup`.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, *hosts, **kwargs):
+        """
+        Create a group from host shorthand strings or `.HostSpec` objects.
+
+        Takes the same keyword arguments as the non-lazy equivalent.
+        """
+        super(LazyGroup, self).__init__(**kwargs)
+        self.extend(
+            x if isinstance(x, HostSpec) else HostSpec(x) for x in hosts
+        )
+
+    def _materializer(self, member, retry=None):
+        if isinstance(member, HostSpec):
+            return _Materializer(member, self.config, retry)
+        # Plain connections (or stand-ins already) are used as-is.
+        return member
+
+    def _execute(self, method, cxns, args, kwargs, retry=None):
+        stand_ins = [self._materializer(x, retry) for x in cxns]
+        values = super(LazyGroup, self)._execute(
+            method, stand_ins, args, kwargs, retry
+        )
+        results = GroupResult()
+        for member, stand_in in zip(cxns, stand_ins):
+            results[member] = values[stand_in]
+        return results
+
+    def _execute_iter(self, method, cxns, args, kwargs, retry=None):
+        stand_ins = [self._materializer(x, retry) for x in cxns]
+        members = {id(y): x for x, y in zip(cxns, stand_ins)}
+        pairs = super(LazyGroup, self)._execute_iter(
+            method, stand_ins, args, kwargs, retry
+        )
+        for stand_in, value in pairs:
+            yield members[id(stand_in)], value
+
+    def _map(self, fn, cxns, items, per_host_concurrency, attempts):
+        # 'fn' gets stand-ins, whose every method call materializes (and then
+        # releases) a connection.
+        stand_ins = [self._materializer(x) for x in cxns]
+        return super(LazyGroup, self)._map(
+            fn, stand_ins, items, per_host_concurrency, attempts
+        )
+
+    def close(self):
+        """
+        Close any plain `.Connection` members; specs need no closing.
+
+        .. versionadded:: 2.1
+        """
+        cxns = [x for x in self if not isinstance(x, HostSpec)]
+        results = GroupResult()
+        for member in self:
+            if isinstance(member, HostSpec):
+                results[member] = None
+        results.update(self._execute("close", cxns, (), {}))
+        if any(isinstance(x, BaseException) for x in results.values()):
             raise GroupException(results)
         return results
 
 
+class LazySerialGroup(LazyGroup, SerialGroup):
+    """
+    `.LazyGroup` executing serially, as with `.SerialGroup`.
+
+    .. versionadded:: 2.1
+    """
+
+    pass
+
+
+class LazyThreadingGroup(LazyGroup, ThreadingGroup):
+    """
+    `.LazyGroup` executing concurrently, as with `.ThreadingGroup`.
+
+    .. versionadded:: 2.1
+    """
+
+    pass
+
+
+class Skipped(object):
+    """
+    `.GroupResult` value for a connection which was deliberately not used.
+
+    Occurs when rolling execution (see `.Group.__init__`) stopped before
+    reaching the connection; ``reason`` says why.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, reason):
+        self.reason = reason
+
+    def __repr__(self):
+        return "<Skipped: {}>".format(self.reason)
+
+
+#: One distinct outcome among the values of a `.GroupResult`; see
+#: `.GroupResult.grouped`.
+Outcome = namedtuple("Outcome", "exited stdout stderr error")
+
+def _outcome_key(value):
+    if isinstance(value, Skipped):
+        return ("skipped", value.reason)
+    error, result = None, value
+    if isinstance(value, Failure):
+        error, result = type(value), value.result
+    elif isinstance(value, BaseException):
+        return ("error", type(value), str(value))
+    if isinstance(result, Result):
+        return ("result", error, result.digest)
+    # Eg transfer results, or close()'s Nones: no outcome beyond success.
+    return ("other", error)
+
+
+def _outcome(value):
+    if isinstance(value, Skipped):
+        return Outcome(None, None, None, "Skipped: {}".format(value.reason))
+    error, result = None, value
+    if isinstance(value, Failure):
+        error, result = type(value).__name__, value.result
+    elif isinstance(value, BaseException):
+        error = "{}: {}".format(type(value).__name__, value)
+        return Outcome(None, None, None, error)
+    if isinstance(result, Result):
+        return Outcome(result.exited, result.stdout, result.stderr, error)
+    return Outcome(None, None, None, error)
+
+
 class GroupResult(dict):
     """
     Collection of results and/or exceptions arising from `.Group` methods.
@@ -229,6 +1789,9 @@ class GroupResult(dict):
       - Of note, these attributes allow high level logic, e.g. ``if
         mygroup.run('command').failed`` and so forth.
 
+    - Connections which were never operated on (see `.Skipped`) appear in
+      neither of those, but in `.skipped`.
+
     .. versionadded:: 2.0
     """
 
@@ -236,16 +1799,19 @@ class GroupResult(dict):
         super(dict, self).__init__(*args, **kwargs)
         self._successes = {}
         self._failures = {}
+        self._skips = {}
 
     def _bifurcate(self):
         # Short-circuit to avoid reprocessing every access.
-        if self._successes or self._failures:
+        if self._successes or self._failures or self._skips:
             return
         # TODO: if we ever expect .succeeded/.failed to be useful before a
         # GroupResult is fully initialized, this needs to become smarter.
         for key, value in self.items():
             if isinstance(value, BaseException):
                 self._failures[key] = value
+            elif isinstance(value, Skipped):
+                self._skips[key] = value
             else:
                 self._successes[key] = value
 
@@ -268,3 +1834,244 @@ class GroupResult(dict):
         """
         self._bifurcate()
         return self._failures
+
+    def grouped(self):
+        """
+        Group connections by the distinct outcomes they had.
+
+        Answers "which hosts disagree?" after running the same thing across
+        many hosts. Outcomes are told apart by exit code, stdout and stderr
+        (via `.runners.Result.digest`, so outputs needn't be compared - or
+        even decoded - host by host), and, for failures, the exception type;
+        exceptions not carrying a result are told apart by type and message,
+        and `.Skipped` connections by their reason.
+
+        Since identical outputs are already stored only once (see
+        `.runners.Result`), each distinct outcome's output exists once in
+        memory however many hosts share it.
+
+        :returns:
+            An `~collections.OrderedDict` mapping `.Outcome` named tuples of
+            ``(exited, stdout, stderr, error)`` to sets of `.Connection`
+            objects, largest set first. ``error`` is ``None`` for successes,
+            otherwise a short string describing the exception (or skip);
+            fields which don't apply are ``None``.
+
+        .. versionadded:: 2.1
+        """
+        groups = {}
+        for cxn, value in self.items():
+            key = _outcome_key(value)
+            if key not in groups:
+                groups[key] = (_outcome(value), set())
+            groups[key][1].add(cxn)
+        ranked = sorted(groups.values(), key=lambda x: -len(x[1]))
+        return OrderedDict(ranked)
+
+    @property
+    def skipped(self):
+        """
+        A sub-dict containing only `.Skipped` connections.
+
+        .. versionadded:: 2.1
+        """
+        self._bifurcate()
+        return self._skips
+
+    def to_columns(self):
+        """
+        Summarize this result as compact, array-backed `.ResultColumns`.
+
+        Handy for fleet-wide statistics (exit code histograms, latency
+        percentiles, slowest hosts and so on) over very large groups, as
+        well as for exporting such summaries.
+
+        .. versionadded:: 2.1
+        """
+        return ResultColumns(self)
+
+
+def _failure_name(value):
+    if isinstance(value, Skipped):
+        return "Skipped"
+    if isinstance(value, BaseException):
+        return type(value).__name__
+    return None
+
+
+class ResultColumns(object):
+    """
+    Column-oriented summary of a `.GroupResult`; see `.GroupResult.to_columns`.
+
+    Holds one row per connection, in the result's order, as parallel
+    `array.array` columns - a few bytes per row, instead of a handful of
+    Python objects:
+
+    - ``host``: the row's index into `connections`;
+    - ``exited``: the command's exit code;
+    - ``duration``: the command's duration in seconds (see
+      `.runners.Result`);
+    - ``stdout_length``: the size of the command's stdout, in bytes;
+    - ``failure``: the row's index into `failure_types`, whose first entry,
+      ``None``, means no failure.
+
+    Commands which failed (e.g. with `~invoke.exceptions.UnexpectedExit`)
+    still have their result's exit code, duration and stdout size recorded.
+    Where there's no such thing to record - connection errors, skipped
+    connections, file transfers, etc - integer columns hold ``-1`` and
+    ``duration`` holds ``NaN``; the helper methods below ignore these.
+
+    .. versionadded:: 2.1
+    """
+
+    #: Names of the available columns, in export order.
+    columns = ("host", "exited", "duration", "stdout_length", "failure")
+
+    def __init__(self, result):
+        #: The `.GroupResult`'s keys (typically `.Connection` objects.)
+        self.connections = list(result)
+        #: Names of the exception types found, preceded by ``None``.
+        self.failure_types = [None]
+        self.host = array("l", range(len(self.connections)))
+        self.exited = array("l")
+        self.duration = array("d")
+        self.stdout_length = array("l")
+        self.failure = array("l")
+        codes = {None: 0}
+        for value in result.values():
+            name = _failure_name(value)
+            if name not in codes:
+                codes[name] = len(self.failure_types)
+                self.failure_types.append(name)
+            self.failure.append(codes[name])
+            if isinstance(value, Failure):
+                value = value.result
+            if isinstance(value, Result):
+                exited, duration = value.exited, value.duration
+                self.exited.append(-1 if exited is None else exited)
+                if duration is None:
+                    duration = float("nan")
+                self.duration.append(duration)
+                self.stdout_length.append(value.stdout_size)
+            else:
+                self.exited.append(-1)
+                self.duration.append(float("nan"))
+                self.stdout_length.append(-1)
+
+    def __len__(self):
+        return len(self.connections)
+
+    def values(self, column):
+        """
+        Return the present (i.e. not ``-1``/``NaN``) values of ``column``.
+
+        Values of the ``failure`` column are returned as names, omitting
+        successes.
+        """
+        if column == "failure":
+            return [self.failure_types[x] for x in self.failure if x]
+        if column == "duration":
+            return [x for x in self.duration if not math.isnan(x)]
+        return [x for x in getattr(self, column) if x != -1]
+
+    def percentile(self, column, percent):
+        """
+        Return the ``percent``-th percentile of a numeric ``column``.
+
+        Interpolates linearly between the nearest values, e.g.
+        ``percentile("duration", 50)`` is the median duration. Returns
+        ``None`` if the column has no values.
+        """
+        values = sorted(self.values(column))
+        if not values:
+            return None
+        rank = (len(values) - 1) * percent / 100.0
+        low = int(math.floor(rank))
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (rank - low)
+
+    def histogram(self, column, bins=None):
+        """
+        Count the values of ``column``.
+
+        :param int bins:
+            When ``None`` (the default), count each distinct value, e.g.
+            ``histogram("exited")`` or ``histogram("failure")``. Otherwise,
+            split the range of a numeric column's values into this many
+            equally wide bins, and count the values within each.
+
+        :returns:
+            An `~collections.OrderedDict`, ordered by value, mapping values
+            (or, with ``bins``, ``(low, high)`` bin boundaries) to counts.
+        """
+        values = self.values(column)
+        if bins is None:
+            return OrderedDict(sorted(Counter(values).items()))
+        counts = OrderedDict()
+        if not values:
+            return counts
+        low, high = min(values), max(values)
+        width = (high - low) / float(bins)
+        for index in range(bins):
+            counts[(low + index * width, low + (index + 1) * width)] = 0
+        edges = list(counts)
+        for value in values:
+            # Values equal to the maximum belong in the last bin.
+            index = int((value - low) / width) if width else 0
+            counts[edges[min(index, bins - 1)]] += 1
+        return counts
+
+    def slowest(self, count=10):
+        """
+        Return the ``count`` slowest connections, slowest first.
+
+        :returns: A list of ``(connection, duration)`` two-tuples.
+        """
+        rows = [
+            (x, y)
+            for x, y in zip(self.connections, self.duration)
+            if not math.isnan(y)
+        ]
+        return sorted(rows, key=lambda x: -x[1])[:count]
+
+    def rows(self):
+        """
+        Yield each row as a dict, suitable for export.
+
+        ``host`` is the connection's (or other key's) ``host`` attribute,
+        ``failure`` the exception type's name; absent values are ``None``.
+        """
+        for index, key in enumerate(self.connections):
+            duration = self.duration[index]
+            row = OrderedDict()
+            row["host"] = getattr(key, "host", key)
+            row["exited"] = self.exited[index]
+            row["duration"] = None if math.isnan(duration) else duration
+            row["stdout_length"] = self.stdout_length[index]
+            row["failure"] = self.failure_types[self.failure[index]]
+            for name in ("exited", "stdout_length"):
+                if row[name] == -1:
+                    row[name] = None
+            yield row
+
+    def to_csv(self, stream):
+        """
+        Write all `rows` to file-like ``stream`` as CSV, with a header.
+
+        Absent values are written as empty fields.
+        """
+        writer = csv.writer(stream)
+        writer.writerow(self.columns)
+        for row in self.rows():
+            writer.writerow(
+                ["" if row[x] is None else row[x] for x in self.columns]
+            )
+
+    def to_jsonl(self, stream):
+        """
+        Write all `rows` to file-like ``stream`` as JSON lines.
+
+        That is, one JSON object per line; absent values are ``null``.
+        """
+        for row in self.rows():
+            stream.write(json.dumps(row) + "\n")
@@ -0,0 +1,173 @@
+"""
+Persistent caching of local files' content digests.
+
+Most users won't touch this directly; see the ``transfer.manifest`` setting
+in :ref:`default-values`.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import time
+from threading import Event, Lock
+
+
+def file_digest(path, size=1 << 20):
+    """
+    Return the SHA-256 hex digest of the file at ``path``.
+
+    Reads are large, so that `hashlib` can release the GIL while hashing
+    them; hashing thus proceeds in parallel with other threads' work.
+
+    .. versionadded:: 2.1
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    mtime_ns = getattr(st, "st_mtime_ns", None)
+    if mtime_ns is None:  # Python 2
+        mtime_ns = int(st.st_mtime * 1e9)
+    return [st.st_ino, st.st_size, mtime_ns]
+
+
+class Manifest(object):
+    """
+    On-disk cache of local files' digests, so unchanged files aren't rehashed.
+
+    Each file's digest is recorded alongside its inode number, size and
+    modification time (in nanoseconds); it's reused for as long as those
+    are unchanged, and the file is only hashed again once they aren't.
+
+    The cache is a file of JSON lines, each recording one file. New digests
+    are appended (and flushed) as they're computed, so an interrupted run
+    loses nothing and recording a digest never means rewriting the whole
+    file; superseded lines, and those for files which no longer exist, are
+    dropped whenever they've come to outnumber current ones, on load.
+
+    Instances are safe to share between threads, and a file wanted by
+    several threads at once is only hashed by one of them. Separate
+    processes may also share the same cache file, with the caveat that
+    (between compactions) it may gain duplicate lines.
+
+    .. versionadded:: 2.1
+    """
+
+    #: Files modified less than this many seconds ago aren't cached: they
+    #: could yet change again without their modification time doing so, on
+    #: filesystems with coarse timestamps.
+    racy = 2
+
+    def __init__(self, path):
+        """
+        :param str path:
+            Path to the cache file, which is created if necessary (though
+            its directory must exist.) ``~`` is expanded.
+        """
+        self.path = os.path.expanduser(path)
+        self._entries = {}
+        self._pending = {}
+        self._lock = Lock()
+        self._load()
+
+    def _load(self):
+        lines = 0
+        try:
+            with open(self.path) as fd:
+                for line in fd:
+                    lines += 1
+                    try:
+                        path, inode, size, mtime_ns, digest = json.loads(line)
+                    except ValueError:  # Partial line from a crashed writer
+                        continue
+                    self._entries[path] = [inode, size, mtime_ns, digest]
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+        if lines > 2 * len(self._entries) + 100:
+            self.compact()
+
+    def compact(self):
+        """
+        Rewrite the cache file, keeping only entries for extant files.
+        """
+        with self._lock:
+            for path in list(self._entries):
+                if not os.path.isfile(path):
+                    del self._entries[path]
+            temp = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(temp, "w") as fd:
+                for path, entry in self._entries.items():
+                    fd.write(json.dumps([path] + entry) + "\n")
+            os.rename(temp, self.path)
+
+    def digest(self, path):
+        """
+        Return the SHA-256 hex digest of the file at ``path``.
+
+        Uses the cached digest if the file's inode, size and modification
+        time are unchanged since it was recorded; otherwise, the file is
+        hashed and the cache updated.
+        """
+        path = os.path.abspath(path)
+        key = _stat_key(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[:3] == key:
+                return entry[3]
+            pending = self._pending.get(path)
+            if pending is None:
+                self._pending[path] = Event()
+        if pending is not None:
+            # Another thread is hashing it; wait, then look again.
+            pending.wait()
+            return self.digest(path)
+        try:
+            return self._record(path, key)
+        finally:
+            with self._lock:
+                self._pending.pop(path).set()
+
+    def _record(self, path, key):
+        digest = file_digest(path)
+        # Don't cache digests of recently modified files (see 'racy'), nor
+        # of files which changed while being hashed.
+        recent = key[2] > (time.time() - self.racy) * 1e9
+        if recent or _stat_key(path) != key:
+            return digest
+        entry = key + [digest]
+        with self._lock:
+            self._entries[path] = entry
+            with open(self.path, "a") as fd:
+                fd.write(json.dumps([path] + entry) + "\n")
+        return digest
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_manifests = {}
+_manifests_lock = Lock()
+
+
+def manifest(path):
+    """
+    Return the (process-wide) `Manifest` for cache file ``path``.
+
+    Everything sharing a cache file thus shares one in-memory copy of it,
+    e.g. all the connections of a `.ThreadingGroup`, which then hash any
+    given file only once between them.
+
+    .. versionadded:: 2.1
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    with _manifests_lock:
+        if path not in _manifests:
+            _manifests[path] = Manifest(path)
+        return _manifests[path]
@@ -0,0 +1,183 @@
+"""
+Output handling for concurrent, multi-host execution.
+
+Most users won't touch this directly; see the ``group.output`` settings in
+:ref:`default-values` and `.ThreadingGroup`.
+"""
+
+import sys
+import time
+from collections import deque
+from threading import Event
+
+from invoke.util import ExceptionHandlingThread
+
+
+class OutputMultiplexer(ExceptionHandlingThread):
+    """
+    Single writer thread serializing output from many concurrent sources.
+
+    Sources (typically one per host; see `register`) hand their output to
+    this object via file-like streams whose ``write`` is a bare append onto a
+    `collections.deque` - atomic, so producers never contend on a lock, and
+    never block on the real output streams. This thread alone drains that
+    queue and writes to the real streams, emitting only whole lines, each
+    carrying its source's prefix, so output from different hosts never
+    interleaves mid-line.
+
+    With ``buffer=True``, a source's output is held back entirely until it is
+    `closed <.MultiplexedSource.close>`, then written as one contiguous block.
+
+    Use as a thread: `start` it, then `close` it when all sources are done
+    (which drains anything outstanding before the thread exits.)
+
+    .. versionadded:: 2.1
+    """
+
+    #: Seconds to sleep when there's nothing to write.
+    sleep = 0.01
+
+    def __init__(self, buffer=False, out_stream=None, err_stream=None):
+        """
+        :param bool buffer:
+            Whether to hold each source's output until it closes. Default:
+            ``False`` (output is written line by line as it arrives.)
+
+        :param out_stream:
+            Stream to write multiplexed stdout to. Default: ``sys.stdout`` (as
+            of write time.)
+
+        :param err_stream:
+            Stream to write multiplexed stderr to. Default: ``sys.stderr`` (as
+            of write time.)
+        """
+        super(OutputMultiplexer, self).__init__()
+        self.buffer = buffer
+        self.out_stream = out_stream
+        self.err_stream = err_stream
+        self.finished = Event()
+        self._queue = deque()
+        # Only ever touched by the writer thread; no locking needed.
+        self._partials = {}
+        self._held = {}
+
+    def register(self, prefix):
+        """
+        Create a new output source whose lines are prefixed with ``prefix``.
+
+        :returns: A `.MultiplexedSource`.
+        """
+        return MultiplexedSource(self, prefix)
+
+    def close(self):
+        """
+        Flush all outstanding output and wait for the writer thread to exit.
+        """
+        self.finished.set()
+        self.join()
+
+    def _stream(self, name):
+        if name == "err":
+            return self.err_stream or sys.stderr
+        return self.out_stream or sys.stdout
+
+    def _run(self):
+        while True:
+            # Grab the finished flag *before* draining so nothing appended
+            # after our final drain can be missed.
+            done = self.finished.is_set()
+            writes = self._drain()
+            self._write(writes)
+            if done:
+                break
+            if not writes:
+                time.sleep(self.sleep)
+        # Anything still partial/held belongs to sources never closed.
+        writes = []
+        sources = set(x[0] for x in self._partials) | set(self._held)
+        for source in sources:
+            writes.extend(self._finish(source))
+        self._write(writes)
+
+    def _drain(self):
+        writes = []
+        while True:
+            try:
+                source, name, data = self._queue.popleft()
+            except IndexError:
+                return writes
+            if name is None:
+                writes.extend(self._finish(source))
+                continue
+            key = (source, name)
+            lines = (self._partials.get(key, "") + data).split("\n")
+            self._partials[key] = lines.pop()
+            formatted = [(name, source.prefix + x + "\n") for x in lines]
+            if self.buffer:
+                self._held.setdefault(source, []).extend(formatted)
+            else:
+                writes.extend(formatted)
+
+    def _finish(self, source):
+        writes = self._held.pop(source, [])
+        for name in ("out", "err"):
+            partial = self._partials.pop((source, name), "")
+            if partial:
+                writes.append((name, source.prefix + partial + "\n"))
+        return writes
+
+    def _write(self, writes):
+        # Coalesce runs of same-stream lines into single write() calls.
+        touched = set()
+        chunk, current = [], None
+        for name, line in writes + [(None, None)]:
+            if name != current and chunk:
+                stream = self._stream(current)
+                stream.write("".join(chunk))
+                touched.add(stream)
+                chunk = []
+            current = name
+            if line is not None:
+                chunk.append(line)
+        for stream in touched:
+            stream.flush()
+
+
+class MultiplexedSource(object):
+    """
+    One producer of output for an `.OutputMultiplexer`.
+
+    Exposes ``out`` and ``err`` attributes, which are minimal write-only
+    file-like objects suitable for use as ``out_stream``/``err_stream`` when
+    calling `.Connection.run`.
+
+    .. versionadded:: 2.1
+    """
+
+    def __init__(self, multiplexer, prefix):
+        self.multiplexer = multiplexer
+        self.prefix = prefix
+        self.out = _Stream(self, "out")
+        self.err = _Stream(self, "err")
+
+    def close(self):
+        """
+        Signal that no more output will arrive from this source.
+
+        Any trailing partial lines (and, when buffering, all held output)
+        will then be written.
+        """
+        self.multiplexer._queue.append((self, None, None))
+
+
+class _Stream(object):
+    def __init__(self, source, name):
+        self.source = source
+        self.name = name
+
+    def write(self, data):
+        self.source.multiplexer._queue.append((self.source, self.name, data))
+
+    def flush(self):
+        # The multiplexer flushes the real streams itself.
+        pass
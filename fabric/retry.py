@@ -0,0 +1,165 @@
+"""
+Retrying of transient per-host failures within `.Group` operations.
+
+See `.RetryPolicy`, and the ``retry`` argument to `.Group.__init__`.
+"""
+
+import random
+import socket
+from threading import Lock
+
+from paramiko.ssh_exception import (
+    AuthenticationException,
+    BadHostKeyException,
+    NoValidConnectionsError,
+    SSHException,
+)
+
+
+class RetryPolicy(object):
+    """
+    How (and whether) a `.Group` retries connections which failed transiently.
+
+    Flaky networks mean that, across a large enough group, a few hosts will
+    always time out, refuse a connection or drop the SSH banner exchange,
+    only to work fine a moment later. Given a policy, a group retries such
+    hosts - and only those - after a backoff delay, instead of leaving the
+    whole operation to be rerun.
+
+    By default only *connecting* is retried, which is always safe: each
+    connection is opened (retrying as configured, after each backoff delay)
+    just before the operation itself is performed on it, once. Connections
+    are thus only opened as the group's usual execution strategy gets to
+    them, e.g. no more than ``concurrency`` at a time in a
+    `.ThreadingGroup`. Operations known to be safe to repeat may set
+    ``idempotent`` so that any retryable failure of the operation itself is
+    retried.
+
+    Such retries happen in rounds: the connections to retry are all retried
+    together, once the longest of their backoff delays has passed, and
+    subject to the group's usual execution strategy.
+
+    Policies also act as a simple *circuit breaker*: they count each host's
+    consecutive failed attempts (across operations, for as long as the
+    policy object lives) and stop retrying any host once that count reaches
+    ``trip_after``, until an attempt on it succeeds again.
+
+    .. versionadded:: 2.1
+    """
+
+    #: Exception types retried by default; see ``retry_on``.
+    retry_on = (
+        socket.timeout,
+        NoValidConnectionsError,
+        SSHException,
+        EOFError,
+    )
+
+    #: Exception types never retried, even when matching ``retry_on``: these
+    #: mean a retry would fail the same way.
+    never_retry = (AuthenticationException, BadHostKeyException)
+
+    def __init__(
+        self,
+        attempts=3,
+        backoff=1.0,
+        factor=2.0,
+        max_backoff=30.0,
+        jitter=0.1,
+        retry_on=None,
+        idempotent=False,
+        trip_after=5,
+    ):
+        """
+        :param int attempts:
+            Maximum number of attempts per host, including the first.
+            Default: ``3``.
+
+        :param float backoff:
+            Seconds to wait before the first retry. Default: ``1.0``.
+
+        :param float factor:
+            Multiplier applied to the delay for each subsequent retry.
+            Default: ``2.0``.
+
+        :param float max_backoff:
+            Upper limit on any one delay, in seconds. Default: ``30.0``.
+
+        :param float jitter:
+            Fraction by which each delay is randomly lengthened or
+            shortened, so that many clients don't retry in lockstep.
+            Default: ``0.1``.
+
+        :param tuple retry_on:
+            Exception types considered transient. Default: the
+            `retry_on` class attribute (socket timeouts, failures to
+            connect, SSH protocol errors such as an unreadable banner, and
+            unexpected EOFs), minus `never_retry`.
+
+        :param bool idempotent:
+            Whether operations themselves (not just connecting) may be
+            retried. Default: ``False``.
+
+        :param int trip_after:
+            Number of consecutive failed attempts after which a host is no
+            longer retried; ``None`` disables this. Default: ``5``.
+        """
+        self.attempts = max(attempts, 1)
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        if retry_on is not None:
+            self.retry_on = tuple(retry_on)
+        self.idempotent = idempotent
+        self.trip_after = trip_after
+        self._failures = {}
+        self._lock = Lock()
+
+    def retryable(self, exception):
+        """
+        Return whether ``exception`` represents a transient failure.
+        """
+        if isinstance(exception, self.never_retry):
+            return False
+        return isinstance(exception, self.retry_on)
+
+    def delay(self, retry):
+        """
+        Return the number of seconds to wait before retry number ``retry``.
+
+        Retries are numbered from ``1``.
+        """
+        delay = min(
+            self.backoff * self.factor ** (retry - 1), self.max_backoff
+        )
+        return max(delay * random.uniform(1 - self.jitter, 1 + self.jitter), 0)
+
+    def record(self, key, failed):
+        """
+        Record the outcome of an attempt on host ``key``.
+
+        ``key`` is typically a `.Connection` (or anything else hashable
+        identifying the host.)
+        """
+        with self._lock:
+            if failed:
+                self._failures[key] = self._failures.get(key, 0) + 1
+            else:
+                self._failures.pop(key, None)
+
+    def tripped(self, key):
+        """
+        Return whether host ``key`` has failed too often to be retried.
+        """
+        if self.trip_after is None:
+            return False
+        with self._lock:
+            return self._failures.get(key, 0) >= self.trip_after
+
+    def reset(self):
+        """
+        Forget all recorded failures, closing every tripped circuit.
+        """
+        with self._lock:
+            self._failures.clear()
@@ -1,4 +1,30 @@
+import fnmatch
+import hashlib
+import re
+import socket
+import threading
+import time
+import zlib
+from weakref import WeakValueDictionary
+
+try:
+    from invoke.vendor.six import PY3, binary_type, iteritems, text_type
+    from invoke.vendor.six.moves import shlex_quote
+except ImportError:
+    from six import PY3, binary_type, iteritems, text_type
+    from six.moves import shlex_quote
+
 from invoke import Runner, pty_size, Result as InvokeResult
+from invoke.exceptions import Failure
+
+from .exceptions import CommandTimedOut
+
+
+#: Env var name patterns accepted by a stock OpenSSH ``sshd_config``
+#: (``AcceptEnv LANG LC_*``); used by the ``"auto"`` `~Remote.run` env mode.
+DEFAULT_ACCEPT_ENV = ("LANG", "LC_*")
+
+_env_var_name = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
 
 
 class Remote(Runner):
@@ -15,21 +41,275 @@ class Remote(Runner):
     .. versionadded:: 2.0
     """
 
+    #: Number of bytes requested per read when ``binary=True``. Larger than
+    #: Invoke's default (text-oriented) chunk size, since raw payloads are
+    #: written straight through without any decoding or buffering.
+    binary_chunk_size = 32768
+
+    #: Number of bytes read from a ``stdin`` source (and handed to the
+    #: channel) at a time. Paramiko splits these into packets and blocks until
+    #: the remote window has room, so large chunks cost nothing extra.
+    stdin_chunk_size = 65536
+
+    _timer = None
+    _timed_out = False
+    _started = None
+
+    def run(self, command, **kwargs):
+        """
+        Execute ``command`` remotely, returning a `.Result`.
+
+        Accepts all of the keyword arguments of `invoke.runners.Runner.run`,
+        plus the following Fabric-specific ones (which, like Invoke's, default
+        to the values in the ``run`` config subtree):
+
+        :param bool binary:
+            When ``True``, the remote stdout is not decoded, captured or
+            handed to watchers; instead, raw bytes are written directly into
+            ``out_stream`` (which should therefore be a binary file-like
+            object; text streams exposing a ``.buffer``, such as
+            `sys.stdout`, have that buffer written to instead). The
+            resulting `.Result` will have an empty ``stdout``. Default:
+            ``False``.
+
+        :param timeout:
+            Number of seconds after which the command is considered hung. On
+            expiry the remote process is interrupted (when a PTY is in use)
+            and its channel closed, after which `.CommandTimedOut` is raised
+            (regardless of ``warn``), carrying whatever output was received.
+            Default: ``timeouts.command`` from config, i.e. ``None`` (no
+            timeout).
+
+        :param stdin:
+            Data to stream into the remote command's stdin, which is closed
+            (EOF is sent) once the data is exhausted. May be a `bytes` or
+            `str` object, a file-like object with a ``read`` method, or any
+            iterable yielding `bytes`/`str` chunks. Data is sent in large
+            chunks, blocking on the channel's flow-control window instead of
+            polling, and is never echoed. Mutually exclusive with
+            ``in_stream``. Default: ``None`` (local stdin is mirrored as
+            usual).
+
+        :param str env_mode:
+            How the ``env`` dict is transmitted to the remote end:
+
+            - ``"request"``: one SSH ``env`` request per variable, which the
+              server may silently ignore unless allowed by its ``AcceptEnv``.
+            - ``"inline"``: the command is prefixed with a shell ``export``
+              of the (safely quoted) variables, which needs no server
+              cooperation nor any extra requests, but does assume a POSIX
+              shell on the remote end.
+            - ``"auto"``: variables matching a stock OpenSSH ``AcceptEnv``
+              (`DEFAULT_ACCEPT_ENV`, i.e. ``LANG`` and ``LC_*``) are sent as
+              requests, everything else is inlined.
+
+            Default: ``"request"``.
+
+        :param bool compress_output:
+            Whether the resulting `.Result` should store its captured
+            stdout/stderr zlib-compressed (when that actually saves space),
+            decompressing on access. Useful when holding results from very
+            many hosts. Default: ``False``.
+
+        :raises: `.CommandTimedOut`, if ``timeout`` was exceeded.
+
+        .. versionadded:: 2.1
+        """
+        # Fabric-only options are consumed here, before Invoke's own option
+        # handling gets a look at them.
+        self.binary = self._remote_option("binary", kwargs)
+        self.stdin = self._remote_option("stdin", kwargs)
+        self.compress_output = self._remote_option("compress_output", kwargs)
+        self.env_mode = self._remote_option("env_mode", kwargs)
+        if self.env_mode not in ("request", "inline", "auto"):
+            err = "env_mode must be 'request', 'inline' or 'auto', not {!r}"
+            raise ValueError(err.format(self.env_mode))
+        if self.stdin is not None:
+            if kwargs.get("in_stream", None) is not None:
+                err = "You can't give both 'stdin' and 'in_stream'!"
+                raise ValueError(err)
+            # Any truthy value makes Invoke spin up its stdin thread, which
+            # then runs our handle_stdin() and never looks at it.
+            kwargs["in_stream"] = True
+        # NOTE: timeouts are handled by us, not Invoke (older versions of
+        # which lack the feature entirely), so that they can close the
+        # channel & result in a consistent exception type.
+        timeout = kwargs.pop("timeout", None)
+        if timeout is None:
+            timeout = self.context.config.timeouts.get("command", None)
+        #: Command timeout in effect for the current `run`, in seconds.
+        self.timeout = timeout
+        self._timer = None
+        self._timed_out = False
+        self._started = None
+        try:
+            result = super(Remote, self).run(command, **kwargs)
+        except Failure as e:
+            # Killing the channel typically yields an unexpected exit code;
+            # report the real reason instead.
+            if self.timed_out and not isinstance(e, CommandTimedOut):
+                raise CommandTimedOut(e.result, timeout=self.timeout)
+            raise
+        if self.timed_out:
+            raise CommandTimedOut(result, timeout=self.timeout)
+        return result
+
+    def _remote_option(self, key, kwargs):
+        # Same "runtime value unless None, else config" semantics used by
+        # Invoke for its own run() kwargs.
+        value = kwargs.pop(key, None)
+        return self.context.config.run[key] if value is None else value
+
     def start(self, command, shell, env):
         self.channel = self.context.create_session()
         if self.using_pty:
             rows, cols = pty_size()
             self.channel.get_pty(width=rows, height=cols)
-        # TODO: consider adding an option to conditionally turn this
-        # update_environment call into a command-string prefixing behavior
-        # instead (e.g. when one isn't able/willing to update remote server's
-        # AcceptEnv setting). OR: rely on higher-level generic command
-        # prefixing functionality, when implemented.
         # TODO: honor SendEnv from ssh_config
-        self.channel.update_environment(env)
-        # TODO: pass in timeout= here when invoke grows timeout functionality
-        # in Runner/Local.
+        requested, inline = self.split_env(env)
+        self.channel.update_environment(requested)
+        if inline:
+            command = "export {} && {}".format(
+                " ".join(
+                    "{}={}".format(key, shlex_quote(value))
+                    for key, value in sorted(iteritems(inline))
+                ),
+                command,
+            )
         self.channel.exec_command(command)
+        self._started = time.time()
+        self.start_timer(self.timeout)
+
+    def split_env(self, env):
+        """
+        Split ``env`` into variables to send as requests vs inline.
+
+        Behavior depends on `env_mode`; see `run`.
+
+        :returns:
+            A two-tuple of dicts, ``(requested, inline)``.
+
+        :raises:
+            `ValueError`, if a variable to be inlined doesn't have a valid
+            shell identifier as its name.
+
+        .. versionadded:: 2.1
+        """
+        if self.env_mode == "request":
+            return env, {}
+        requested, inline = {}, {}
+        for key, value in iteritems(env):
+            if self.env_mode == "auto" and any(
+                fnmatch.fnmatchcase(key, x) for x in DEFAULT_ACCEPT_ENV
+            ):
+                requested[key] = value
+                continue
+            if not _env_var_name.match(key):
+                err = "Can't inline env var with invalid name {!r}!"
+                raise ValueError(err.format(key))
+            inline[key] = value
+        return requested, inline
+
+    def start_timer(self, timeout):
+        """
+        Start a timer which will `kill` the command after ``timeout`` seconds.
+
+        Does nothing if ``timeout`` is ``None`` or a timer is already running
+        (newer Invoke versions call this themselves, after `start`.)
+
+        .. versionadded:: 2.1
+        """
+        if timeout is None or self._timer is not None:
+            return
+        self._timer = threading.Timer(timeout, self._time_out)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop_timer(self):
+        """
+        Cancel the timeout timer, if one is running.
+
+        .. versionadded:: 2.1
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def _time_out(self):
+        self._timed_out = True
+        self.kill()
+
+    @property
+    def timed_out(self):
+        """
+        Whether the most recent command was killed due to its timeout.
+
+        .. versionadded:: 2.1
+        """
+        return self._timed_out
+
+    def kill(self):
+        """
+        Forcibly terminate the remote command by closing its channel.
+
+        When a PTY is in use, an interrupt (ETX) is sent beforehand so the
+        remote foreground process gets a SIGINT; otherwise, closing the channel
+        (prompting sshd to hang up on the command) is the best we can do.
+
+        .. versionadded:: 2.1
+        """
+        if self.using_pty:
+            self.channel.send(u"\x03")
+        self.channel.close()
+
+    def handle_stdout(self, buffer_, hide, output):
+        if not self.binary:
+            return super(Remote, self).handle_stdout(buffer_, hide, output)
+        # Raw mode: no decoding, no capture buffer, no watchers - just copy
+        # channel bytes into the (binary) sink as they arrive.
+        sink = getattr(output, "buffer", output)
+        while True:
+            data = self.read_proc_stdout(self.binary_chunk_size)
+            if not data:
+                break
+            if not hide:
+                sink.write(data)
+        if not hide:
+            sink.flush()
+
+    def handle_stdin(self, input_, output, echo):
+        if self.stdin is None:
+            return super(Remote, self).handle_stdin(input_, output, echo)
+        try:
+            for chunk in self._stdin_chunks(self.stdin):
+                # NOTE: sendall() waits on the channel's window condition
+                # variable when the remote end isn't keeping up, so there's no
+                # need for Invoke's sleep/poll loop here.
+                self._write_proc_stdin(chunk)
+        except (socket.error, EOFError):
+            # Remote end went away mid-stream (e.g. command exited early, or
+            # we timed out); the exit status tells the rest of the story.
+            if not self.process_is_finished:
+                raise
+            return
+        self.channel.shutdown_write()
+
+    def _stdin_chunks(self, source):
+        size = self.stdin_chunk_size
+        if isinstance(source, (binary_type, text_type)):
+            if isinstance(source, text_type):
+                source = source.encode(self.encoding)
+            for start in range(0, len(source), size):
+                yield source[start:start + size]
+            return
+        if hasattr(source, "read") and callable(source.read):
+            chunks = iter(lambda: source.read(size), source.read(0))
+        else:
+            chunks = source
+        for chunk in chunks:
+            if isinstance(chunk, text_type):
+                chunk = chunk.encode(self.encoding)
+            if chunk:
+                yield chunk
 
     def read_proc_stdout(self, num_bytes):
         return self.channel.recv(num_bytes)
@@ -40,6 +320,12 @@ class Remote(Runner):
     def _write_proc_stdin(self, data):
         return self.channel.sendall(data)
 
+    def close_proc_stdin(self):
+        # Called by newer Invokes once local stdin hits EOF - as it does
+        # straight away in e.g. `.ProcessGroup` workers, whose stdin is
+        # /dev/null.
+        return self.channel.shutdown_write()
+
     @property
     def process_is_finished(self):
         return self.channel.exit_status_ready()
@@ -65,14 +351,17 @@ class Remote(Runner):
 
     def generate_result(self, **kwargs):
         kwargs["connection"] = self.context
+        kwargs["compress"] = self.compress_output
+        if self._started is not None:
+            kwargs["duration"] = time.time() - self._started
         return Result(**kwargs)
 
     def stop(self):
+        self.stop_timer()
         if hasattr(self, "channel"):
             self.channel.close()
 
     # TODO: shit that is in fab 1 run() but could apply to invoke.Local too:
-    # * command timeout control
     # * see rest of stuff in _run_command/_execute in operations.py...there is
     # a bunch that applies generally like optional exit codes, etc
 
@@ -100,13 +389,123 @@ class Result(InvokeResult):
     which is simply a reference to the `.Connection` whose method yielded this
     result.
 
+    Unlike its superclass, captured ``stdout`` and ``stderr`` are interned:
+    identical outputs - e.g. the same command run across a large `.Group` -
+    are stored only once, no matter how many results refer to them. With
+    ``compress``, they are also kept zlib-compressed (where that saves
+    space), and decompressed on each access. Both remain readable and
+    assignable exactly as in `invoke.runners.Result`.
+
+    Results of commands actually executed also record their ``duration``:
+    the number of seconds from the command's start to its completion (or
+    ``None`` when unknown, e.g. for dry runs.)
+
     .. versionadded:: 2.0
+    .. versionchanged:: 2.1
+        Added compact/interned storage of ``stdout`` and ``stderr``, and
+        ``duration``.
     """
 
     def __init__(self, **kwargs):
         connection = kwargs.pop("connection")
+        self.duration = kwargs.pop("duration", None)
+        # Must be set before the superclass assigns stdout/stderr.
+        self.compress = kwargs.pop("compress", False)
         super(Result, self).__init__(**kwargs)
         self.connection = connection
 
+    @property
+    def stdout(self):
+        return self._stdout.text
+
+    @stdout.setter
+    def stdout(self, value):
+        self._stdout = _intern_output(value, self.compress)
+
+    @property
+    def stderr(self):
+        return self._stderr.text
+
+    @stderr.setter
+    def stderr(self, value):
+        self._stderr = _intern_output(value, self.compress)
+
+    @property
+    def stdout_size(self):
+        """
+        The size, in bytes (UTF-8 encoded), of ``stdout``.
+
+        Known since storage time, so nothing is re-encoded (or decompressed.)
+
+        .. versionadded:: 2.1
+        """
+        return self._stdout.size
+
+    @property
+    def digest(self):
+        """
+        A SHA-1 hex digest identifying ``stdout``, ``stderr`` and ``exited``.
+
+        Results with equal digests had identical outcomes. Computed from the
+        digests taken as each output is stored, so the outputs themselves are
+        never re-read (or decompressed.)
+
+        .. versionadded:: 2.1
+        """
+        digest = hashlib.sha1(self._stdout.digest)
+        digest.update(self._stderr.digest)
+        digest.update(str(self.exited).encode("ascii"))
+        return digest.hexdigest()
+
     # TODO: have useful str/repr differentiation from invoke.Result,
     # transfer.Result etc.
+
+
+# NOTE: surrogatepass keeps the str -> bytes -> str round trip lossless on
+# Python 3; Python 2 encodes lone surrogates happily already.
+_errors = "surrogatepass" if PY3 else "strict"
+
+#: Live output blobs, keyed by content digest, so identical outputs share one.
+_blobs = WeakValueDictionary()
+
+
+class _Blob(object):
+    """
+    Storage for one captured output, shared by every `.Result` producing it.
+
+    Holds the text itself, or (if ``compressed``) its zlib-compressed UTF-8
+    encoding.
+    """
+
+    __slots__ = ("data", "compressed", "digest", "size", "__weakref__")
+
+    def __init__(self, data, compressed, digest, size):
+        self.data = data
+        self.compressed = compressed
+        # Both of the UTF-8 encoded text, so they describe it regardless.
+        self.digest = digest
+        self.size = size
+
+    @property
+    def text(self):
+        if not self.compressed:
+            return self.data
+        return zlib.decompress(self.data).decode("utf-8", _errors)
+
+
+def _intern_output(text, compress):
+    data = text.encode("utf-8", _errors)
+    digest = hashlib.sha1(data).digest()
+    size = len(data)
+    compressed = False
+    if compress:
+        squashed = zlib.compress(data)
+        if len(squashed) < len(data):
+            data, compressed = squashed, True
+    if not compressed:
+        data = text
+    key = (digest, compressed)
+    blob = _blobs.get(key)
+    if blob is None:
+        blob = _blobs.setdefault(key, _Blob(data, compressed, digest, size))
+    return blob
@@ -2,18 +2,61 @@
 File transfer via SFTP and/or SCP.
 """
 
+from collections import deque
+from functools import partial
+import hashlib
+from io import BytesIO
+import mmap
 import os
 import posixpath
+import shutil
 import stat
+import struct
+import tarfile
+import zlib
+
+try:
+    from invoke.vendor.six.moves import shlex_quote
+except ImportError:
+    from six.moves import shlex_quote
 
 from invoke.util import debug  # TODO: actual logging! LOL
+from invoke.util import ExceptionHandlingThread
+from paramiko import SFTPAttributes
+from paramiko.sftp import (
+    CMD_ATTRS,
+    CMD_CLOSE,
+    CMD_DATA,
+    CMD_FSETSTAT,
+    CMD_HANDLE,
+    CMD_MKDIR,
+    CMD_OPEN,
+    CMD_READ,
+    CMD_STAT,
+    CMD_STATUS,
+    CMD_WRITE,
+    SFTP_FLAG_CREATE,
+    SFTP_FLAG_READ,
+    SFTP_FLAG_TRUNC,
+    SFTP_FLAG_WRITE,
+    SFTPError,
+)
+
+try:
+    from paramiko.py3compat import long as int64
+except ImportError:  # Paramiko 3+
+    from paramiko.sftp import int64
+
+from .exceptions import TransferFailed
+from .manifest import file_digest, manifest
+
+# NOTE: rsync-style delta uploads of single files are handled here (put()'s
+# 'delta'), as are recursive get/put of whole directories and skipping of
+# unchanged files ('skip_unchanged'). What isn't - e.g. delta downloads, or
+# deltas across whole trees - is still a job for rsync itself, such as via
+# patchwork's rsync().
 
-# TODO: figure out best way to direct folks seeking rsync, to patchwork's rsync
-# call (which needs updating to use invoke.run() & fab 2 connection methods,
-# but is otherwise suitable).
-# UNLESS we want to try and shoehorn it into this module after all? Delegate
-# any recursive get/put to it? Requires users to have rsync available of
-# course.
+_local_separators = tuple(x for x in (os.sep, os.altsep) if x)
 
 
 class Transfer(object):
@@ -22,12 +65,19 @@ class Transfer(object):
 
     .. versionadded:: 2.0
     """
-    # TODO: SFTP clear default, but how to do SCP? subclass? init kwarg?
 
     def __init__(self, connection):
         self.connection = connection
 
-    def get(self, remote, local=None, preserve_mode=True):
+    def get(
+        self,
+        remote,
+        local=None,
+        preserve_mode=True,
+        method=None,
+        compress=False,
+        skip_unchanged=None,
+    ):
         """
         Download a file from the current connection to the local filesystem.
 
@@ -51,7 +101,15 @@ class Transfer(object):
             For example, if the local path is a directory, the remote path's
             base filename will be added onto it (so ``get('foo/bar/file.txt',
             '/tmp/')`` would result in creation or overwriting of
-            ``/tmp/file.txt``).
+            ``/tmp/file.txt``). A path ending in a path separator is always
+            treated as a directory, and is created if it does not exist.
+
+            The path may also contain ``{host}``, ``{user}`` and ``{port}``
+            placeholders, which are filled in from the current connection -
+            e.g. ``get('app.log', '{host}/')`` downloads into a per-host
+            directory. (This is what lets `.Group.get` download from many
+            hosts without them overwriting one another.) Any other braces
+            are left as they are.
 
             .. note::
                 When dealing with nonexistent file paths, normal Python file
@@ -66,28 +124,93 @@ class Transfer(object):
             Whether to `os.chmod` the local file so it matches the remote
             file's mode (default: ``True``).
 
+        :param str method:
+            How to transfer: ``"sftp"``, ``"scp"`` or ``"tar"``; see below.
+            Default: the ``transfer.method`` config setting (itself
+            defaulting to ``"sftp"``), which may only be ``"sftp"`` or
+            ``"scp"``.
+
+        :param bool compress:
+            Whether to gzip the stream when ``method`` is ``"tar"``. Default:
+            ``False``.
+
+        :param str skip_unchanged:
+            If given, how to tell whether ``local`` already matches
+            ``remote``, in which case nothing is downloaded; see below.
+            Default: ``None`` (always download.)
+
+        If ``remote`` is a directory, it is downloaded recursively instead,
+        to the path ``local`` would otherwise have saved a file as; ``local``
+        may not be a file-like object. Only regular files and directories are
+        downloaded.
+
+        With ``method="tar"``, ``remote`` must be a directory, which is
+        downloaded as a single tar stream: the remote end runs ``tar -c``,
+        whose output is unpacked locally as it arrives. For trees of many
+        files this is much faster than SFTP, but requires a shell and
+        ``tar`` on the remote end, and relative ``remote`` paths are left as
+        given (being resolved by the remote shell, typically from the
+        connecting user's ``$HOME``.) If the remote ``tar`` fails, a
+        `.TransferFailed` is raised.
+
+        With ``method="scp"``, the SCP protocol is used instead of SFTP (by
+        running ``scp -f`` on the remote end), with otherwise identical
+        results: this suits hosts lacking an SFTP subsystem, and saves some
+        network round trips, which helps with small files on slow links.
+        Relative ``remote`` paths are resolved by the remote shell, as for
+        ``method="tar"``. Errors reported by the remote ``scp`` raise
+        `.TransferFailed`.
+
+        ``skip_unchanged`` may be used when downloading a single file to a
+        local path via SFTP, and is one of:
+
+        - ``"size_mtime"``: skip if the files' sizes and modification times
+          (to the second) match. Downloaded files are then given the remote
+          file's modification time, so they'll be skipped next time.
+        - ``"hash"``: skip if the files' SHA-256 digests match; the remote
+          one is computed by running ``sha256sum`` on the remote end, at the
+          same time as the local one is computed. Local digests may be
+          cached between runs, by configuring a `.Manifest` file as the
+          ``transfer.manifest`` setting.
+
+        Either way, `.Result.skipped` says whether the download was skipped.
+
         :returns: A `.Result` object.
 
+        :raises: `.TransferFailed`, if ``method`` is ``"scp"`` or ``"tar"``
+            and the remote command failed.
+
         .. versionadded:: 2.0
+        .. versionchanged:: 2.1
+            Added recursive download of directories, and the ``method``,
+            ``compress`` and ``skip_unchanged`` arguments.
         """
         # TODO: how does this API change if we want to implement
         # remote-to-remote file transfer? (Is that even realistic?)
-        # TODO: handle v1's string interpolation bits, especially the default
-        # one, or at least think about how that would work re: split between
-        # single and multiple server targets.
         # TODO: callback support
         # TODO: how best to allow changing the behavior/semantics of
         # remote/local (e.g. users might want 'safer' behavior that complains
         # instead of overwriting existing files) - this likely ties into the
         # "how to handle recursive/rsync" and "how to handle scp" questions
 
-        sftp = self.connection.sftp()
+        method = _method(method, self.connection)
+        _check_skip_unchanged(skip_unchanged)
 
         # Massage remote path
         if not remote:
             raise ValueError("Remote path must not be empty!")
         orig_remote = remote
-        remote = posixpath.join(sftp.getcwd() or sftp.normalize("."), remote)
+        if method != "sftp":
+            remote = posixpath.normpath(remote)
+            remote_mode = stat.S_IFDIR if method == "tar" else None
+        else:
+            sftp = self.connection.sftp()
+            cwd = sftp.getcwd() or sftp.normalize(".")
+            remote = posixpath.join(cwd, remote)
+            # Needed for mode preservation anyhow, so this costs nothing
+            # extra in the default case.
+            remote_attrs = sftp.stat(remote)
+            remote_mode = remote_attrs.st_mode
 
         # Massage local path:
         # - handle file-ness
@@ -97,7 +220,17 @@ class Transfer(object):
         if not local:
             local = posixpath.basename(remote)
         if not is_file_like:
+            cxn = self.connection
+            for key in ("host", "user", "port"):
+                token = "{" + key + "}"
+                local = local.replace(token, str(getattr(cxn, key)))
+            # Check before abspath(), which strips trailing separators.
+            is_dir = local.endswith(_local_separators)
             local = os.path.abspath(local)
+            if is_dir:
+                if not os.path.isdir(local):
+                    os.makedirs(local)
+                local = os.path.join(local, posixpath.basename(remote))
 
         # Run Paramiko-level .get() (side-effects only. womp.)
         # TODO: push some of the path handling into Paramiko; it should be
@@ -106,7 +239,35 @@ class Transfer(object):
         # existing files. Use logging for that obviously.
         #
         # If local appears to be a file-like object, use sftp.getfo, not get
-        if is_file_like:
+        command = None
+        if skip_unchanged:
+            regular = method == "sftp" and stat.S_ISREG(remote_mode)
+            if is_file_like or not regular:
+                err = "skip_unchanged only applies to SFTP file downloads!"
+                raise ValueError(err)
+            if self._unchanged(skip_unchanged, local, remote, remote_attrs):
+                debug("Skipping unchanged {!r}".format(remote))
+                return Result(
+                    orig_remote=orig_remote,
+                    remote=remote,
+                    orig_local=orig_local,
+                    local=local,
+                    connection=self.connection,
+                    skipped=True,
+                )
+        if method == "scp":
+            command = _Scp(self.connection)
+            command.get(remote, local, preserve_mode)
+        elif stat.S_ISDIR(remote_mode):
+            if is_file_like:
+                err = "Can't download a directory into a file-like object!"
+                raise ValueError(err)
+            if method == "tar":
+                command = _TarStream(self.connection, compress)
+                command.get_tree(remote, local, preserve_mode)
+            else:
+                _Pipeline(sftp).get_tree(remote, local, preserve_mode)
+        elif is_file_like:
             sftp.getfo(remotepath=remote, fl=local)
         else:
             sftp.get(remotepath=remote, localpath=local)
@@ -114,11 +275,14 @@ class Transfer(object):
             # TODO: Push this down into SFTPClient sometime (requires backwards
             # incompat release.)
             if preserve_mode:
-                remote_mode = sftp.stat(remote).st_mode
                 mode = stat.S_IMODE(remote_mode)
                 os.chmod(local, mode)
+            if skip_unchanged == "size_mtime":
+                times = (remote_attrs.st_atime, remote_attrs.st_mtime)
+                os.utime(local, times)
         # Return something useful
-        return Result(
+        return self._result(
+            command,
             orig_remote=orig_remote,
             remote=remote,
             orig_local=orig_local,
@@ -126,7 +290,16 @@ class Transfer(object):
             connection=self.connection,
         )
 
-    def put(self, local, remote=None, preserve_mode=True):
+    def put(
+        self,
+        local,
+        remote=None,
+        preserve_mode=True,
+        method=None,
+        compress=False,
+        delta=False,
+        skip_unchanged=None,
+    ):
         """
         Upload a file from the local filesystem to the current connection.
 
@@ -162,19 +335,100 @@ class Transfer(object):
             Whether to ``chmod`` the remote file so it matches the local file's
             mode (default: ``True``).
 
+        If ``local`` is a directory, it is uploaded recursively instead: the
+        directory ``remote`` (by default, one named like ``local`` within the
+        remote working directory) is created as necessary, and everything
+        within ``local`` is uploaded into it, preserving the layout (and,
+        with ``preserve_mode``, modes of files and newly created
+        directories.) Only regular files and directories are uploaded;
+        symbolic links (to files or directories) are followed, except that
+        links to a directory containing them are skipped, rather than
+        followed endlessly.
+
+        :param str method:
+            How to transfer: ``"sftp"``, ``"scp"`` or ``"tar"``; see below.
+            Default: the ``transfer.method`` config setting (itself
+            defaulting to ``"sftp"``), which may only be ``"sftp"`` or
+            ``"scp"``.
+
+        :param bool compress:
+            Whether to gzip the stream when ``method`` is ``"tar"``. Default:
+            ``False``.
+
+        :param bool delta:
+            Whether to send only the differences between ``local`` and an
+            existing ``remote`` file; see below. Default: ``False``.
+
+        :param str skip_unchanged:
+            If given, how to tell whether ``remote`` already matches
+            ``local``, in which case nothing is uploaded: ``"size_mtime"`` or
+            ``"hash"``. Only applies to uploading a single file from a local
+            path via SFTP; see `get` for details. Default: ``None`` (always
+            upload.)
+
+        Trees are uploaded by issuing many SFTP requests at once - directory
+        creation, file opens, writes, mode changes and closes - and only
+        then collecting their responses, instead of waiting a network round
+        trip after each one, so trees of many small files upload in a small
+        fraction of the time.
+
+        With ``method="tar"``, ``local`` must be a directory, which is
+        uploaded as a single tar stream generated on the fly and unpacked by
+        ``tar -x`` on the remote end. This is faster still, but requires a
+        shell and ``tar`` on the remote end, and relative ``remote`` paths
+        are left as given (being resolved by the remote shell, typically
+        from the connecting user's ``$HOME``.) Files are owned by the
+        connecting user, as with SFTP. If the remote ``tar`` fails, a
+        `.TransferFailed` is raised.
+
+        With ``method="scp"``, the SCP protocol is used instead of SFTP (by
+        running ``scp -t`` on the remote end), with otherwise identical
+        results, as described for `get`.
+
+        With ``delta=True``, ``local`` must be a file, and is sent rsync-style
+        (though without needing ``rsync`` on either end): the remote end
+        checksums the existing ``remote`` file (if any) block by block, and
+        only a patch is sent, made of references to blocks which it already
+        has - wherever they are in the file - plus the data it lacks. This
+        makes updating large files with small changes very cheap. It
+        requires ``python3`` on the remote end (which also resolves relative
+        ``remote`` paths, as for ``method="tar"``), and the remote file is
+        replaced atomically by a new one, owned by the connecting user.
+        Failures raise `.TransferFailed`.
+
         :returns: A `.Result` object.
 
+        :raises: `.TransferFailed`, if ``method`` is ``"scp"`` or
+            ``"tar"``, or ``delta=True``, and a remote command failed.
+
         .. versionadded:: 2.0
+        .. versionchanged:: 2.1
+            Added recursive upload of directories, and the ``method``,
+            ``compress``, ``delta`` and ``skip_unchanged`` arguments.
         """
         # TODO: preserve honoring of  "name" attribute of file-like objects as
         # in v1, so one CAN just upload to a directory? did we just make that
         # shit up or is it an actual part of the api in newer Pythons?
-        sftp = self.connection.sftp()
+        method = _method(method, self.connection)
+        _check_skip_unchanged(skip_unchanged)
 
         if not local:
             raise ValueError("Local path must not be empty!")
 
         is_file_like = hasattr(local, "write") and callable(local.write)
+        if method == "tar" and (is_file_like or not os.path.isdir(local)):
+            err = "Only directories may be uploaded with method='tar'!"
+            raise ValueError(err)
+        if delta and (
+            method != "sftp" or is_file_like or os.path.isdir(local)
+        ):
+            err = "Only single files may be uploaded with delta=True!"
+            raise ValueError(err)
+        if skip_unchanged and (
+            method != "sftp" or is_file_like or os.path.isdir(local)
+        ):
+            err = "skip_unchanged only applies to SFTP file uploads!"
+            raise ValueError(err)
 
         # Massage remote path
         orig_remote = remote
@@ -184,10 +438,17 @@ class Transfer(object):
                     "Must give non-empty remote path when local is a file-like object!"  # noqa
                 )
             else:
-                remote = os.path.basename(local)
+                # Trailing separators would leave an empty basename.
+                name = local.rstrip("".join(_local_separators))
+                remote = os.path.basename(name)
                 debug("Massaged empty remote path into {!r}".format(remote))
         prejoined_remote = remote
-        remote = posixpath.join(sftp.getcwd() or sftp.normalize("."), remote)
+        if method != "sftp" or delta:
+            remote = posixpath.normpath(remote)
+        else:
+            sftp = self.connection.sftp()
+            cwd = sftp.getcwd() or sftp.normalize(".")
+            remote = posixpath.join(cwd, remote)
         if remote != prejoined_remote:
             msg = "Massaged relative remote path {!r} into {!r}"
             debug(msg.format(prejoined_remote, remote))
@@ -210,7 +471,34 @@ class Transfer(object):
         # existing files. Use logging for that obviously.
         #
         # If local appears to be a file-like object, use sftp.putfo, not put
-        if is_file_like:
+        command = None
+        if skip_unchanged and self._unchanged(skip_unchanged, local, remote):
+            debug("Skipping unchanged {!r}".format(local))
+            return Result(
+                orig_remote=orig_remote,
+                remote=remote,
+                orig_local=orig_local,
+                local=local,
+                connection=self.connection,
+                method="delta" if delta else method,
+                skipped=True,
+            )
+        if method == "tar":
+            debug("Streaming directory {!r} to {!r}".format(local, remote))
+            command = _TarStream(self.connection, compress)
+            command.put_tree(local, remote, preserve_mode)
+        elif method == "scp":
+            debug("Copying {!r} to {!r} via scp".format(local, remote))
+            command = _Scp(self.connection)
+            command.put(local, remote, preserve_mode)
+        elif delta:
+            debug("Updating {!r} from {!r}".format(remote, local))
+            command = _Delta(self.connection)
+            command.put(local, remote, preserve_mode)
+        elif not is_file_like and os.path.isdir(local):
+            debug("Uploading directory {!r} to {!r}".format(local, remote))
+            _Pipeline(sftp).put_tree(local, remote, preserve_mode)
+        elif is_file_like:
             msg = "Uploading file-like object {!r} to {!r}"
             debug(msg.format(local, remote))
             pointer = local.tell()
@@ -230,8 +518,13 @@ class Transfer(object):
                 local_mode = os.stat(local).st_mode
                 mode = stat.S_IMODE(local_mode)
                 sftp.chmod(remote, mode)
+        if skip_unchanged == "size_mtime":
+            local_stat = os.stat(local)
+            times = (local_stat.st_atime, local_stat.st_mtime)
+            self.connection.sftp().utime(remote, times)
         # Return something useful
-        return Result(
+        return self._result(
+            command,
             orig_remote=orig_remote,
             remote=remote,
             orig_local=orig_local,
@@ -239,6 +532,972 @@ class Transfer(object):
             connection=self.connection,
         )
 
+    def _unchanged(self, how, local, remote, remote_attrs=None):
+        # Whether local & remote files appear identical, judging by 'how'.
+        if how == "hash":
+            return self._same_digest(local, remote)
+        try:
+            local_stat = os.stat(local)
+            if remote_attrs is None:
+                remote_attrs = self.connection.sftp().stat(remote)
+        except (IOError, OSError):  # Nonexistent files are never unchanged
+            return False
+        return (
+            local_stat.st_size == remote_attrs.st_size
+            and int(local_stat.st_mtime) == remote_attrs.st_mtime
+        )
+
+    def _same_digest(self, local, remote):
+        if not os.path.isfile(local):
+            return False
+        # Hash locally while the remote end does the same.
+        digests = []
+        hasher = ExceptionHandlingThread(
+            target=lambda: digests.append(self._local_digest(local))
+        )
+        hasher.start()
+        try:
+            remote_digest = _RemoteDigest(self.connection).sha256(remote)
+        finally:
+            hasher.join()
+        wrapper = hasher.exception()
+        if wrapper is not None:
+            raise wrapper.value
+        return remote_digest == digests[0]
+
+    def _local_digest(self, path):
+        cache = self.connection.config.transfer.manifest
+        if cache:
+            return manifest(cache).digest(path)
+        return file_digest(path)
+
+    def _result(self, command, **kwargs):
+        # 'command' is the _RemoteCommand which did the work, if any.
+        if command is None:
+            return Result(**kwargs)
+        result = Result(
+            method=command.method,
+            exited=command.exited,
+            stderr=command.stderr,
+            **kwargs
+        )
+        if command.exited:
+            raise TransferFailed(result)
+        return result
+
+
+def _method(method, connection):
+    if method:
+        if method not in ("sftp", "scp", "tar"):
+            err = "Unknown transfer method {!r}!"
+            raise ValueError(err.format(method))
+        return method
+    method = connection.config.transfer.method
+    # Not "tar", which only handles directories; that must be asked for
+    # explicitly.
+    if method not in ("sftp", "scp"):
+        err = "transfer.method must be 'sftp' or 'scp', not {!r}!"
+        raise ValueError(err.format(method))
+    return method
+
+
+def _check_skip_unchanged(how):
+    if how not in (None, False, "size_mtime", "hash"):
+        raise ValueError("Unknown skip_unchanged value {!r}!".format(how))
+
+
+def _walk(local):
+    """
+    Yield ``(directory, filenames)`` for ``local`` and each directory below.
+
+    Like `os.walk` (top-down, names sorted), but following symlinked
+    directories - except for links back into one of their own ancestors,
+    which would otherwise never end.
+    """
+    ancestors = {local: frozenset()}
+    for root, dirnames, filenames in os.walk(local, followlinks=True):
+        chain = ancestors.pop(root) | {os.path.realpath(root)}
+        kept = []
+        for name in sorted(dirnames):
+            path = os.path.join(root, name)
+            if os.path.realpath(path) in chain:
+                debug("Skipping link to ancestor directory {!r}".format(path))
+                continue
+            kept.append(name)
+            ancestors[path] = chain
+        dirnames[:] = kept
+        yield root, sorted(filenames)
+
+
+class _Pipeline(object):
+    """
+    Issues many SFTP requests over one `~paramiko.sftp_client.SFTPClient` at
+    once, collecting responses as they arrive instead of awaiting each in turn.
+
+    Relies on the client's own asynchronous request machinery (as used by
+    Paramiko for e.g. prefetching), with this object standing in for the
+    file object responses are normally dispatched to.
+
+    Requests which depend on one another are still only sent once the ones
+    they depend on have been answered, so servers processing requests out
+    of order are no problem.
+    """
+
+    #: Maximum number of requests awaiting a response at any one time.
+    window = 64
+    #: Maximum number of files open at any one time.
+    batch = 32
+    #: Bytes per read/write request; Paramiko's own limit for writes.
+    chunk_size = 32768
+
+    def __init__(self, sftp):
+        self.sftp = sftp
+        self.responses = {}
+        self.outstanding = 0
+
+    def _async_response(self, t, msg, num):
+        # Called by the client as it reads responses to our requests.
+        self.responses[num] = (t, msg)
+        self.outstanding -= 1
+
+    def request(self, t, *args):
+        """
+        Send a request, returning its number.
+
+        Blocks while `window` requests are already awaiting responses.
+        """
+        while self.outstanding >= self.window:
+            self.sftp._read_response()
+        self.outstanding += 1
+        return self.sftp._async_request(self, t, *args)
+
+    def response(self, num, expected=CMD_STATUS):
+        """
+        Return the message answering request ``num``, once it has arrived.
+
+        Error statuses are raised as exceptions (typically `IOError`.)
+        """
+        while num not in self.responses:
+            self.sftp._read_response()
+        t, msg = self.responses.pop(num)
+        if t == CMD_STATUS:
+            self.sftp._convert_status(msg)
+        if t != expected:
+            raise SFTPError("Expected response type {}, got {}".format(
+                expected, t
+            ))
+        return msg
+
+    def _attrs(self, mode):
+        attrs = SFTPAttributes()
+        attrs.st_mode = mode
+        return attrs
+
+    def mkdirs(self, paths):
+        """
+        Create all of ``paths``, which must be ordered parents first.
+
+        Existing directories are fine; other existing paths are not.
+        """
+        # Each level waits for the previous one, as it lives within it.
+        levels = {}
+        for path, mode in paths:
+            levels.setdefault(path.count("/"), []).append((path, mode))
+        for depth in sorted(levels):
+            level = levels[depth]
+            nums = [
+                self.request(CMD_MKDIR, path, self._attrs(mode))
+                for path, mode in level
+            ]
+            failed = []
+            for (path, _), num in zip(level, nums):
+                try:
+                    self.response(num)
+                except IOError as e:
+                    failed.append((path, e))
+            nums = [self.request(CMD_STAT, path) for path, _ in failed]
+            for (path, error), num in zip(failed, nums):
+                try:
+                    msg = self.response(num, CMD_ATTRS)
+                except IOError:
+                    raise error
+                if not stat.S_ISDIR(SFTPAttributes._from_msg(msg).st_mode):
+                    raise error
+
+    def _batches(self, items):
+        for index in range(0, len(items), self.batch):
+            yield items[index:index + self.batch]
+
+    def _open(self, paths, flags):
+        nums = [
+            self.request(CMD_OPEN, path, flags, SFTPAttributes())
+            for path in paths
+        ]
+        return [self.response(x, CMD_HANDLE).get_binary() for x in nums]
+
+    def _close(self, handles):
+        for num in [self.request(CMD_CLOSE, x) for x in handles]:
+            self.response(num)
+
+    def put_tree(self, local, remote, preserve_mode=True):
+        """
+        Upload local directory ``local``'s contents into ``remote``.
+        """
+        dirs, files = [], []
+        for root, filenames in _walk(local):
+            relative = os.path.relpath(root, local)
+            target = remote
+            if relative != os.curdir:
+                target = posixpath.join(remote, *relative.split(os.sep))
+            mode = stat.S_IMODE(os.stat(root).st_mode)
+            dirs.append((target, mode if preserve_mode else 0o777))
+            for name in filenames:
+                files.append(
+                    (os.path.join(root, name), posixpath.join(target, name))
+                )
+        self.mkdirs(dirs)
+        flags = SFTP_FLAG_WRITE | SFTP_FLAG_CREATE | SFTP_FLAG_TRUNC
+        for batch in self._batches(files):
+            handles = self._open([x[1] for x in batch], flags)
+            writes = []
+            for (path, _), handle in zip(batch, handles):
+                with open(path, "rb") as fd:
+                    offset = 0
+                    while True:
+                        data = fd.read(self.chunk_size)
+                        if not data:
+                            break
+                        writes.append(
+                            self.request(
+                                CMD_WRITE, handle, int64(offset), data
+                            )
+                        )
+                        offset += len(data)
+            for num in writes:
+                self.response(num)
+            if preserve_mode:
+                nums = [
+                    self.request(
+                        CMD_FSETSTAT,
+                        handle,
+                        self._attrs(stat.S_IMODE(os.stat(path).st_mode)),
+                    )
+                    for (path, _), handle in zip(batch, handles)
+                ]
+                for num in nums:
+                    self.response(num)
+            self._close(handles)
+
+    def get_tree(self, remote, local, preserve_mode=True):
+        """
+        Download remote directory ``remote``'s contents into ``local``.
+        """
+        dirs, files = [], []
+        pending = [(remote, local)]
+        while pending:
+            source, target = pending.pop(0)
+            dirs.append(target)
+            entries = sorted(
+                self.sftp.listdir_attr(source), key=lambda x: x.filename
+            )
+            for attrs in entries:
+                paths = (
+                    posixpath.join(source, attrs.filename),
+                    os.path.join(target, attrs.filename),
+                )
+                if stat.S_ISDIR(attrs.st_mode):
+                    pending.append(paths)
+                elif stat.S_ISREG(attrs.st_mode):
+                    files.append(paths + (attrs,))
+                else:
+                    debug("Skipping non-regular file {!r}".format(paths[0]))
+        for path in dirs:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        for batch in self._batches(files):
+            handles = self._open([x[0] for x in batch], SFTP_FLAG_READ)
+            for (_, path, attrs), handle in zip(batch, handles):
+                with open(path, "wb") as fd:
+                    self._read_into(fd, handle, attrs.st_size)
+            self._close(handles)
+            if preserve_mode:
+                for _, path, attrs in batch:
+                    os.chmod(path, stat.S_IMODE(attrs.st_mode))
+
+    def _read_into(self, fd, handle, size):
+        # Keeps up to 'window' reads in flight, writing out each response
+        # (in order) as it comes, so memory use stays bounded.
+        offsets = deque(range(0, size, self.chunk_size))
+        requested = deque()
+        while offsets or requested:
+            while offsets and len(requested) < self.window:
+                offset = offsets.popleft()
+                length = min(self.chunk_size, size - offset)
+                num = self.request(CMD_READ, handle, int64(offset), length)
+                requested.append((num, offset, length))
+            num, offset, length = requested.popleft()
+            try:
+                data = self.response(num, CMD_DATA).get_string()
+            except EOFError:
+                # File shrank since we listed it.
+                continue
+            fd.seek(offset)
+            fd.write(data)
+            if 0 < len(data) < length:
+                # Short read; ask for the rest later.
+                offsets.append(offset + len(data))
+
+
+class _RemoteCommand(object):
+    """
+    Performs (part of) a transfer by streaming data through a remote command.
+
+    Subclasses feed and/or consume the command's standard streams via
+    ``_run``; afterwards, ``exited`` holds the (last) command's exit status
+    and ``stderr`` its error output.
+    """
+
+    #: Name of the transfer method, as recorded on `.Result`.
+    method = None
+    #: Bytes per read from the channel.
+    chunk_size = 32768
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.exited = None
+        self.stderr = ""
+
+    def _run(self, command, stream, combine_stderr):
+        channel = self.connection.create_session()
+        try:
+            if combine_stderr:
+                channel.set_combine_stderr(True)
+            read = channel.recv if combine_stderr else channel.recv_stderr
+            errors = []
+            # Drain error output as it comes, lest a chatty remote command
+            # stall on a full channel window.
+            drainer = ExceptionHandlingThread(
+                target=self._drain, kwargs=dict(read=read, into=errors)
+            )
+            msg = "Running {!r} for {} transfer"
+            debug(msg.format(command, self.method))
+            channel.exec_command(command)
+            drainer.start()
+            try:
+                stream(channel)
+            except Exception:
+                # Errors after the remote end went away are most likely down
+                # to it failing, which is reported via its exit status;
+                # others are local problems, and raised as such.
+                if not (channel.eof_received or channel.closed):
+                    raise
+                self._finish(channel, drainer, errors)
+                if not self.exited:
+                    raise
+            else:
+                self._finish(channel, drainer, errors)
+        finally:
+            channel.close()
+
+    def _drain(self, read, into):
+        while True:
+            data = read(self.chunk_size)
+            if not data:
+                break
+            into.append(data)
+
+    def _finish(self, channel, drainer, errors):
+        channel.shutdown_write()
+        self.exited = channel.recv_exit_status()
+        drainer.join()
+        self.stderr = b"".join(errors).decode("utf-8", "replace")
+
+
+class _RemoteDigest(_RemoteCommand):
+    """
+    Computes remote files' digests using ``sha256sum``.
+    """
+
+    method = "hash"
+
+    def sha256(self, remote):
+        """
+        Return ``remote``'s SHA-256 hex digest, or ``None`` if unavailable.
+        """
+        output = []
+
+        def receive(channel):
+            stream = channel.makefile("rb")
+            for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                output.append(chunk)
+
+        command = "sha256sum {}".format(shlex_quote(remote))
+        self._run(command, receive, combine_stderr=False)
+        if self.exited:
+            debug("Couldn't hash {!r}: {}".format(remote, self.stderr))
+            return None
+        # Only the digest itself is ASCII (the filename which follows it may
+        # be anything); escaped filenames give it a leading backslash.
+        digest = b"".join(output).split()[0]
+        return digest.decode("ascii").lstrip("\\")
+
+
+class _ScpError(Exception):
+    # An error reported by the remote end via the SCP protocol itself.
+    pass
+
+
+class _Scp(_RemoteCommand):
+    """
+    Transfers files and directory trees using the SCP protocol.
+
+    The remote end runs ``scp`` in its (undocumented, but long stable)
+    server modes: ``scp -t`` to receive files and ``scp -f`` to send them.
+    Errors it reports in-band are recorded in ``stderr``.
+    """
+
+    method = "scp"
+
+    def put(self, local, remote, preserve_mode=True):
+        """
+        Upload ``local`` (a path or file-like object) to ``remote``.
+
+        As with SFTP, a directory's contents are uploaded into ``remote``,
+        which is created if necessary.
+        """
+        is_file_like = hasattr(local, "write") and callable(local.write)
+        is_dir = not is_file_like and os.path.isdir(local)
+        quoted = shlex_quote(remote)
+        # Without -p, new files get our modes less the remote umask, while
+        # existing ones keep their own - as with SFTP.
+        flags = ["-t"]
+        if preserve_mode and not is_file_like:
+            flags.append("-p")
+        if is_dir:
+            flags.append("-r")
+        command = "scp {} {}".format(" ".join(flags), quoted)
+        if is_dir:
+            command = "mkdir -p {} && {}".format(quoted, command)
+
+        def send(out, src):
+            self._ack(src)
+            if is_file_like:
+                self._send_file_like(out, src, local, remote)
+            elif is_dir:
+                self._send_tree(out, src, local, preserve_mode)
+            else:
+                name = os.path.basename(local)
+                self._send_path(out, src, local, name, preserve_mode)
+
+        self._converse(command, send)
+
+    def _send_tree(self, out, src, local, preserve_mode):
+        # The walk is top-down, so each directory is left (with "E") once
+        # the next one isn't within it - and skips cycles, as via SFTP.
+        opened = [local]
+        for root, filenames in _walk(local):
+            if root != local:
+                while not root.startswith(os.path.join(opened[-1], "")):
+                    opened.pop()
+                    self._send(out, src, "E\n")
+                mode = stat.S_IMODE(os.stat(root).st_mode)
+                mode = mode if preserve_mode else 0o755
+                name = os.path.basename(root)
+                self._send(out, src, "D{:04o} 0 {}\n".format(mode, name))
+                opened.append(root)
+            for name in filenames:
+                path = os.path.join(root, name)
+                self._send_path(out, src, path, name, preserve_mode)
+        for _ in opened[1:]:
+            self._send(out, src, "E\n")
+
+    def _send_path(self, out, src, path, name, preserve_mode):
+        if os.path.isfile(path):
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+            mode = mode if preserve_mode else 0o644
+            with open(path, "rb") as fd:
+                size = os.fstat(fd.fileno()).st_size
+                self._send_data(out, src, fd, mode, size, name)
+        else:
+            debug("Skipping non-regular file {!r}".format(path))
+
+    def _send_file_like(self, out, src, local, remote):
+        name = posixpath.basename(remote)
+        pointer = local.tell()
+        try:
+            local.seek(0)
+            if isinstance(local.read(0), bytes):
+                local.seek(0, os.SEEK_END)
+                size = local.tell()
+                local.seek(0)
+                self._send_data(out, src, local, 0o644, size, name)
+            else:
+                data = local.read().encode("utf-8")
+                fd = BytesIO(data)
+                self._send_data(out, src, fd, 0o644, len(data), name)
+        finally:
+            local.seek(pointer)
+
+    def _send_data(self, out, src, fd, mode, size, name):
+        self._send(out, src, "C{:04o} {} {}\n".format(mode, size, name))
+        remaining = size
+        while remaining:
+            data = fd.read(min(remaining, self.chunk_size))
+            if not data:
+                raise IOError("{!r} shrank while being sent".format(name))
+            out.write(data)
+            remaining -= len(data)
+        self._send(out, src, b"\0")
+
+    def _send(self, out, src, message):
+        if not isinstance(message, bytes):
+            message = message.encode("utf-8")
+        out.write(message)
+        out.flush()
+        self._ack(src)
+
+    def get(self, remote, local, preserve_mode=True):
+        """
+        Download ``remote`` (a file or directory) to ``local``.
+
+        ``local`` is the path (or file-like object) the file is written to,
+        or the directory which a directory's contents are downloaded into.
+        """
+        is_file_like = hasattr(local, "write") and callable(local.write)
+        command = "scp -f -r {}".format(shlex_quote(remote))
+
+        def receive(out, src):
+            dirs = []
+            self._reply(out)
+            while True:
+                line = self._readline(src)
+                if not line:
+                    break
+                kind = line[:1]
+                if kind in (b"\1", b"\2"):
+                    raise _ScpError(line[1:].decode("utf-8", "replace"))
+                if kind == b"E":
+                    dirs.pop()
+                    self._reply(out)
+                    continue
+                if kind == b"T":  # Timestamps; not requested, but harmless
+                    self._reply(out)
+                    continue
+                if kind not in (b"C", b"D"):
+                    raise _ScpError("Unexpected message {!r}".format(line))
+                mode, size, name = line[1:-1].decode("utf-8").split(" ", 2)
+                if name in (".", "..") or "/" in name:
+                    raise _ScpError("Refusing file name {!r}".format(name))
+                path = os.path.join(dirs[-1], name) if dirs else local
+                if kind == b"D":
+                    dirs.append(self._directory(path, is_file_like))
+                    self._reply(out)
+                    continue
+                self._reply(out)
+                self._receive_data(out, src, path, int(size))
+                if preserve_mode and not is_file_like:
+                    os.chmod(path, int(mode, 8))
+
+        self._converse(command, receive)
+
+    def _directory(self, path, is_file_like):
+        if is_file_like:
+            err = "Can't download a directory into a file-like object!"
+            raise ValueError(err)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def _receive_data(self, out, src, path, size):
+        fd = path if hasattr(path, "write") else open(path, "wb")
+        try:
+            remaining = size
+            while remaining:
+                data = src.read(min(remaining, self.chunk_size))
+                if not data:
+                    raise _ScpError("")
+                fd.write(data)
+                remaining -= len(data)
+        finally:
+            if fd is not path:
+                fd.close()
+        self._ack(src)
+        self._reply(out)
+
+    def _reply(self, out):
+        out.write(b"\0")
+        out.flush()
+
+    def _ack(self, src):
+        byte = src.read(1)
+        if byte == b"\0":
+            return
+        # Either an error message, or the remote end went away (whose
+        # reasons will be in its stderr.)
+        message = self._readline(src) if byte else b""
+        raise _ScpError(message.decode("utf-8", "replace").strip())
+
+    def _readline(self, src):
+        # Protocol lines are short, and followed by data we mustn't consume.
+        line = []
+        while not line or line[-1] != b"\n":
+            byte = src.read(1)
+            if not byte:
+                break
+            line.append(byte)
+        return b"".join(line)
+
+    def _converse(self, command, converse):
+        errors = []
+
+        def stream(channel):
+            try:
+                converse(channel.makefile("wb"), channel.makefile("rb"))
+            except _ScpError as e:
+                errors.append(str(e))
+
+        self._run(command, stream, combine_stderr=False)
+        if errors:
+            self.stderr = "\n".join(x for x in [self.stderr] + errors if x)
+            self.exited = self.exited or 1
+
+
+class _TarStream(_RemoteCommand):
+    """
+    Transfers a directory tree as one tar stream over an exec channel.
+
+    One end runs ``tar`` (the remote end via a shell command, this end via
+    `tarfile`) and the archive is streamed through the channel as it's
+    generated, so neither end ever holds it in full.
+    """
+
+    method = "tar"
+
+    def __init__(self, connection, compress=False):
+        super(_TarStream, self).__init__(connection)
+        self.compress = compress
+
+    def _flags(self, *flags):
+        return "".join(flags) + ("z" if self.compress else "")
+
+    def put_tree(self, local, remote, preserve_mode=True):
+        """
+        Upload local directory ``local``'s contents into ``remote``.
+        """
+        command = "mkdir -p {0} && tar -C {0} -{1}f -".format(
+            shlex_quote(remote), self._flags("x", "p" if preserve_mode else "")
+        )
+        member = partial(self._member, preserve_mode)
+
+        def send(channel):
+            stream = channel.makefile("wb")
+            mode = "w|gz" if self.compress else "w|"
+            # Symlinks are followed, as when uploading via SFTP (and, as
+            # there, walked here so that cycles are skipped.)
+            with tarfile.open(
+                fileobj=stream, mode=mode, dereference=True
+            ) as archive:
+                add = partial(archive.add, recursive=False, filter=member)
+                for root, filenames in _walk(local):
+                    name = os.path.relpath(root, local)
+                    if name != os.curdir:
+                        name = os.path.join(os.curdir, name)
+                    add(root, arcname=name.replace(os.sep, "/"))
+                    for filename in filenames:
+                        path = os.path.join(root, filename)
+                        arcname = os.path.join(name, filename)
+                        add(path, arcname=arcname.replace(os.sep, "/"))
+            stream.flush()
+
+        self._run(command, send, combine_stderr=True)
+
+    def _member(self, preserve_mode, info):
+        if not (info.isfile() or info.isdir()):
+            debug("Skipping non-regular file {!r}".format(info.name))
+            return None
+        # Leave ownership up to the remote end, as SFTP does.
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        if not preserve_mode:
+            info.mode = 0o755 if info.isdir() else 0o644
+        return info
+
+    def get_tree(self, remote, local, preserve_mode=True):
+        """
+        Download remote directory ``remote``'s contents into ``local``.
+        """
+        command = "tar -C {} -{}f - .".format(
+            shlex_quote(remote), self._flags("c")
+        )
+        if not os.path.isdir(local):
+            os.makedirs(local)
+
+        def receive(channel):
+            stream = channel.makefile("rb")
+            mode = "r|gz" if self.compress else "r|"
+            with tarfile.open(fileobj=stream, mode=mode) as archive:
+                for info in archive:
+                    self._extract(archive, info, local, preserve_mode)
+            # Consume any trailing padding so the remote end can finish.
+            while stream.read(self.chunk_size):
+                pass
+
+        self._run(command, receive, combine_stderr=False)
+
+    def _extract(self, archive, info, local, preserve_mode):
+        name = posixpath.normpath(info.name)
+        if name.startswith("/") or name.split("/")[0] == "..":
+            debug("Skipping unsafe archive member {!r}".format(info.name))
+            return
+        path = os.path.normpath(os.path.join(local, *name.split("/")))
+        if info.isdir():
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        elif info.isfile():
+            parent = os.path.dirname(path)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            with open(path, "wb") as fd:
+                shutil.copyfileobj(archive.extractfile(info), fd)
+            if preserve_mode:
+                os.chmod(path, stat.S_IMODE(info.mode))
+        else:
+            debug("Skipping non-regular file {!r}".format(info.name))
+
+
+# Run remotely (via "python3 -c") by _Delta. The first prints the weak
+# (Adler-32) and strong (SHA-256) checksums of each block of an existing
+# file; the second rebuilds the file from a patch read on stdin, out of
+# blocks of the old file and literal data, atomically replacing it.
+_SIGNATURE_SCRIPT = """
+import hashlib, sys, zlib
+try:
+    fd = open(sys.argv[1], "rb")
+except FileNotFoundError:
+    sys.exit()
+with fd:
+    size, out = int(sys.argv[2]), sys.stdout
+    for block in iter(lambda: fd.read(size), b""):
+        digest = hashlib.sha256(block).hexdigest()
+        out.write("%d %s\\n" % (zlib.adler32(block), digest))
+"""
+
+_PATCH_SCRIPT = """
+import os, struct, sys, tempfile
+path, size, mode = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+patch = sys.stdin.buffer
+def copy(source, count):
+    while count:
+        data = source.read(min(count, 1 << 20))
+        if not data:
+            sys.exit("Unexpected end of data (file changed during update?)")
+        out.write(data)
+        count -= len(data)
+try:
+    old = open(path, "rb")
+except FileNotFoundError:
+    old = None
+handle, temp = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+try:
+    with os.fdopen(handle, "wb") as out:
+        while True:
+            op = patch.read(1)
+            if op == b"C":
+                index, count = struct.unpack(">QQ", patch.read(16))
+                old.seek(index * size)
+                copy(old, count * size)
+            elif op == b"L":
+                copy(patch, struct.unpack(">Q", patch.read(8))[0])
+            elif op == b"E":
+                break
+            else:
+                sys.exit("Malformed patch")
+    if mode:
+        os.chmod(temp, int(mode, 8))
+    elif old is not None:
+        os.chmod(temp, os.stat(path).st_mode & 0o7777)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp, 0o666 & ~umask)
+    os.rename(temp, path)
+except BaseException:
+    os.unlink(temp)
+    raise
+"""
+
+
+class _Delta(_RemoteCommand):
+    """
+    Updates a remote file in place of re-uploading it, rsync-style.
+
+    The remote end (using ``python3``; no ``rsync`` needed) checksums the
+    existing remote file block by block. Those checksums are then searched
+    for in the local file - at every byte offset, using a rolling checksum,
+    so data which merely moved is still found - and only a patch is sent:
+    references to blocks the remote file already has, plus any literal data
+    it lacks, from which the remote end rebuilds the file.
+    """
+
+    method = "delta"
+    #: Remote Python interpreter.
+    python = "python3"
+    #: After this many consecutive blocks with no match, search between
+    #: block boundaries (which costs a Python loop per byte) only now and
+    #: then, until something matches again; new data is thus sent at
+    #: near-copying speed.
+    give_up = 8
+    #: Having given up, search again after 1, 2, 4... more blocks, but never
+    #: more than this many, so that matches following new data of any length
+    #: (and alignment) are still found.
+    retry_interval = 64
+
+    def put(self, local, remote, preserve_mode=True):
+        """
+        Update remote file ``remote`` to match local file ``local``.
+        """
+        local_mode = os.stat(local).st_mode
+        size = self._block_size(os.path.getsize(local))
+        quoted = shlex_quote(remote)
+        signatures = {}
+
+        def receive(channel):
+            stream, data = channel.makefile("rb"), []
+            for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                data.append(chunk)
+            lines = b"".join(data).decode("ascii").splitlines()
+            for index, line in enumerate(lines):
+                weak, strong = line.split()
+                table = signatures.setdefault(int(weak), {})
+                table.setdefault(strong, index)
+
+        command = self._script(_SIGNATURE_SCRIPT, quoted, size)
+        self._run(command, receive, combine_stderr=False)
+        if self.exited:
+            return
+        mode = "{:o}".format(stat.S_IMODE(local_mode)) if preserve_mode else ""
+        command = self._script(_PATCH_SCRIPT, quoted, size, shlex_quote(mode))
+
+        def send(channel):
+            stream, sent = channel.makefile("wb"), [0]
+
+            def write(data):
+                sent[0] += len(data)
+                stream.write(data)
+
+            with open(local, "rb") as fd:
+                self._patch(fd, size, signatures, write)
+            stream.flush()
+            msg = "Sent {} bytes to update {!r} ({} bytes locally)"
+            debug(msg.format(sent[0], remote, os.path.getsize(local)))
+
+        self._run(command, send, combine_stderr=True)
+
+    def _script(self, script, *args):
+        return " ".join(
+            (self.python, "-c", shlex_quote(script)) + tuple(map(str, args))
+        )
+
+    @staticmethod
+    def _block_size(size):
+        # Roughly the square root of the file size, as rsync does.
+        block = 2048
+        while block * block < size and block < 1 << 20:
+            block *= 2
+        return block
+
+    def _patch(self, fd, size, signatures, write):
+        # mmap gives us cheap random access to files of any size.
+        try:
+            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            data = b""
+        try:
+            for op in self._ops(data, size, signatures):
+                if op[0] == "C":
+                    write(b"C" + struct.pack(">QQ", op[1], op[2]))
+                    continue
+                for start in range(op[1], op[2], self.chunk_size):
+                    chunk = data[start:min(start + self.chunk_size, op[2])]
+                    write(b"L" + struct.pack(">Q", len(chunk)) + chunk)
+            write(b"E")
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+    def _ops(self, data, size, signatures):
+        """
+        Yield ``("C", index, count)`` for runs of reusable remote blocks and
+        ``("L", start, end)`` for ranges of ``data`` to send literally.
+        """
+        position, literal, misses, run = 0, 0, 0, None
+        # Number of misses at which to next search between boundaries, and
+        # how many more to wait after that.
+        retry, interval = 0, 1
+        while position + size <= len(data):
+            block = data[position:position + size]
+            weak = zlib.adler32(block) & 0xffffffff
+            index = self._lookup(signatures, weak, block)
+            if index is None and misses == retry:
+                position, index = self._roll(
+                    data, position, size, weak, signatures
+                )
+                if index is None:
+                    if misses + 1 < self.give_up:
+                        retry += 1
+                    else:
+                        retry += interval
+                        interval = min(interval * 2, self.retry_interval)
+            if index is None:
+                position += size
+                misses += 1
+                continue
+            misses, retry, interval = 0, 0, 1
+            if literal < position:
+                if run:
+                    yield ("C",) + run
+                    run = None
+                yield ("L", literal, position)
+            if run and run[0] + run[1] == index:
+                run = (run[0], run[1] + 1)
+            else:
+                if run:
+                    yield ("C",) + run
+                run = (index, 1)
+            position += size
+            literal = position
+        if run:
+            yield ("C",) + run
+        if literal < len(data):
+            yield ("L", literal, len(data))
+
+    def _roll(self, data, position, size, weak, signatures):
+        # Slide the window forward a byte at a time (up to a block's worth),
+        # updating the Adler-32 checksum incrementally, until it matches a
+        # remote block. Returns the new position and the block's index (or
+        # None, with the original position, if nothing matched.)
+        a, b = weak & 0xffff, weak >> 16
+        end = min(position + size, len(data) - size)
+        for start in range(position, end):
+            old, new = data[start], data[start + size]
+            if not isinstance(old, int):  # Python 2
+                old, new = ord(old), ord(new)
+            a = (a - old + new) % 65521
+            b = (b - size * old + a - 1) % 65521
+            if (b << 16 | a) in signatures:
+                block = data[start + 1:start + 1 + size]
+                index = self._lookup(signatures, b << 16 | a, block)
+                if index is not None:
+                    return start + 1, index
+        return position, None
+
+    @staticmethod
+    def _lookup(signatures, weak, block):
+        candidates = signatures.get(weak)
+        if not candidates:
+            return None
+        return candidates.get(hashlib.sha256(block).hexdigest())
+
 
 class Result(object):
     """
@@ -251,13 +1510,28 @@ class Result(object):
         `fabric.runners.Result` (which have a concept of "warn and return
         anyways on failure") this class has no useful truthiness behavior. If a
         file transfer fails, some exception will be raised, either an `OSError`
-        or an error from within Paramiko.
+        or an error from within Paramiko - or, for transfers performed by a
+        remote command, a `.TransferFailed` (carrying the result.)
 
     .. versionadded:: 2.0
+    .. versionchanged:: 2.1
+        Added the ``method``, ``exited``, ``stderr`` and ``skipped``
+        attributes.
     """
     # TODO: how does this differ from put vs get? field stating which? (feels
     # meh) distinct classes differing, for now, solely by name? (also meh)
-    def __init__(self, local, orig_local, remote, orig_remote, connection):
+    def __init__(
+        self,
+        local,
+        orig_local,
+        remote,
+        orig_remote,
+        connection,
+        method="sftp",
+        exited=None,
+        stderr="",
+        skipped=False,
+    ):
         #: The local path the file was saved as, or the object it was saved
         #: into if a file-like object was given instead.
         #:
@@ -275,6 +1549,18 @@ class Result(object):
         self.orig_remote = orig_remote
         #: The `.Connection` object this result was obtained from.
         self.connection = connection
+        #: How the transfer was performed, e.g. ``"sftp"`` or ``"tar"``.
+        self.method = method
+        #: Exit status of the remote command which performed the transfer,
+        #: or ``None`` if there was none (as with SFTP.)
+        self.exited = exited
+        #: Error output of the remote command which performed the transfer,
+        #: if any.
+        self.stderr = stderr
+        #: Whether the transfer was skipped, the destination already matching
+        #: the source (see the ``skip_unchanged`` argument to `.Transfer.put`
+        #: and `.Transfer.get`.)
+        self.skipped = skipped
 
     # TODO: ensure str/repr makes it easily differentiable from run() or
     # local() result objects (and vice versa).
@@ -1,7 +1,13 @@
+from collections import deque
+import errno
 from itertools import chain, repeat
 from io import BytesIO
 import os
+import posixpath
 import re
+import shutil
+import socket
+from subprocess import PIPE, STDOUT, Popen
 import sys
 
 from mock import patch, Mock, PropertyMock, call, ANY
@@ -9,7 +15,26 @@ from pytest_relaxed import trap
 
 from fabric import Connection as Connection_, Config as Config_
 from fabric.main import program as fab_program
-from paramiko import SSHConfig
+from paramiko import SFTPAttributes, SFTPClient, SSHConfig
+from paramiko.message import Message
+from paramiko.sftp import (
+    CMD_ATTRS,
+    CMD_CLOSE,
+    CMD_DATA,
+    CMD_FSETSTAT,
+    CMD_HANDLE,
+    CMD_MKDIR,
+    CMD_OPEN,
+    CMD_READ,
+    CMD_STAT,
+    CMD_STATUS,
+    CMD_WRITE,
+    SFTP_FAILURE,
+    SFTP_FLAG_WRITE,
+    SFTP_EOF,
+    SFTP_NO_SUCH_FILE,
+    SFTP_OK,
+)
 
 
 support = os.path.join(os.path.abspath(os.path.dirname(__file__)), "_support")
@@ -374,6 +399,8 @@ class MockSFTP(object):
         # Not super clear to me why the 'wraps' functionality in mock isn't
         # working for this :(
         mock_os.path.basename.side_effect = os.path.basename
+        # Local paths are files, not directories, unless tests say otherwise.
+        mock_os.path.isdir.return_value = False
         # Return the sftp and OS mocks for use by decorator use case.
         return sftp, mock_os
 
@@ -382,6 +409,201 @@ class MockSFTP(object):
         self.client_patcher.stop()
 
 
+class LocalSFTP(object):
+    """
+    Stand-in SFTP client serving (as its ``/``) a local directory.
+
+    Implements the asynchronous request machinery used by `fabric.transfer`
+    for pipelining, plus the few synchronous methods it also calls. Requests
+    are carried out as soon as they're sent, their responses being handed
+    back, in order, as they're read; ``most_outstanding`` records the
+    largest number of requests awaiting responses at any one time.
+    """
+
+    # Reuse the real status handling (bypassing unbound-method checks.)
+    _convert_status = SFTPClient.__dict__["_convert_status"]
+
+    def __init__(self, root):
+        self.root = root
+        self.responses = deque()
+        self.handles = {}
+        self.count = 0
+        self.most_outstanding = 0
+
+    def _local(self, path):
+        return os.path.join(self.root, *path.strip("/").split("/"))
+
+    def getcwd(self):
+        return "/"
+
+    def normalize(self, path):
+        return posixpath.normpath(posixpath.join("/", path))
+
+    def stat(self, path):
+        return SFTPAttributes.from_stat(os.stat(self._local(path)))
+
+    def put(self, localpath, remotepath):
+        shutil.copyfile(localpath, self._local(remotepath))
+
+    def get(self, remotepath, localpath):
+        shutil.copyfile(self._local(remotepath), localpath)
+
+    def chmod(self, path, mode):
+        os.chmod(self._local(path), mode)
+
+    def utime(self, path, times):
+        os.utime(self._local(path), times)
+
+    def listdir_attr(self, path):
+        path = self._local(path)
+        return [
+            SFTPAttributes.from_stat(os.lstat(os.path.join(path, x)), x)
+            for x in os.listdir(path)
+        ]
+
+    def _async_request(self, fileobj, t, *args):
+        num = self.count
+        self.count += 1
+        msg = Message()
+        try:
+            t = self._perform(t, msg, *args)
+        except EOFError:
+            msg = Message()
+            t = self._status(msg, SFTP_EOF)
+        except (IOError, OSError) as e:
+            msg = Message()
+            code = SFTP_NO_SUCH_FILE if e.errno == errno.ENOENT else None
+            t = self._status(msg, code or SFTP_FAILURE, str(e))
+        self.responses.append((fileobj, num, t, msg.asbytes()))
+        self.most_outstanding = max(self.most_outstanding, len(self.responses))
+        return num
+
+    def _read_response(self, waitfor=None):
+        fileobj, num, t, data = self.responses.popleft()
+        fileobj._async_response(t, Message(data), num)
+        return None, None
+
+    def _status(self, msg, code, text=""):
+        msg.add_int(code)
+        msg.add_string(text)
+        msg.add_string("")
+        return CMD_STATUS
+
+    def _perform(self, t, msg, *args):
+        if t == CMD_MKDIR:
+            os.mkdir(self._local(args[0]), args[1].st_mode or 0o777)
+        elif t == CMD_STAT:
+            self.stat(args[0])._pack(msg)
+            return CMD_ATTRS
+        elif t == CMD_OPEN:
+            path, flags, _ = args
+            mode = "wb" if flags & SFTP_FLAG_WRITE else "rb"
+            handle = str(len(self.handles)).encode()
+            self.handles[handle] = open(self._local(path), mode)
+            msg.add_string(handle)
+            return CMD_HANDLE
+        elif t == CMD_WRITE:
+            fd = self.handles[args[0]]
+            fd.seek(args[1])
+            fd.write(args[2])
+        elif t == CMD_READ:
+            fd = self.handles[args[0]]
+            fd.seek(args[1])
+            data = fd.read(args[2])
+            if not data:
+                raise EOFError
+            msg.add_string(data)
+            return CMD_DATA
+        elif t == CMD_FSETSTAT:
+            os.chmod(self.handles[args[0]].name, args[1].st_mode)
+        elif t == CMD_CLOSE:
+            self.handles[args[0]].close()
+        else:
+            raise IOError("Unsupported request type {}".format(t))
+        return self._status(msg, SFTP_OK)
+
+
+class LocalExecChannel(object):
+    """
+    Stand-in exec channel which runs its command locally, from ``cwd``.
+
+    Covers the bits of `paramiko.channel.Channel` used by `fabric.transfer`
+    for streaming transfers through a remote command.
+    """
+
+    def __init__(self, cwd):
+        self.cwd = cwd
+        self.combine = False
+        self.command = None
+        self.process = None
+        self.eof_received = False
+        self.closed = False
+        self.written = 0
+
+    def set_combine_stderr(self, combine):
+        self.combine = combine
+
+    def exec_command(self, command):
+        self.command = command
+        self.process = Popen(
+            command,
+            shell=True,
+            cwd=self.cwd,
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=STDOUT if self.combine else PIPE,
+        )
+
+    def makefile(self, mode):
+        # Doubles as its own file object, in either direction.
+        return self
+
+    def read(self, size):
+        data = self.process.stdout.read(size)
+        if not data:
+            self.eof_received = True
+        return data
+
+    def write(self, data):
+        self.written += len(data)
+        self._writing(self.process.stdin.write, data)
+
+    def flush(self):
+        self._writing(self.process.stdin.flush)
+
+    def _writing(self, method, *args):
+        try:
+            method(*args)
+        except (IOError, OSError):
+            # Like a real channel: the command ended, and took it with it.
+            self.process.wait()
+            self.closed = True
+            raise socket.error("Socket is closed")
+
+    def recv(self, nbytes):
+        return os.read(self.process.stdout.fileno(), nbytes)
+
+    def recv_stderr(self, nbytes):
+        return os.read(self.process.stderr.fileno(), nbytes)
+
+    def shutdown_write(self):
+        try:
+            self.process.stdin.close()
+        except (IOError, OSError):  # Broken pipe flushing leftovers
+            pass
+
+    def recv_exit_status(self):
+        return self.process.wait()
+
+    def close(self):
+        if self.process is not None:
+            self.shutdown_write()
+            self.process.wait()
+            self.process.stdout.close()
+            if self.process.stderr is not None:
+                self.process.stderr.close()
+
+
 # Locally override Connection, Config with versions that supply a dummy
 # SSHConfig and thus don't load any test-running user's own ssh_config files.
 # TODO: find a cleaner way to do this, though I don't really see any that isn't
@@ -197,3 +197,21 @@ class ssh_config_loading:
             c.set_runtime_ssh_path(self._runtime_path)
             c.load_ssh_config()
             method.assert_called_once_with(self._runtime_path)
+
+    class cloning:
+
+        def does_not_reload_files(self):
+            c = Config(runtime_ssh_path=self._runtime_path)
+            rules = list(c.base_ssh_config._config)
+            with patch.object(Config, "_load_ssh_file") as method:
+                new = c.clone()
+            assert not method.called
+            assert c.base_ssh_config._config == rules
+            assert new.base_ssh_config._config == rules
+
+        @patch.object(Config, "_load_ssh_file")
+        def loads_files_not_yet_loaded(self, method):
+            c = Config(lazy=True)
+            c.set_runtime_ssh_path(self._runtime_path)
+            c.clone()
+            method.assert_called_once_with(self._runtime_path)
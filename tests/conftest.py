@@ -36,7 +36,7 @@ def sftp():
     client, mock_os = mock.start()
     transfer = Transfer(Connection("host"))
     yield transfer, client, mock_os
-    # TODO: old mock_sftp() lacked any 'stop'...why? feels bad man
+    mock.stop()
 
 
 @fixture
@@ -436,6 +436,11 @@ class Connection_:
                     assert middle == Connection("jumpuser2@jumphost2:872")
                     assert outermost == Connection("jumpuser@jumphost:373")
 
+                def hops_share_config(self):
+                    cxn = self._runtime_cxn(basename="proxyjump_multi")
+                    assert cxn.gateway.config is cxn.config
+                    assert cxn.gateway.gateway.config is cxn.config
+
             class connect_timeout:
 
                 def wins_over_default(self):
@@ -771,6 +776,25 @@ class Connection_:
                 # is gonna be a blank dict
                 assert "key_filename" not in kwargs
 
+        def does_not_modify_shared_config(self, client):
+            conf = Config_(
+                runtime_ssh_path=join(
+                    support, "ssh_config", "runtime_identity.conf"
+                ),
+                overrides={
+                    "connect_kwargs": {"key_filename": ["configured.key"]}
+                },
+            )
+            Connection("runtime", config=conf).open()
+            Connection("runtime", config=conf).open()
+            assert conf.connect_kwargs.key_filename == ["configured.key"]
+            expected = [
+                "configured.key",
+                "ssh-config-B.key",
+                "ssh-config-A.key",
+            ]
+            assert client.connect.call_args[1]["key_filename"] == expected
+
     class close:
 
         def has_no_required_args_and_returns_None(self, client):
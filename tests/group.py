@@ -1,9 +1,53 @@
+try:
+    from invoke.vendor.six import StringIO
+except ImportError:
+    from six import StringIO
+
+from array import array
+import json
+import math
+import multiprocessing
+import pickle
+import socket
+from functools import partial
+from threading import Event, Lock
+import time
+
+from invoke.exceptions import UnexpectedExit
+from invoke.config import Config as InvokeConfig
+from paramiko import SSHConfig
+from paramiko.ssh_exception import (
+    AuthenticationException,
+    NoValidConnectionsError,
+    SSHException,
+)
 from mock import Mock, patch, call
+import pytest
 from pytest_relaxed import raises
 
 from fabric import Connection, Group, SerialGroup, ThreadingGroup, GroupResult
-from fabric.group import thread_worker
-from fabric.exceptions import GroupException
+from fabric import Config, ProcessGroup, Result
+from fabric import HostSpec, LazySerialGroup, LazyThreadingGroup
+from fabric import RetryPolicy
+from fabric.group import (
+    Outcome,
+    ResultColumns,
+    Skipped,
+    thread_worker,
+    pool_worker,
+    _connection_spec,
+    _connection_from_spec,
+    _pack,
+    _unpack,
+)
+from fabric.exceptions import (
+    CommandTimedOut,
+    GroupException,
+    HostTimedOut,
+    MapException,
+)
+
+from _util import Session
 
 
 class Group_:
@@ -19,6 +63,43 @@ class Group_:
             assert g[0].host == "foo"
             assert g[1].host == "bar"
 
+        def connections_get_clones_of_one_config(self):
+            g = Group("foo", "bar")
+            assert g[0].config is not g.config
+            assert g[0].config is not g[1].config
+            assert g[1].config == g.config
+
+        def changing_a_connection_config_affects_only_it(self):
+            g = Group("foo", "bar")
+            g[0].config.sudo.password = "secret"
+            assert g[0].config.sudo.password == "secret"
+            assert g[1].config.sudo.password is None
+            assert g.config.sudo.password is None
+
+        def uses_given_config(self):
+            config = Config(overrides={"run": {"echo": True}})
+            g = Group("foo", "bar", config=config)
+            assert g.config is config
+            assert g[1].config.run.echo is True
+
+        def loads_ssh_config_files_once(self):
+            with patch.object(Config, "_load_ssh_files") as load:
+                Group("foo", "bar", "biz")
+            assert load.call_count == 1
+
+        def clones_keep_ssh_config_rules_without_duplicating_them(self):
+            ssh_config = SSHConfig()
+            ssh_config.parse(StringIO("Host foo\n  HostName foo.example\n"))
+            g = Group("foo", "bar", config=Config(ssh_config=ssh_config))
+            assert g[0].host == "foo.example"
+            assert g[1].config.base_ssh_config._config == ssh_config._config
+            assert len(ssh_config._config) == 2
+
+        def clones_vanilla_invoke_config_once(self):
+            g = Group("foo", "bar", config=InvokeConfig())
+            assert isinstance(g.config, Config)
+            assert g[0].config == g[1].config == g.config
+
     class from_connections:
 
         def inits_from_iterable_of_Connections(self):
@@ -40,6 +121,430 @@ class Group_:
         def not_implemented_in_base_class(self):
             Group().run()
 
+    @raises(TypeError)
+    def rejects_unknown_kwargs(self):
+        Group("host1", batch_sise=2)
+
+    class rolling_execution:
+
+        def _cxns(self, count, failing=()):
+            cxns = [Mock(host="host{}".format(x)) for x in range(count)]
+            for index in failing:
+                cxns[index].run.side_effect = Exception("oh no")
+            return cxns
+
+        def _run(self, group):
+            try:
+                return group.run("whatever")
+            except GroupException as e:
+                return e.result
+
+        def runs_everything_by_default(self):
+            for cls in (SerialGroup, ThreadingGroup):
+                cxns = self._cxns(4, failing=(0, 1))
+                result = self._run(cls.from_connections(cxns))
+                assert len(result.failed) == 2
+                assert len(result.succeeded) == 2
+                assert result.skipped == {}
+
+        def batch_size_runs_batches_in_order(self):
+            events = []
+            lock = Lock()
+            cxns = self._cxns(5)
+            for cxn in cxns:
+
+                def tracker(*args, **kwargs):
+                    with lock:
+                        events.append(1)
+                    time.sleep(0.02)
+                    with lock:
+                        events.append(-1)
+
+                cxn.run.side_effect = tracker
+            g = ThreadingGroup.from_connections(cxns, batch_size=2)
+            result = g.run("whatever")
+            assert len(result.succeeded) == 5
+            running = [sum(events[:x]) for x in range(len(events) + 1)]
+            assert max(running) <= 2
+            # Each batch drains completely before the next starts.
+            assert running.count(0) == 4
+
+        def max_failures_count_skips_remaining_batches(self):
+            cxns = self._cxns(5, failing=(0, 1))
+            g = SerialGroup.from_connections(cxns, max_failures=1)
+            result = self._run(g)
+            assert set(result.failed) == set(cxns[:2])
+            assert set(result.skipped) == set(cxns[2:])
+            for cxn in cxns[2:]:
+                assert not cxn.run.called
+                assert isinstance(result[cxn], Skipped)
+                assert result[cxn].reason == "max_failures (1) exceeded"
+            assert result.succeeded == {}
+
+        def max_failures_percentage(self):
+            cxns = self._cxns(10, failing=(0, 1, 2))
+            g = SerialGroup.from_connections(cxns, max_failures="20%")
+            result = self._run(g)
+            assert len(result.failed) == 3
+            assert len(result.skipped) == 7
+
+        def max_failures_stops_concurrency_pool_mid_batch(self):
+            def succeed(*args, **kwargs):
+                time.sleep(0.05)
+
+            def fail(*args, **kwargs):
+                time.sleep(0.05)
+                raise Exception("oh no")
+
+            cxns = self._cxns(6)
+            for index, cxn in enumerate(cxns):
+                cxn.run.side_effect = fail if index < 2 else succeed
+            g = ThreadingGroup.from_connections(
+                cxns, concurrency=1, max_failures=1
+            )
+            result = self._run(g)
+            assert set(result.failed) == set(cxns[:2])
+            # The worker may already have started the host after the limit
+            # was hit, but no others.
+            assert set(result.skipped) == set(cxns[3:])
+            for cxn in cxns[3:]:
+                assert not cxn.run.called
+                assert result[cxn].reason == "max_failures (1) exceeded"
+
+        def failures_within_threshold_continue(self):
+            cxns = self._cxns(5, failing=(0,))
+            g = ThreadingGroup.from_connections(
+                cxns, batch_size=2, max_failures=1
+            )
+            result = self._run(g)
+            assert len(result.succeeded) == 4
+            assert result.skipped == {}
+
+        def canary_failure_skips_everything_else(self):
+            cxns = self._cxns(4, failing=(0,))
+            g = ThreadingGroup.from_connections(cxns, canary=1)
+            result = self._run(g)
+            assert list(result.failed) == [cxns[0]]
+            assert set(result.skipped) == set(cxns[1:])
+            assert result[cxns[1]].reason == "canary failed"
+
+        def canary_success_continues(self):
+            cxns = self._cxns(4)
+            g = ThreadingGroup.from_connections(cxns, canary=2, batch_size=1)
+            result = g.run("whatever")
+            assert len(result.succeeded) == 4
+
+        def may_be_configured(self):
+            cxns = self._cxns(4, failing=(0,))
+            g = SerialGroup.from_connections(cxns)
+            g.config = Config(overrides={"group": {"max_failures": 0}})
+            result = self._run(g)
+            assert len(result.skipped) == 3
+
+        def close_ignores_batching(self):
+            cxns = self._cxns(3)
+            cxns[0].close.side_effect = Exception("oh no")
+            g = SerialGroup.from_connections(cxns, canary=1)
+            try:
+                g.close()
+            except GroupException as e:
+                result = e.result
+            else:
+                assert False, "Did not raise GroupException!"
+            assert len(result.succeeded) == 2
+            for cxn in cxns:
+                cxn.close.assert_called_once_with()
+
+    class coalescing:
+
+        def _group(self, *cxns, **kwargs):
+            for cxn in cxns:
+                cxn.run = Mock(return_value=cxn.host)
+            return ThreadingGroup.from_connections(cxns, **kwargs)
+
+        def off_by_default(self):
+            cxns = (Connection("web1"), Connection("web1"))
+            self._group(*cxns).run("whatever")
+            for cxn in cxns:
+                cxn.run.assert_called_once_with("whatever")
+
+        def runs_once_per_identity(self):
+            ssh_config = SSHConfig()
+            ssh_config.parse(StringIO("Host w1\n  HostName web1\n"))
+            alias = Connection("w1", config=Config(ssh_config=ssh_config))
+            cxns = (
+                Connection("web1"),
+                Connection("web2"),
+                Connection("web1"),
+                alias,
+            )
+            g = self._group(*cxns, coalesce=True)
+            result = g.run("whatever")
+            cxns[0].run.assert_called_once_with("whatever")
+            cxns[1].run.assert_called_once_with("whatever")
+            assert not cxns[2].run.called
+            assert not alias.run.called
+            for cxn in cxns:
+                assert result[cxn] == cxn.host
+            assert len(result) == 2
+
+        def may_be_configured(self):
+            cxns = (Connection("web1"), Connection("web1"))
+            g = self._group(*cxns)
+            g.config = Config(overrides={"group": {"coalesce": True}})
+            g.run("whatever")
+            assert not cxns[1].run.called
+
+        def max_failures_percentage_ignores_duplicates(self):
+            cxns = [Connection("web{}".format(x)) for x in (1, 1, 1, 2, 3)]
+            for cxn in cxns:
+                cxn.run = Mock(side_effect=Exception("oh no"))
+            g = SerialGroup.from_connections(
+                cxns, coalesce=True, max_failures="50%"
+            )
+            with pytest.raises(GroupException) as info:
+                g.run("whatever")
+            result = info.value.result
+            # 2 of 3 distinct hosts failed; web3 is never reached.
+            assert isinstance(result[cxns[4]], Skipped)
+
+        def close_still_closes_everything(self):
+            cxns = (Connection("web1"), Connection("web1"))
+            for cxn in cxns:
+                cxn.close = Mock()
+            self._group(*cxns, coalesce=True).close()
+            for cxn in cxns:
+                cxn.close.assert_called_once_with()
+
+    class run_iter:
+
+        def _cxns(self, *delays):
+            cxns = []
+            for index, delay in enumerate(delays):
+                cxn = Mock(host="host{}".format(index))
+
+                def run(*args, **kwargs):
+                    time.sleep(kwargs.pop("delay"))
+                    return kwargs
+
+                cxn.run.side_effect = partial(run, delay=delay)
+                cxns.append(cxn)
+            return cxns
+
+        def serial_yields_lazily_in_order(self):
+            cxns = self._cxns(0, 0)
+            pairs = SerialGroup.from_connections(cxns).run_iter("whatever")
+            cxn, value = next(pairs)
+            assert cxn is cxns[0]
+            assert not cxns[1].run.called
+            assert [x[0] for x in pairs] == [cxns[1]]
+
+        def threading_yields_in_order_of_completion(self):
+            cxns = self._cxns(0.3, 0)
+            g = ThreadingGroup.from_connections(cxns)
+            start = time.time()
+            pairs = g.run_iter("whatever", hide=True)
+            cxn, value = next(pairs)
+            assert cxn is cxns[1]
+            assert value == {"hide": True}
+            assert time.time() - start < 0.25
+            assert [x[0] for x in pairs] == [cxns[0]]
+
+        def pooled_threads_also_stream(self):
+            cxns = self._cxns(0.3, 0, 0)
+            g = ThreadingGroup.from_connections(cxns, concurrency=2)
+            order = [x[0] for x in g.run_iter("whatever")]
+            assert order[-1] is cxns[0]
+            assert set(order) == set(cxns)
+
+        def closing_early_stops_pooled_workers(self):
+            cxns = self._cxns(*[0.05] * 10)
+            g = ThreadingGroup.from_connections(cxns, concurrency=2)
+            pairs = g.run_iter("whatever")
+            next(pairs)
+            pairs.close()
+            # At most the other in-flight host, plus one more picked up by
+            # the worker which finished first.
+            assert sum(x.run.called for x in cxns) <= 4
+
+        def exceptions_are_yielded_not_raised(self):
+            for kwargs in ({}, {"concurrency": 1}):
+                cxns = self._cxns(0, 0)
+                onoz = Exception("oh no")
+                cxns[0].run.side_effect = onoz
+                g = ThreadingGroup.from_connections(cxns, **kwargs)
+                assert dict(g.run_iter("whatever"))[cxns[0]] is onoz
+
+        def honors_rolling_execution(self):
+            cxns = self._cxns(0, 0, 0)
+            cxns[0].run.side_effect = Exception("oh no")
+            g = ThreadingGroup.from_connections(cxns, canary=1)
+            values = dict(g.run_iter("whatever"))
+            assert isinstance(values[cxns[1]], Skipped)
+            assert isinstance(values[cxns[2]], Skipped)
+            assert not cxns[1].run.called
+
+        @raises(NotImplementedError)
+        def not_implemented_in_base_class(self):
+            list(Group("host1").run_iter("whatever"))
+
+    class get:
+
+        def _group(self):
+            g = Group("host1", "host2")
+            g._do = Mock()
+            return g
+
+        def defaults_local_to_per_host_directory(self):
+            g = self._group()
+            g.get("remote/file")
+            g._do.assert_called_once_with(
+                "get", "remote/file", local="{host}/"
+            )
+
+        def explicit_local_is_left_alone(self):
+            g = self._group()
+            g.get("remote/file", "local/")
+            g._do.assert_called_once_with("get", "remote/file", "local/")
+            g = self._group()
+            g.get("remote/file", local="{host}.log")
+            g._do.assert_called_once_with(
+                "get", "remote/file", local="{host}.log"
+            )
+
+
+    class retries:
+
+        def _group(self, *failures, **kwargs):
+            # Each Mock connection raises its given errors in turn, then
+            # succeeds.
+            cxns = []
+            for index, errors in enumerate(failures):
+                cxn = Mock(name="host{}".format(index))
+                cxn.open.side_effect = list(errors) + [None] * 10
+                cxns.append(cxn)
+            kwargs.setdefault("retry", RetryPolicy(backoff=0))
+            return SerialGroup.from_connections(cxns, **kwargs)
+
+        def off_by_default(self):
+            g = self._group([SSHException()], retry=None)
+            g[0].run.side_effect = SSHException()
+            with pytest.raises(GroupException):
+                g.run("whatever")
+            assert g[0].run.call_count == 1
+            # Not even opened separately
+            assert not g[0].open.called
+
+        def connections_failing_transiently_are_retried(self):
+            g = self._group([SSHException(), SSHException()], [])
+            result = g.run("whatever")
+            assert g[0].open.call_count == 3
+            assert g[1].open.call_count == 1
+            assert result == {x: x.run.return_value for x in g}
+
+        def retries_are_limited_by_attempts(self):
+            g = self._group(
+                [SSHException()] * 5, retry=RetryPolicy(attempts=2, backoff=0)
+            )
+            with pytest.raises(GroupException) as info:
+                g.run("whatever")
+            assert g[0].open.call_count == 2
+            assert isinstance(info.value.result[g[0]], SSHException)
+            assert not g[0].run.called
+
+        def other_errors_are_not_retried(self):
+            g = self._group([AuthenticationException()])
+            with pytest.raises(GroupException):
+                g.run("whatever")
+            assert g[0].open.call_count == 1
+
+        def waits_between_rounds(self):
+            g = self._group([SSHException()])
+            g._retry.delay = Mock(return_value=0)
+            g.run("whatever")
+            g._retry.delay.assert_called_once_with(1)
+
+        def connections_are_opened_only_as_workers_reach_them(self):
+            lock = Lock()
+            state = {"open": 0, "most": 0}
+
+            def open_():
+                with lock:
+                    state["open"] += 1
+                    state["most"] = max(state["most"], state["open"])
+
+            def run(*args, **kwargs):
+                time.sleep(0.01)
+                with lock:
+                    state["open"] -= 1
+
+            cxns = [Mock(name="host{}".format(x)) for x in range(6)]
+            for cxn in cxns:
+                cxn.open.side_effect = open_
+                cxn.run.side_effect = run
+            g = ThreadingGroup.from_connections(
+                cxns, concurrency=2, retry=RetryPolicy(backoff=0)
+            )
+            g.run("whatever")
+            assert state["most"] <= 2
+            for cxn in cxns:
+                cxn.open.assert_called_once_with()
+
+        def operations_retried_only_when_idempotent(self):
+            for idempotent, calls in ((False, 1), (True, 2)):
+                g = self._group(
+                    [],
+                    retry=RetryPolicy(backoff=0, idempotent=idempotent),
+                )
+                g[0].run.side_effect = [socket.timeout(), "ok"]
+                try:
+                    g.run("whatever")
+                except GroupException:
+                    pass
+                assert g[0].run.call_count == calls
+
+        def tripped_hosts_are_not_retried(self):
+            policy = RetryPolicy(backoff=0, attempts=10, trip_after=3)
+            g = self._group([SSHException()] * 10, retry=policy)
+            with pytest.raises(GroupException):
+                g.run("whatever")
+            assert g[0].open.call_count == 3
+            # Stays tripped for later operations
+            with pytest.raises(GroupException):
+                g.run("whatever")
+            assert g[0].open.call_count == 4
+
+        def policy_may_come_from_config_as_dict(self):
+            g = self._group([SSHException()], retry=None)
+            g.config = Config(
+                overrides={"group": {"retry": {"backoff": 0}}}
+            )
+            g.run("whatever")
+            assert g[0].open.call_count == 2
+            assert isinstance(g._retry, RetryPolicy)
+
+        def run_iter_retries_too(self):
+            policy = RetryPolicy(backoff=0, idempotent=True)
+            g = self._group([], [], retry=policy)
+            g[0].run.side_effect = [SSHException(), "ok"]
+            g = ThreadingGroup.from_connections(g, retry=policy)
+            pairs = list(g.run_iter("whatever"))
+            # The connection needing no retry comes back first.
+            assert pairs == [(g[1], g[1].run.return_value), (g[0], "ok")]
+
+    class map:
+
+        @raises(NotImplementedError)
+        def is_abstract(self):
+            Group("host1").map(Mock(), [1])
+
+        @raises(ValueError)
+        def requires_connections_when_given_items(self):
+            SerialGroup().map(Mock(), [1])
+
+        def empty_items_are_fine(self):
+            assert SerialGroup().map(Mock(), []) == []
+
 
 def _make_serial_tester(cxns, index, args, kwargs):
     args = args[:]
@@ -111,6 +616,77 @@ class SerialGroup_:
             assert result.succeeded == expected
             assert result.failed == {}
 
+    class other_methods:
+
+        def _check(self, method, *args, **kwargs):
+            cxns = [Mock(name=x) for x in ("host1", "host2")]
+            g = SerialGroup.from_connections(cxns)
+            result = getattr(g, method)(*args, **kwargs)
+            for cxn in cxns:
+                getattr(cxn, method).assert_called_once_with(*args, **kwargs)
+            expected = {x: getattr(x, method).return_value for x in cxns}
+            assert result == expected
+
+        def sudo(self):
+            self._check("sudo", "whoami", hide=True)
+
+        def put(self):
+            self._check("put", "local/file", remote="/tmp/")
+
+        def get(self):
+            self._check("get", "remote/file", local="{host}/")
+
+        def close(self):
+            self._check("close")
+
+
+    class map:
+
+        def _fn(self, calls, fails=()):
+            def fn(cxn, item):
+                calls.append((cxn.host, item))
+                if (cxn.host, item) in fails:
+                    raise OhNoz(item)
+                return item * 10
+
+            return fn
+
+        def returns_values_in_item_order(self):
+            calls = []
+            g = SerialGroup("host1", "host2")
+            assert g.map(self._fn(calls), [1, 2, 3]) == [10, 20, 30]
+            assert calls == [("host1", 1), ("host2", 2), ("host1", 3)]
+
+        def retries_failed_items_on_other_connections(self):
+            calls = []
+            g = SerialGroup("host1", "host2", "host3")
+            fn = self._fn(calls, fails={("host1", 1), ("host2", 1)})
+            assert g.map(fn, [1]) == [10]
+            assert calls == [("host1", 1), ("host2", 1), ("host3", 1)]
+
+        def raises_MapException_when_items_fail_everywhere(self):
+            calls = []
+            g = SerialGroup("host1", "host2")
+            fn = self._fn(calls, fails={("host1", 2), ("host2", 2)})
+            with pytest.raises(MapException) as info:
+                g.map(fn, [1, 2, 3])
+            error = info.value
+            assert list(error.failed) == [1]
+            assert isinstance(error.failed[1], OhNoz)
+            assert error.results == [10, error.failed[1], 30]
+
+        def attempts_limits_retries(self):
+            calls = []
+            g = SerialGroup("host1", "host2")
+            fn = self._fn(calls, fails={("host1", 1)})
+            with pytest.raises(MapException):
+                g.map(fn, [1], attempts=1)
+            assert calls == [("host1", 1)]
+
+
+class OhNoz(Exception):
+    pass
+
 
 class ThreadingGroup_:
 
@@ -142,6 +718,7 @@ class ThreadingGroup_:
                     kwargs=dict(
                         cxn=cxn,
                         queue=queue,
+                        method="run",
                         args=self.args,
                         kwargs=self.kwargs,
                     ),
@@ -227,3 +804,907 @@ class ThreadingGroup_:
             assert result == expected
             assert result.succeeded == expected
             assert result.failed == {}
+
+        class output_multiplexing:
+
+            def _group(self, **output):
+                cxns = [
+                    Mock(host=x, user="me", port=22) for x in ("web1", "web2")
+                ]
+                g = ThreadingGroup.from_connections(cxns)
+                output.setdefault("multiplex", True)
+                g.config = Config(overrides={"group": {"output": output}})
+                return g, cxns
+
+            def off_by_default(self):
+                cxns = [Mock(host=x) for x in ("host1", "host2")]
+                g = ThreadingGroup.from_connections(cxns)
+                g.run("whatever")
+                for cxn in cxns:
+                    cxn.run.assert_called_once_with("whatever")
+
+            def routes_streams_through_prefixed_sources(self):
+                g, cxns = self._group(prefix="{user}@{host}: ")
+                g.run("whatever")
+                for cxn in cxns:
+                    kwargs = cxn.run.call_args[1]
+                    for name in ("out_stream", "err_stream"):
+                        prefix = kwargs[name].source.prefix
+                        assert prefix == "me@{}: ".format(cxn.host)
+
+            def leaves_hidden_streams_alone(self):
+                g, cxns = self._group()
+                g.run("whatever", hide="stderr")
+                kwargs = cxns[0].run.call_args[1]
+                assert "out_stream" in kwargs
+                assert "err_stream" not in kwargs
+
+            def leaves_explicit_streams_alone(self):
+                g, cxns = self._group()
+                mine = Mock()
+                g.run("whatever", out_stream=mine)
+                kwargs = cxns[0].run.call_args[1]
+                assert kwargs["out_stream"] is mine
+                assert "err_stream" in kwargs
+
+            def writes_line_coherent_output(self):
+                g, cxns = self._group()
+
+                def chatty(*args, **kwargs):
+                    kwargs["out_stream"].write("par")
+                    kwargs["out_stream"].write("tial\n")
+
+                for cxn in cxns:
+                    cxn.run.side_effect = chatty
+                with patch("sys.stdout") as stdout:
+                    g.run("whatever")
+                written = "".join(x[0][0] for x in stdout.write.call_args_list)
+                assert sorted(written.splitlines()) == [
+                    "[web1] partial",
+                    "[web2] partial",
+                ]
+
+        class time_limits:
+
+            def _cxns(self, *delays):
+                # Each host "runs" until its delay passes or it's closed.
+                def run(closed, delay, *args, **kwargs):
+                    closed.wait(delay)
+
+                cxns = []
+                for index, delay in enumerate(delays):
+                    cxn = Mock(host="host{}".format(index))
+                    closed = Event()
+                    cxn.close.side_effect = closed.set
+                    cxn.run.side_effect = partial(run, closed, delay)
+                    cxns.append(cxn)
+                return cxns
+
+            def _run(self, group):
+                try:
+                    return group.run("whatever")
+                except GroupException as e:
+                    return e.result
+
+            def off_by_default(self):
+                cxns = self._cxns(0.1, 0)
+                result = ThreadingGroup.from_connections(cxns).run("whatever")
+                assert len(result.succeeded) == 2
+                assert not cxns[0].close.called
+
+            def host_timeout_gives_up_on_stragglers(self):
+                cxns = self._cxns(0, 5, 0)
+                g = ThreadingGroup.from_connections(cxns, host_timeout=0.1)
+                start = time.time()
+                result = self._run(g)
+                assert time.time() - start < 1
+                assert set(result.succeeded) == {cxns[0], cxns[2]}
+                error = result.failed[cxns[1]]
+                assert isinstance(error, HostTimedOut)
+                assert error.setting == "host_timeout"
+                assert error.timeout == 0.1
+                assert error.started
+                cxns[1].close.assert_called_once_with()
+                assert not cxns[0].close.called
+
+            def host_timeout_counts_from_host_start_when_pooled(self):
+                cxns = self._cxns(0.1, 0.1, 0.1)
+                g = ThreadingGroup.from_connections(
+                    cxns, concurrency=1, host_timeout=0.2
+                )
+                result = g.run("whatever")
+                assert len(result.succeeded) == 3
+
+            def deadline_skips_unstarted_pooled_hosts(self):
+                cxns = self._cxns(0, 5, 0)
+                g = ThreadingGroup.from_connections(
+                    cxns, concurrency=1, deadline=0.1
+                )
+                result = self._run(g)
+                assert list(result.succeeded) == [cxns[0]]
+                running, pending = result[cxns[1]], result[cxns[2]]
+                assert running.setting == pending.setting == "deadline"
+                assert running.started
+                assert not pending.started
+                assert "before this host was started" in str(pending)
+                assert not cxns[2].run.called
+
+            def may_be_configured(self):
+                cxns = self._cxns(5, 0)
+                g = ThreadingGroup.from_connections(cxns)
+                g.config = Config(overrides={"group": {"deadline": 0.1}})
+                result = self._run(g)
+                assert isinstance(result[cxns[0]], HostTimedOut)
+
+            def applies_to_run_iter(self):
+                cxns = self._cxns(5, 0)
+                g = ThreadingGroup.from_connections(cxns, host_timeout=0.1)
+                pairs = list(g.run_iter("whatever"))
+                assert pairs[0][0] is cxns[1]
+                assert pairs[1][0] is cxns[0]
+                assert isinstance(pairs[1][1], HostTimedOut)
+
+        class concurrency:
+
+            def _cxns(self, count):
+                state = {"current": 0, "peak": 0}
+                lock = Lock()
+
+                def tracker(*args, **kwargs):
+                    with lock:
+                        state["current"] += 1
+                        state["peak"] = max(state["peak"], state["current"])
+                    time.sleep(0.02)
+                    with lock:
+                        state["current"] -= 1
+
+                cxns = [Mock(host="host{}".format(x)) for x in range(count)]
+                for cxn in cxns:
+                    cxn.run.side_effect = tracker
+                return cxns, state
+
+            def limits_simultaneous_connections(self):
+                cxns, state = self._cxns(8)
+                g = ThreadingGroup.from_connections(cxns, concurrency=2)
+                result = g.run("whatever")
+                assert state["peak"] <= 2
+                assert set(result) == set(cxns)
+                for cxn in cxns:
+                    cxn.run.assert_called_once_with("whatever")
+
+            @patch("fabric.group.ExceptionHandlingThread")
+            def uses_fixed_number_of_threads(self, Thread):
+                Thread.return_value.exception.return_value = None
+                cxns = [Mock(host=x) for x in ("host1", "host2", "host3")]
+                g = ThreadingGroup.from_connections(cxns, concurrency=2)
+                g.run("whatever")
+                assert Thread.call_count == 2
+                for call_ in Thread.call_args_list:
+                    assert call_[1]["target"] is pool_worker
+
+            def may_be_set_via_config(self):
+                cxns, state = self._cxns(6)
+                g = ThreadingGroup.from_connections(cxns)
+                g.config = Config(overrides={"group": {"concurrency": 3}})
+                assert g.concurrency == 3
+                g.run("whatever")
+                assert state["peak"] <= 3
+
+            def errors_are_captured_per_connection(self):
+                cxns, _ = self._cxns(4)
+
+                class OhNoz(Exception):
+                    pass
+
+                onoz = OhNoz()
+                cxns[1].run.side_effect = onoz
+                g = ThreadingGroup.from_connections(cxns, concurrency=2)
+                try:
+                    g.run("whatever")
+                except GroupException as e:
+                    result = e.result
+                else:
+                    assert False, "Did not raise GroupException!"
+                assert result.failed == {cxns[1]: onoz}
+                assert len(result.succeeded) == 3
+
+    class other_methods:
+
+        def _check(self, method, *args, **kwargs):
+            cxns = [Mock(host=x) for x in ("host1", "host2", "host3")]
+            g = ThreadingGroup.from_connections(cxns)
+            result = getattr(g, method)(*args, **kwargs)
+            for cxn in cxns:
+                getattr(cxn, method).assert_called_once_with(*args, **kwargs)
+            expected = {x: getattr(x, method).return_value for x in cxns}
+            assert result == expected
+
+        def sudo(self):
+            self._check("sudo", "whoami", hide=True)
+
+        def put(self):
+            self._check("put", "local/file", remote="/tmp/")
+
+        def get(self):
+            self._check("get", "remote/file", local="{host}/")
+
+        def close(self):
+            self._check("close")
+
+        def errors_are_captured_per_connection(self):
+            cxns = [Mock(host=x) for x in ("host1", "host2")]
+
+            class OhNoz(Exception):
+                pass
+
+            onoz = OhNoz()
+            cxns[0].put.side_effect = onoz
+            g = ThreadingGroup.from_connections(cxns)
+            try:
+                g.put("local/file")
+            except GroupException as e:
+                result = e.result
+            else:
+                assert False, "Did not raise GroupException!"
+            assert result.failed == {cxns[0]: onoz}
+            assert result.succeeded == {cxns[1]: cxns[1].put.return_value}
+
+        def closes_connections_concurrently(self):
+            cxns = [Mock(host="host{}".format(x)) for x in range(10)]
+            for cxn in cxns:
+                cxn.close.side_effect = lambda: time.sleep(0.1)
+            g = ThreadingGroup.from_connections(cxns)
+            start = time.time()
+            g.close()
+            # Serially, this would take a full second.
+            assert time.time() - start < 0.5
+
+        def transfers_are_not_multiplexed(self):
+            cxns = [Mock(host=x) for x in ("host1", "host2")]
+            g = ThreadingGroup.from_connections(cxns)
+            overrides = {"group": {"output": {"multiplex": True}}}
+            g.config = Config(overrides=overrides)
+            g.put("local/file")
+            g.sudo("whoami")
+            for cxn in cxns:
+                cxn.put.assert_called_once_with("local/file")
+                assert "out_stream" in cxn.sudo.call_args[1]
+
+
+    class map:
+
+        def returns_values_in_item_order(self):
+            g = ThreadingGroup("host1", "host2", "host3")
+            result = g.map(lambda cxn, item: item * 10, range(20))
+            assert result == [x * 10 for x in range(20)]
+
+        def faster_connections_process_more_items(self):
+            counts = {"fast": 0, "slow": 0}
+            lock = Lock()
+
+            def fn(cxn, item):
+                if cxn.host == "slow":
+                    time.sleep(0.05)
+                with lock:
+                    counts[cxn.host] += 1
+                return cxn.host
+
+            g = ThreadingGroup("fast", "slow")
+            g.map(fn, range(20))
+            assert counts["fast"] > counts["slow"]
+            assert sum(counts.values()) == 20
+
+        def retries_failed_items_on_other_connections(self):
+            def fn(cxn, item):
+                if cxn.host == "broken":
+                    raise OhNoz()
+                return cxn.host
+
+            g = ThreadingGroup("broken", "working")
+            assert g.map(fn, range(10)) == ["working"] * 10
+
+        def raises_MapException_when_items_fail_everywhere(self):
+            tried = []
+
+            def fn(cxn, item):
+                if item == 3:
+                    tried.append(cxn.host)
+                    raise OhNoz()
+                return item
+
+            g = ThreadingGroup("host1", "host2", "host3")
+            with pytest.raises(MapException) as info:
+                g.map(fn, range(5))
+            assert list(info.value.failed) == [3]
+            assert info.value.results[:3] == [0, 1, 2]
+            # Tried once on each connection, no more.
+            assert sorted(tried) == ["host1", "host2", "host3"]
+
+        def per_host_concurrency_runs_items_at_once(self):
+            lock = Lock()
+            state = {"live": 0, "most": 0}
+
+            def fn(cxn, item):
+                with lock:
+                    state["live"] += 1
+                    state["most"] = max(state["most"], state["live"])
+                time.sleep(0.02)
+                with lock:
+                    state["live"] -= 1
+
+            g = ThreadingGroup.from_connections([Mock(host="host1")])
+            g.map(fn, range(9), per_host_concurrency=3)
+            assert state["most"] == 3
+
+
+fork_only = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="Mocked remotes only carry over into forked workers",
+)
+
+
+class ProcessGroup_:
+
+    class processes:
+
+        def defaults_to_cpu_count_capped_at_group_size(self):
+            hosts = ["host{}".format(x) for x in range(1000)]
+            assert ProcessGroup(*hosts).processes == min(
+                multiprocessing.cpu_count(), 1000
+            )
+            assert ProcessGroup("host1", "host2").processes <= 2
+
+        def may_be_given_explicitly_or_via_config(self):
+            g = ProcessGroup("host1", "host2", "host3", processes=2)
+            assert g.processes == 2
+            g = ProcessGroup("host1", "host2", "host3")
+            g.config = Config(overrides={"group": {"processes": 3}})
+            assert g.processes == 3
+
+    class specs:
+
+        def connections_survive_round_trip(self):
+            config = Config(overrides={"run": {"echo": True}})
+            cxn = Connection(
+                "me@host:2222",
+                config=config,
+                gateway=Connection("jump"),
+                connect_timeout=7,
+            )
+            spec = pickle.loads(pickle.dumps(_connection_spec(cxn)))
+            new = _connection_from_spec(spec)
+            assert new == cxn
+            assert new.connect_timeout == 7
+            assert new.gateway == cxn.gateway
+            assert new.config.run.echo is True
+
+        def shared_configs_are_specced_once(self):
+            g = Group("foo", "bar")
+            memo = {}
+            specs = [_connection_spec(x, memo) for x in g]
+            assert specs[0]["config"] is specs[1]["config"]
+            specs = pickle.loads(pickle.dumps(specs))
+            memo = {}
+            new = [_connection_from_spec(x, memo) for x in specs]
+            assert new[0].config is not new[1].config
+            assert new[0].config == new[1].config
+
+        def changed_configs_get_their_own_specs(self):
+            g = Group("foo", "bar")
+            g[1].config.run.echo = True
+            memo = {}
+            specs = [_connection_spec(x, memo) for x in g]
+            assert specs[0]["config"] is not specs[1]["config"]
+            new = _connection_from_spec(specs[1])
+            assert new.config.run.echo is True
+
+        def key_filenames_are_not_merged_twice(self):
+            ssh_config = SSHConfig()
+            ssh_config.parse(StringIO("Host host\n IdentityFile /keys/id_a"))
+            overrides = {"connect_kwargs": {"key_filename": ["/keys/conf"]}}
+            config = Config(overrides=overrides, ssh_config=ssh_config)
+            cxn = Connection("host", config=config)
+            expected = ["/keys/conf", "/keys/id_a"]
+            assert cxn.connect_kwargs["key_filename"] == expected
+            spec = pickle.loads(pickle.dumps(_connection_spec(cxn)))
+            new = _connection_from_spec(spec)
+            assert new.connect_kwargs["key_filename"] == expected
+
+        def results_are_rebuilt_around_given_connection(self):
+            cxn = Connection("host")
+            result = Result(
+                connection=Connection("elsewhere"),
+                stdout="out\n",
+                command="whatever",
+                exited=3,
+            )
+            packed = pickle.loads(pickle.dumps(_pack(result)))
+            new = _unpack(packed, cxn)
+            assert isinstance(new, Result)
+            assert new.connection is cxn
+            assert new.stdout == "out\n"
+            assert new.command == "whatever"
+            assert new.exited == 3
+
+        def failures_are_rebuilt_with_their_results(self):
+            cxn = Connection("host")
+            result = Result(connection=Connection("elsewhere"), exited=1)
+            error = CommandTimedOut(result, 5)
+            packed = pickle.loads(pickle.dumps(_pack(error)))
+            new = _unpack(packed, cxn)
+            assert isinstance(new, CommandTimedOut)
+            assert new.timeout == 5
+            assert new.result.exited == 1
+            assert new.result.connection is cxn
+
+        def unpicklable_exceptions_are_replaced(self):
+            class Local(Exception):
+                pass
+
+            packed = _pack(Local("oh no"))
+            assert type(packed) is Exception
+            assert str(packed) == "Local: oh no"
+
+    class map:
+
+        @raises(TypeError)
+        def is_unsupported(self):
+            ProcessGroup("host1").map(Mock(), [1])
+
+    @fork_only
+    class execution:
+
+        def _group(self, remote, count, **kwargs):
+            hosts = ["host{}".format(x) for x in range(count)]
+            # The parent's own Connections use up mock clients too, despite
+            # never connecting; workers (forked later) get fresh ones.
+            remote.expect_sessions(*[Session() for _ in hosts])
+            return ProcessGroup(*hosts, **kwargs)
+
+        def _expect(self, remote, count, **session):
+            remote.expect_sessions(*[Session(**session) for _ in range(count)])
+
+        def runs_across_worker_processes(self, remote):
+            g = self._group(remote, 4, processes=2)
+            self._expect(remote, 2, out=b"hello\n")
+            try:
+                result = g.run("whatever", hide=True)
+            finally:
+                g.close()
+            assert len(result) == 4
+            for cxn in g:
+                assert result[cxn].stdout == "hello\n"
+                assert result[cxn].connection is cxn
+
+        def failures_become_GroupExceptions(self, remote):
+            g = self._group(remote, 1)
+            self._expect(remote, 1, exit=1)
+            try:
+                g.run("whatever", hide=True)
+            except GroupException as e:
+                result = e.result
+            else:
+                assert False, "Did not raise GroupException!"
+            finally:
+                g.close()
+            error = result.failed[g[0]]
+            assert isinstance(error, UnexpectedExit)
+            assert error.result.exited == 1
+            assert error.result.connection is g[0]
+
+        def batches_run_subsets_of_each_worker(self, remote):
+            g = self._group(remote, 3, processes=2, batch_size=2)
+            self._expect(remote, 2, out=b"hi\n")
+            try:
+                result = g.run("whatever", hide=True)
+            finally:
+                g.close()
+            assert [result[x].stdout for x in g] == ["hi\n"] * 3
+
+        def close_stops_workers(self, remote):
+            g = self._group(remote, 2, processes=2)
+            self._expect(remote, 1)
+            g.run("whatever", hide=True)
+            processes = [x[2] for x in g._shards]
+            g.close()
+            assert g._shards is None
+            assert not any(x.is_alive() for x in processes)
+
+
+class HostSpec_:
+
+    class init:
+
+        def parses_shorthand(self):
+            spec = HostSpec("user@host:2222")
+            assert spec.host == "host"
+            assert spec.user == "user"
+            assert spec.port == 2222
+
+        def leaves_unspecified_parts_None(self):
+            spec = HostSpec("host")
+            assert spec.user is None
+            assert spec.port is None
+
+        @raises(ValueError)
+        def rejects_user_given_twice(self):
+            HostSpec("user@host", user="other")
+
+        def has_no_instance_dict(self):
+            assert not hasattr(HostSpec("host"), "__dict__")
+
+    def compares_and_hashes_by_host_user_and_port(self):
+        assert HostSpec("user@host") == HostSpec("host", user="user")
+        assert HostSpec("host") != HostSpec("host:2222")
+        assert len({HostSpec("host"), HostSpec("host")}) == 1
+
+    def is_picklable(self):
+        spec = HostSpec("user@host:2222", overrides={"connect_timeout": 5})
+        new = pickle.loads(pickle.dumps(spec))
+        assert new == spec
+        assert new.overrides == {"connect_timeout": 5}
+
+    class materialize:
+
+        def creates_connection_using_given_config(self):
+            config = Config(overrides={"user": "configured"})
+            cxn = HostSpec("host:2222").materialize(config)
+            assert isinstance(cxn, Connection)
+            assert cxn.config is config
+            assert cxn.host == "host"
+            assert cxn.user == "configured"
+            assert cxn.port == 2222
+
+        def applies_overrides(self):
+            spec = HostSpec(
+                "host", overrides={"connect_timeout": 7, "forward_agent": True}
+            )
+            cxn = spec.materialize()
+            assert cxn.connect_timeout == 7
+            assert cxn.forward_agent is True
+
+        def materializes_spec_gateways_with_same_config(self):
+            config = Config()
+            spec = HostSpec("host", gateway=HostSpec("jumpuser@jump"))
+            cxn = spec.materialize(config)
+            assert cxn.gateway == Connection("jumpuser@jump")
+            assert cxn.gateway.config is config
+
+
+class LazyGroup_:
+
+    def _materialized(self):
+        # Records every connection materialized, as a Mock.
+        created = []
+
+        def materialize(spec, config=None):
+            cxn = Mock(name=spec.host)
+            cxn.config = config
+            created.append(cxn)
+            return cxn
+
+        return created, patch.object(HostSpec, "materialize", materialize)
+
+    class init:
+
+        def holds_specs(self):
+            g = LazySerialGroup("foo", HostSpec("bar"))
+            assert g == [HostSpec("foo"), HostSpec("bar")]
+
+        def takes_regular_group_kwargs(self):
+            g = LazyThreadingGroup("foo", concurrency=2, batch_size=1)
+            assert g.concurrency == 2
+            assert g._batch_size == 1
+
+    def results_are_keyed_by_spec(self):
+        created, patcher = self._materialized()
+        g = LazySerialGroup("foo", "bar")
+        with patcher:
+            result = g.run("whatever")
+        assert result == {
+            g[0]: created[0].run.return_value,
+            g[1]: created[1].run.return_value,
+        }
+
+    def connections_are_materialized_per_call_and_closed(self):
+        created, patcher = self._materialized()
+        g = LazySerialGroup("foo", "bar")
+        with patcher:
+            g.run("whatever")
+            g.sudo("whatever")
+        assert len(created) == 4
+        for cxn in created:
+            cxn.close.assert_called_once_with()
+
+    def connections_get_clones_of_group_config(self):
+        created, patcher = self._materialized()
+        g = LazySerialGroup("foo", "bar")
+        with patcher:
+            g.run("whatever")
+        assert created[0].config is not created[1].config
+        assert all(x.config is not g.config for x in created)
+        assert all(x.config == g.config for x in created)
+
+    def failures_are_reported_per_spec(self):
+        g = LazySerialGroup("foo", "bar")
+
+        def materialize(spec, config=None):
+            cxn = Mock(name=spec.host)
+            if spec.host == "bar":
+                cxn.run.side_effect = OhNoz
+            return cxn
+
+        class OhNoz(Exception):
+            pass
+
+        with patch.object(HostSpec, "materialize", materialize):
+            with pytest.raises(GroupException) as info:
+                g.run("whatever")
+        result = info.value.result
+        assert isinstance(result.failed[g[1]], OhNoz)
+        assert g[0] in result.succeeded
+
+    def only_concurrency_many_connections_exist_at_once(self):
+        lock = Lock()
+        state = {"live": 0, "most": 0}
+
+        def run(*args, **kwargs):
+            with lock:
+                state["live"] += 1
+                state["most"] = max(state["most"], state["live"])
+            time.sleep(0.01)
+            with lock:
+                state["live"] -= 1
+
+        def materialize(spec, config=None):
+            cxn = Mock(name=spec.host)
+            cxn.run.side_effect = run
+            return cxn
+
+        g = LazyThreadingGroup(*["host{}".format(x) for x in range(12)])
+        g.concurrency = 3
+        with patch.object(HostSpec, "materialize", materialize):
+            result = g.run("whatever")
+        assert len(result) == 12
+        assert state["most"] <= 3
+
+    def run_iter_yields_specs(self):
+        created, patcher = self._materialized()
+        g = LazyThreadingGroup("foo", "bar")
+        with patcher:
+            pairs = dict(g.run_iter("whatever"))
+        assert set(pairs) == set(g)
+
+    def coalesces_equal_specs(self):
+        created, patcher = self._materialized()
+        g = LazySerialGroup("foo", "foo", "bar", coalesce=True)
+        with patcher:
+            result = g.run("whatever")
+        assert len(created) == 2
+        assert result[g[1]] is result[g[0]]
+
+    def map_hands_fn_materializing_stand_ins(self):
+        created, patcher = self._materialized()
+        g = LazySerialGroup("foo", "bar")
+        with patcher:
+            result = g.map(lambda cxn, item: cxn.run(item), ["a", "b"])
+        assert result == [x.run.return_value for x in created]
+        for cxn in created:
+            cxn.close.assert_called_once_with()
+
+    class retries:
+
+        def _flaky(self):
+            # Connections materialized fail to open the first time.
+            created = []
+
+            def materialize(spec, config=None):
+                cxn = Mock(name=spec.host)
+                error = NoValidConnectionsError({("1.2.3.4", 22): None})
+                cxn.open.side_effect = [error, None]
+                created.append(cxn)
+                return cxn
+
+            return created, patch.object(HostSpec, "materialize", materialize)
+
+        def connecting_is_retried_by_the_operation_itself(self):
+            for cls in (LazySerialGroup, LazyThreadingGroup):
+                created, patcher = self._flaky()
+                g = cls("h1", "h2", retry=RetryPolicy(backoff=0))
+                with patcher:
+                    result = g.run("whatever")
+                assert len(result.succeeded) == 2
+                # No separate opening phase: one connection per host, which
+                # then runs the command.
+                assert len(created) == 2
+                for cxn in created:
+                    assert cxn.open.call_count == 2
+                    cxn.run.assert_called_once_with("whatever")
+                    cxn.close.assert_called_once_with()
+
+        def attempts_still_apply(self):
+            created, patcher = self._flaky()
+            g = LazySerialGroup("h1", retry=RetryPolicy(attempts=1))
+            with patcher:
+                with pytest.raises(GroupException) as info:
+                    g.run("whatever")
+            error = info.value.result[g[0]]
+            assert isinstance(error, NoValidConnectionsError)
+            assert not created[0].run.called
+
+    def map_workers_of_one_host_get_their_own_connections(self):
+        created = []
+
+        def materialize(spec, config=None):
+            cxn = Mock(name=spec.host)
+            # Long enough for all four calls to overlap.
+            cxn.run.side_effect = lambda item: time.sleep(0.05) or item
+            created.append(cxn)
+            return cxn
+
+        g = LazyThreadingGroup("foo")
+        with patch.object(HostSpec, "materialize", materialize):
+            result = g.map(
+                lambda cxn, item: cxn.run(item),
+                ["a", "b", "c", "d"],
+                per_host_concurrency=4,
+            )
+        assert result == ["a", "b", "c", "d"]
+        assert len(created) == 4
+        for cxn in created:
+            cxn.close.assert_called_once_with()
+
+    def close_materializes_nothing(self):
+        created, patcher = self._materialized()
+        cxn = Mock(name="plain")
+        g = LazyThreadingGroup("foo", "bar")
+        g.append(cxn)
+        with patcher:
+            result = g.close()
+        assert created == []
+        cxn.close.assert_called_once_with()
+        assert result == {g[0]: None, g[1]: None, cxn: cxn.close.return_value}
+
+
+class GroupResult_:
+
+    class grouped:
+
+        def _result(self, host, **kwargs):
+            kwargs.setdefault("connection", Connection(host))
+            return kwargs["connection"], Result(**kwargs)
+
+        def groups_connections_by_distinct_outcome(self):
+            result = GroupResult()
+            for host in ("web1", "web2", "web3"):
+                cxn, value = self._result(host, stdout="ok\n")
+                result[cxn] = value
+            odd, value = self._result("web4", stdout="uh oh\n", exited=1)
+            result[odd] = value
+            grouped = result.grouped()
+            assert list(grouped.values())[0] == set(result) - {odd}
+            outcomes = list(grouped)
+            assert outcomes == [
+                Outcome(0, "ok\n", "", None),
+                Outcome(1, "uh oh\n", "", None),
+            ]
+            assert outcomes[0].stdout == "ok\n"
+
+        def failures_and_errors_are_outcomes_too(self):
+            result = GroupResult()
+            cxn1, value = self._result("web1", stdout="x", exited=1)
+            result[cxn1] = UnexpectedExit(value)
+            cxn2, value = self._result("web2", stdout="x", exited=1)
+            result[cxn2] = UnexpectedExit(value)
+            cxn3, value = self._result("web3", stdout="x", exited=1)
+            result[cxn3] = value
+            result[Connection("web4")] = Exception("oh no")
+            result[Connection("web5")] = Skipped("canary failed")
+            grouped = result.grouped()
+            assert grouped[Outcome(1, "x", "", "UnexpectedExit")] == {
+                cxn1,
+                cxn2,
+            }
+            assert grouped[Outcome(1, "x", "", None)] == {cxn3}
+            assert Outcome(None, None, None, "Exception: oh no") in grouped
+            skipped = Outcome(None, None, None, "Skipped: canary failed")
+            assert grouped[skipped] == {Connection("web5")}
+
+        def non_command_results_group_together(self):
+            result = GroupResult()
+            result[Connection("web1")] = None
+            result[Connection("web2")] = None
+            grouped = result.grouped()
+            assert list(grouped) == [Outcome(None, None, None, None)]
+
+    class to_columns:
+
+        def setup(self):
+            self.result = GroupResult()
+            for host, exited, duration in (
+                ("web1", 0, 1.0),
+                ("web2", 0, 2.0),
+                ("web3", 2, 3.0),
+                ("web4", 0, 4.0),
+            ):
+                value = Result(
+                    connection=Connection(host),
+                    stdout="x" * exited,
+                    exited=exited,
+                    duration=duration,
+                )
+                if exited:
+                    value = UnexpectedExit(value)
+                self.result[Connection(host)] = value
+            self.result[Connection("web5")] = Exception("oh no")
+            self.result[Connection("web6")] = Skipped("canary failed")
+            self.columns = self.result.to_columns()
+
+        def holds_array_backed_columns_in_result_order(self):
+            columns = self.columns
+            assert len(columns) == 6
+            assert columns.connections == list(self.result)
+            assert list(columns.host) == [0, 1, 2, 3, 4, 5]
+            assert list(columns.exited) == [0, 0, 2, 0, -1, -1]
+            assert list(columns.stdout_length) == [0, 0, 2, 0, -1, -1]
+            assert list(columns.duration)[:4] == [1.0, 2.0, 3.0, 4.0]
+            assert all(math.isnan(x) for x in columns.duration[4:])
+            assert columns.failure_types == [
+                None,
+                "UnexpectedExit",
+                "Exception",
+                "Skipped",
+            ]
+            assert list(columns.failure) == [0, 0, 1, 0, 2, 3]
+            for name in ResultColumns.columns:
+                assert isinstance(getattr(columns, name), array)
+
+        def percentiles_interpolate_and_ignore_absent_values(self):
+            assert self.columns.percentile("duration", 50) == 2.5
+            assert self.columns.percentile("duration", 100) == 4.0
+            assert self.columns.percentile("duration", 0) == 1.0
+            empty = GroupResult().to_columns()
+            assert empty.percentile("duration", 50) is None
+
+        def histograms_count_distinct_values(self):
+            assert self.columns.histogram("exited") == {0: 3, 2: 1}
+            assert self.columns.histogram("failure") == {
+                "Exception": 1,
+                "Skipped": 1,
+                "UnexpectedExit": 1,
+            }
+
+        def histograms_may_use_bins(self):
+            histogram = self.columns.histogram("duration", bins=3)
+            assert list(histogram.values()) == [1, 1, 2]
+            assert list(histogram)[0] == (1.0, 2.0)
+
+        def slowest(self):
+            slowest = self.columns.slowest(2)
+            assert slowest == [
+                (Connection("web4"), 4.0),
+                (Connection("web3"), 3.0),
+            ]
+
+        def csv_export(self):
+            stream = StringIO()
+            self.columns.to_csv(stream)
+            lines = stream.getvalue().splitlines()
+            assert lines[0] == "host,exited,duration,stdout_length,failure"
+            assert lines[3] == "web3,2,3.0,2,UnexpectedExit"
+            assert lines[5] == "web5,,,,Exception"
+
+        def jsonl_export(self):
+            stream = StringIO()
+            self.columns.to_jsonl(stream)
+            rows = [json.loads(x) for x in stream.getvalue().splitlines()]
+            assert len(rows) == 6
+            assert rows[0] == {
+                "host": "web1",
+                "exited": 0,
+                "duration": 1.0,
+                "stdout_length": 0,
+                "failure": None,
+            }
+            assert rows[5]["failure"] == "Skipped"
+            assert rows[5]["duration"] is None
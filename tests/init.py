@@ -1,5 +1,5 @@
 import fabric
-from fabric import _version, connection, runners, group
+from fabric import _version, connection, runners, group, retry
 
 
 class init:
@@ -32,3 +32,15 @@ class init:
 
     def GroupResult(self):
         assert fabric.GroupResult is group.GroupResult
+
+    def HostSpec(self):
+        assert fabric.HostSpec is group.HostSpec
+
+    def LazySerialGroup(self):
+        assert fabric.LazySerialGroup is group.LazySerialGroup
+
+    def LazyThreadingGroup(self):
+        assert fabric.LazyThreadingGroup is group.LazyThreadingGroup
+
+    def RetryPolicy(self):
+        assert fabric.RetryPolicy is retry.RetryPolicy
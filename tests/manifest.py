@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from threading import Thread
+
+from mock import patch
+
+from fabric import manifest as manifest_module
+from fabric.manifest import Manifest, file_digest, manifest
+
+
+def _write(path, data, age=60):
+    with open(path, "wb") as fd:
+        fd.write(data)
+    # Old enough to be cached (see Manifest.racy)
+    past = os.stat(path).st_mtime - age
+    os.utime(path, (past, past))
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class file_digest_:
+
+    def returns_sha256_hexdigest(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "file")
+            _write(path, b"x" * 3000000)
+            assert file_digest(path) == _sha(b"x" * 3000000)
+        finally:
+            shutil.rmtree(tmp)
+
+
+class Manifest_:
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = os.path.join(self.tmp, "manifest")
+        self.file = os.path.join(self.tmp, "file")
+        _write(self.file, b"contents")
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    def _hashes(self):
+        return patch(
+            "fabric.manifest.file_digest", side_effect=file_digest
+        )
+
+    class digest:
+
+        def hashes_new_files(self):
+            assert Manifest(self.cache).digest(self.file) == _sha(b"contents")
+
+        def reuses_digests_of_unchanged_files(self):
+            cache = Manifest(self.cache)
+            cache.digest(self.file)
+            with self._hashes() as hashes:
+                assert cache.digest(self.file) == _sha(b"contents")
+            assert not hashes.called
+
+        def persists_across_instances(self):
+            Manifest(self.cache).digest(self.file)
+            with self._hashes() as hashes:
+                digest = Manifest(self.cache).digest(self.file)
+            assert digest == _sha(b"contents")
+            assert not hashes.called
+
+        def rehashes_changed_files(self):
+            cache = Manifest(self.cache)
+            cache.digest(self.file)
+            _write(self.file, b"changed!", age=30)
+            assert cache.digest(self.file) == _sha(b"changed!")
+            assert Manifest(self.cache).digest(self.file) == _sha(b"changed!")
+
+        def rehashes_replaced_files(self):
+            cache = Manifest(self.cache)
+            cache.digest(self.file)
+            mtime = os.stat(self.file).st_mtime
+            other = os.path.join(self.tmp, "other")
+            # Same size & mtime; different inode.
+            _write(other, b"CONTENTS")
+            os.utime(other, (mtime, mtime))
+            os.rename(other, self.file)
+            assert cache.digest(self.file) == _sha(b"CONTENTS")
+
+        def does_not_cache_recently_modified_files(self):
+            cache = Manifest(self.cache)
+            _write(self.file, b"fresh", age=0)
+            assert cache.digest(self.file) == _sha(b"fresh")
+            assert len(cache) == 0
+
+        def hashes_once_for_concurrent_callers(self):
+            cache = Manifest(self.cache)
+            digests = []
+
+            def work():
+                digests.append(cache.digest(self.file))
+
+            with self._hashes() as hashes:
+                threads = [Thread(target=work) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            assert digests == [_sha(b"contents")] * 8
+            assert hashes.call_count == 1
+
+    class loading:
+
+        def ignores_partial_lines(self):
+            Manifest(self.cache).digest(self.file)
+            with open(self.cache, "a") as fd:
+                fd.write('["/trunc')
+            assert len(Manifest(self.cache)) == 1
+
+        def compacts_superseded_and_stale_entries(self):
+            gone = os.path.join(self.tmp, "gone")
+            with open(self.cache, "w") as fd:
+                for i in range(200):
+                    entry = [self.file, 1, 2, i, "0" * 64]
+                    fd.write(json.dumps(entry) + "\n")
+                fd.write(json.dumps([gone, 1, 2, 3, "0" * 64]) + "\n")
+            assert len(Manifest(self.cache)) == 1
+            with open(self.cache) as fd:
+                lines = [json.loads(x) for x in fd]
+            assert lines == [[self.file, 1, 2, 199, "0" * 64]]
+
+
+class manifest_:
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+        manifest_module._manifests.clear()
+
+    def shares_instances_per_path(self):
+        path = os.path.join(self.tmp, "manifest")
+        assert manifest(path) is manifest(path)
+        other = os.path.join(self.tmp, "other")
+        assert manifest(path) is not manifest(other)
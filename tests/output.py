@@ -0,0 +1,70 @@
+try:
+    from invoke.vendor.six import StringIO
+except ImportError:
+    from six import StringIO
+
+from fabric.output import OutputMultiplexer
+
+
+def _multiplexer(**kwargs):
+    out, err = StringIO(), StringIO()
+    mux = OutputMultiplexer(out_stream=out, err_stream=err, **kwargs)
+    mux.start()
+    return mux, out, err
+
+
+class OutputMultiplexer_:
+
+    def prefixes_each_line_with_source_prefix(self):
+        mux, out, _ = _multiplexer()
+        source = mux.register("[web1] ")
+        source.out.write("hello\nworld\n")
+        source.close()
+        mux.close()
+        assert out.getvalue() == "[web1] hello\n[web1] world\n"
+
+    def only_emits_whole_lines(self):
+        mux, out, _ = _multiplexer()
+        one, two = mux.register("[1] "), mux.register("[2] ")
+        one.out.write("hel")
+        two.out.write("other\n")
+        one.out.write("lo\n")
+        one.close()
+        two.close()
+        mux.close()
+        assert out.getvalue() == "[2] other\n[1] hello\n"
+
+    def trailing_partial_lines_written_on_source_close(self):
+        mux, out, _ = _multiplexer()
+        source = mux.register("[web1] ")
+        source.out.write("no newline")
+        source.close()
+        mux.close()
+        assert out.getvalue() == "[web1] no newline\n"
+
+    def unclosed_sources_are_flushed_on_close(self):
+        mux, out, _ = _multiplexer()
+        mux.register("[web1] ").out.write("dangling")
+        mux.close()
+        assert out.getvalue() == "[web1] dangling\n"
+
+    def stderr_goes_to_err_stream(self):
+        mux, out, err = _multiplexer()
+        source = mux.register("[web1] ")
+        source.err.write("oh no\n")
+        source.close()
+        mux.close()
+        assert out.getvalue() == ""
+        assert err.getvalue() == "[web1] oh no\n"
+
+    def buffering_holds_output_until_source_closes(self):
+        mux, out, _ = _multiplexer(buffer=True)
+        one, two = mux.register("[1] "), mux.register("[2] ")
+        one.out.write("a\n")
+        two.out.write("x\n")
+        one.out.write("b\n")
+        two.out.write("y\n")
+        two.close()
+        one.close()
+        mux.close()
+        assert out.getvalue() == "[2] x\n[2] y\n[1] a\n[1] b\n"
@@ -0,0 +1,78 @@
+import socket
+
+from paramiko.ssh_exception import (
+    AuthenticationException,
+    NoValidConnectionsError,
+    SSHException,
+)
+
+from fabric.retry import RetryPolicy
+
+
+class RetryPolicy_:
+
+    class retryable:
+
+        def transient_errors_by_default(self):
+            policy = RetryPolicy()
+            assert policy.retryable(socket.timeout())
+            assert policy.retryable(SSHException("Error reading SSH banner"))
+            error = NoValidConnectionsError({("1.2.3.4", 22): Exception()})
+            assert policy.retryable(error)
+
+        def not_other_errors(self):
+            assert not RetryPolicy().retryable(ValueError())
+
+        def never_authentication_failures(self):
+            policy = RetryPolicy(retry_on=[SSHException])
+            assert not policy.retryable(AuthenticationException())
+
+        def retry_on_may_be_given(self):
+            policy = RetryPolicy(retry_on=[ValueError])
+            assert policy.retryable(ValueError())
+            assert not policy.retryable(socket.timeout())
+
+    class delay:
+
+        def backs_off_exponentially(self):
+            policy = RetryPolicy(backoff=1, factor=2, jitter=0)
+            assert [policy.delay(x) for x in (1, 2, 3)] == [1, 2, 4]
+
+        def is_capped(self):
+            policy = RetryPolicy(backoff=1, max_backoff=3, jitter=0)
+            assert policy.delay(10) == 3
+
+        def is_jittered(self):
+            policy = RetryPolicy(backoff=10, jitter=0.5)
+            delays = [policy.delay(1) for _ in range(50)]
+            assert all(5 <= x <= 15 for x in delays)
+            assert len(set(delays)) > 1
+
+    class circuit_breaker:
+
+        def trips_after_consecutive_failures(self):
+            policy = RetryPolicy(trip_after=2)
+            policy.record("host", True)
+            assert not policy.tripped("host")
+            policy.record("host", True)
+            assert policy.tripped("host")
+            assert not policy.tripped("other")
+
+        def success_resets_count(self):
+            policy = RetryPolicy(trip_after=2)
+            policy.record("host", True)
+            policy.record("host", False)
+            policy.record("host", True)
+            assert not policy.tripped("host")
+
+        def may_be_disabled(self):
+            policy = RetryPolicy(trip_after=None)
+            for _ in range(100):
+                policy.record("host", True)
+            assert not policy.tripped("host")
+
+        def reset_forgets_failures(self):
+            policy = RetryPolicy(trip_after=1)
+            policy.record("host", True)
+            policy.reset()
+            assert not policy.tripped("host")
@@ -1,11 +1,18 @@
+from io import BytesIO
+
 try:
     from invoke.vendor.six import StringIO
 except ImportError:
     from six import StringIO
 
 from invoke import pty_size, Result
+from invoke import exceptions as invoke_exceptions
+from mock import Mock
+import pytest
 
 from fabric import Config, Connection, Remote
+from fabric.runners import Result as FabricResult
+from fabric.exceptions import CommandTimedOut
 
 
 # On most systems this will explode if actually executed as a shell command;
@@ -43,6 +50,244 @@ class Remote_:
             r.run(CMD, out_stream=fakeout)
             assert fakeout.getvalue() == "hello yes this is dog"
 
+        class binary:
+
+            def writes_raw_bytes_to_out_stream(self, remote):
+                # Deliberately not valid UTF-8.
+                payload = b"\x1f\x8b\x08\x00\xff\xfe"
+                remote.expect(out=payload)
+                r = Remote(context=_Connection("host"))
+                sink = BytesIO()
+                r.run(CMD, binary=True, out_stream=sink)
+                assert sink.getvalue() == payload
+
+            def does_not_capture_stdout(self, remote):
+                remote.expect(out=b"lots of bytes")
+                r = Remote(context=_Connection("host"))
+                result = r.run(CMD, binary=True, out_stream=BytesIO())
+                assert result.stdout == ""
+
+            def writes_to_buffer_of_text_streams(self, remote):
+                remote.expect(out=b"\xff\x00")
+                r = Remote(context=_Connection("host"))
+                sink = BytesIO()
+
+                class TextStream(StringIO):
+                    buffer = sink
+
+                r.run(CMD, binary=True, out_stream=TextStream())
+                assert sink.getvalue() == b"\xff\x00"
+
+            def defaults_to_config_value(self, remote):
+                remote.expect(out=b"\xff\x00")
+                config = Config({"run": {"in_stream": False, "binary": True}})
+                r = Remote(context=Connection("host", config=config))
+                sink = BytesIO()
+                r.run(CMD, out_stream=sink)
+                assert sink.getvalue() == b"\xff\x00"
+
+        class timeout:
+
+            def _hanging_channel(self, remote, **kwargs):
+                # Never finishes on its own; closing the channel is what makes
+                # exit_status_ready() flip, as with a real Paramiko Channel.
+                chan = remote.expect(waits=10 ** 6, **kwargs)
+
+                def close():
+                    chan.exit_status_ready.side_effect = None
+                    chan.exit_status_ready.return_value = True
+
+                chan.close.side_effect = close
+                return chan
+
+            def kills_channel_and_raises_CommandTimedOut(self, remote):
+                chan = self._hanging_channel(remote, out=b"partial output")
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(CMD, timeout=0.1, hide=True)
+                except CommandTimedOut as e:
+                    assert e.timeout == 0.1
+                    assert e.result.stdout == "partial output"
+                    assert chan.close.called
+                    assert r.timed_out
+                else:
+                    assert False, "Did not raise CommandTimedOut!"
+
+            @pytest.mark.skipif(
+                not hasattr(invoke_exceptions, "CommandTimedOut"),
+                reason="Invoke predates command timeouts",
+            )
+            def is_an_Invoke_CommandTimedOut(self, remote):
+                self._hanging_channel(remote)
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(CMD, timeout=0.1, hide=True)
+                except invoke_exceptions.CommandTimedOut as e:
+                    assert isinstance(e, CommandTimedOut)
+                    assert e.timeout == 0.1
+                else:
+                    assert False, "Did not raise CommandTimedOut!"
+
+            def raises_even_when_warn_is_True(self, remote):
+                self._hanging_channel(remote)
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(CMD, timeout=0.1, warn=True, hide=True)
+                except CommandTimedOut:
+                    pass
+                else:
+                    assert False, "Did not raise CommandTimedOut!"
+
+            def interrupts_remote_process_under_pty(self, remote):
+                chan = self._hanging_channel(remote)
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(CMD, timeout=0.1, pty=True, hide=True)
+                except CommandTimedOut:
+                    chan.send.assert_called_once_with(u"\x03")
+                else:
+                    assert False, "Did not raise CommandTimedOut!"
+
+            def defaults_to_config_value(self, remote):
+                self._hanging_channel(remote)
+                config = Config(
+                    {"run": {"in_stream": False}, "timeouts": {"command": 0.1}}
+                )
+                r = Remote(context=Connection("host", config=config))
+                try:
+                    r.run(CMD, hide=True)
+                except CommandTimedOut as e:
+                    assert e.timeout == 0.1
+                else:
+                    assert False, "Did not raise CommandTimedOut!"
+
+            def fast_commands_are_unaffected(self, remote):
+                chan = remote.expect()
+                r = Remote(context=_Connection("host"))
+                result = r.run(CMD, timeout=5, hide=True)
+                assert result.ok
+                assert not r.timed_out
+                assert not chan.send.called
+
+        class stdin:
+
+            def _run(self, remote, stdin, expected, **kwargs):
+                chan = remote.expect(in_=expected)
+                r = Remote(context=_Connection("host"))
+                r.run(CMD, stdin=stdin, hide=True, **kwargs)
+                remote.sanity()
+                chan.shutdown_write.assert_called_once_with()
+                return r
+
+            def accepts_bytes(self, remote):
+                self._run(remote, b"\x00binary\xff", b"\x00binary\xff")
+
+            def accepts_text(self, remote):
+                self._run(remote, u"some text", b"some text")
+
+            def accepts_file_like_objects(self, remote):
+                data = b"x" * (Remote.stdin_chunk_size * 3 + 17)
+                self._run(remote, BytesIO(data), data)
+
+            def accepts_iterables_of_chunks(self, remote):
+                def gen():
+                    yield b"first,"
+                    yield u"second,"
+                    yield b""
+                    yield b"third"
+
+                self._run(remote, gen(), b"first,second,third")
+
+            def sends_large_chunks(self, remote):
+                data = b"y" * (Remote.stdin_chunk_size * 2)
+                chan = remote.expect()
+                chan.sendall = Mock()
+                r = Remote(context=_Connection("host"))
+                r.run(CMD, stdin=data, hide=True)
+                sizes = [len(x[0][0]) for x in chan.sendall.call_args_list]
+                assert sizes == [Remote.stdin_chunk_size] * 2
+
+            def may_not_be_combined_with_in_stream(self, remote):
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(CMD, stdin=b"data", in_stream=StringIO())
+                except ValueError:
+                    pass
+                else:
+                    assert False, "Did not raise ValueError!"
+
+        class env_mode:
+
+            def request_mode_is_default(self, remote):
+                chan = remote.expect(cmd=CMD)
+                r = Remote(context=_Connection("host"))
+                r.run(CMD, env={"FOO": "bar"}, hide=True)
+                chan.update_environment.assert_called_once_with(
+                    {"FOO": "bar"}
+                )
+                remote.sanity()
+
+            def inline_mode_prefixes_quoted_exports(self, remote):
+                expected = "export A='b c' FOO=bar && " + CMD
+                chan = remote.expect(cmd=expected)
+                r = Remote(context=_Connection("host"))
+                r.run(
+                    CMD,
+                    env={"FOO": "bar", "A": "b c"},
+                    env_mode="inline",
+                    hide=True,
+                )
+                chan.update_environment.assert_called_once_with({})
+                remote.sanity()
+
+            def inline_mode_leaves_command_alone_without_env(self, remote):
+                remote.expect(cmd=CMD)
+                r = Remote(context=_Connection("host"))
+                r.run(CMD, env_mode="inline", hide=True)
+                remote.sanity()
+
+            def auto_mode_only_inlines_commonly_rejected_vars(self, remote):
+                chan = remote.expect(cmd="export FOO=bar && " + CMD)
+                r = Remote(context=_Connection("host"))
+                env = {"FOO": "bar", "LANG": "C", "LC_ALL": "C"}
+                r.run(CMD, env=env, env_mode="auto", hide=True)
+                chan.update_environment.assert_called_once_with(
+                    {"LANG": "C", "LC_ALL": "C"}
+                )
+                remote.sanity()
+
+            def inline_mode_rejects_invalid_var_names(self, remote):
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(
+                        CMD,
+                        env={"BAD; rm -rf /": "x"},
+                        env_mode="inline",
+                        hide=True,
+                    )
+                except ValueError:
+                    pass
+                else:
+                    assert False, "Did not raise ValueError!"
+
+            def rejects_unknown_modes(self, remote):
+                r = Remote(context=_Connection("host"))
+                try:
+                    r.run(CMD, env_mode="telepathy")
+                except ValueError:
+                    pass
+                else:
+                    assert False, "Did not raise ValueError!"
+
+            def defaults_to_config_value(self, remote):
+                remote.expect(cmd="export FOO=bar && " + CMD)
+                config = Config(
+                    {"run": {"in_stream": False, "env_mode": "inline"}}
+                )
+                r = Remote(context=Connection("host", config=config))
+                r.run(CMD, env={"FOO": "bar"}, hide=True)
+                remote.sanity()
+
         def pty_True_uses_paramiko_get_pty(self, remote):
             chan = remote.expect()
             c = _Connection("host")
@@ -123,3 +368,84 @@ class Remote_:
         # basics?
 
         # TODO: all other run() tests from fab1...
+
+
+class Result_:
+
+    def _result(self, **kwargs):
+        kwargs.setdefault("connection", None)
+        return FabricResult(**kwargs)
+
+    def output_attributes_behave_like_strings(self):
+        result = self._result(stdout=u"out \u2603", stderr="err")
+        assert result.stdout == u"out \u2603"
+        assert result.stderr == "err"
+        result.stdout = "changed"
+        assert result.stdout == "changed"
+        assert result.tail("stdout") == "\n\nchanged"
+
+    def identical_outputs_share_storage(self):
+        one = self._result(stdout="same" * 100)
+        two = self._result(stdout="same" * 100)
+        assert one._stdout is two._stdout
+        assert one._stdout is not self._result(stdout="other")._stdout
+
+    def compression_is_optional_and_transparent(self):
+        text = "very repetitive output\n" * 1000
+        result = self._result(stdout=text, compress=True)
+        assert result._stdout.compressed
+        assert len(result._stdout.data) < len(text)
+        assert result.stdout == text
+        # Stays compressed after access
+        assert result._stdout.compressed
+
+    def uncompressed_output_is_kept_as_given(self):
+        text = u"kept \u2603" * 10
+        assert self._result(stdout=text).stdout is text
+
+    def incompressible_output_is_stored_as_is(self):
+        result = self._result(stdout="x", compress=True)
+        assert not result._stdout.compressed
+        assert result.stdout == "x"
+
+    def digest_identifies_outputs_and_exit_code(self):
+        one = self._result(stdout="out", stderr="err", exited=1)
+        assert one.digest == self._result(
+            stdout="out", stderr="err", exited=1
+        ).digest
+        for kwargs in (
+            dict(stdout="out", stderr="err", exited=0),
+            dict(stdout="out!", stderr="err", exited=1),
+            dict(stdout="outerr", stderr="", exited=1),
+        ):
+            assert self._result(**kwargs).digest != one.digest
+
+    def digest_ignores_compression(self):
+        text = "very repetitive output\n" * 1000
+        squashed = self._result(stdout=text, compress=True)
+        plain = self._result(stdout=text)
+        assert squashed._stdout is not plain._stdout
+        assert squashed.digest == plain.digest
+
+    def stdout_size_is_encoded_length(self):
+        assert self._result(stdout=u"\u2603\n").stdout_size == 4
+        text = "very repetitive output\n" * 1000
+        result = self._result(stdout=text, compress=True)
+        assert result.stdout_size == len(text)
+
+    def duration_defaults_to_None(self):
+        assert self._result().duration is None
+
+    def remote_records_duration(self, remote):
+        remote.expect(out=b"hi\n")
+        r = Remote(context=_Connection("host"))
+        result = r.run(CMD, hide=True)
+        assert isinstance(result.duration, float)
+        assert result.duration >= 0
+
+    def remote_compress_output_option_is_honored(self, remote):
+        remote.expect(out=b"data\n" * 1000)
+        r = Remote(context=_Connection("host"))
+        result = r.run(CMD, compress_output=True, hide=True)
+        assert result._stdout.compressed
+        assert result.stdout == "data\n" * 1000
@@ -1,14 +1,28 @@
+import hashlib
+from io import BytesIO
+import os
+import shutil
+import stat
+import tempfile
+import zlib
+
 try:
     from invoke.vendor.six import StringIO
 except ImportError:
     from six import StringIO
 
-from mock import Mock, call
+from mock import Mock, call, patch
+import pytest
 from pytest_relaxed import raises
 from paramiko import SFTPAttributes
 
 from fabric import Connection
-from fabric.transfer import Transfer
+from fabric import manifest as manifest_module
+from fabric.exceptions import TransferFailed
+from fabric.manifest import file_digest, manifest
+from fabric.transfer import Transfer, _Delta, _Pipeline
+
+from _util import LocalExecChannel, LocalSFTP
 
 
 # TODO: pull in all edge/corner case tests from fabric v1
@@ -69,6 +83,35 @@ class Transfer_:
             def local_empty_string_uses_remote_filename(self, transfer):
                 assert transfer.get("file", local="").local == "/local/file"
 
+            def local_with_trailing_slash_is_a_directory(self, sftp):
+                transfer, client, mock_os = sftp
+                mock_os.path.isdir.return_value = False
+                mock_os.path.join.side_effect = os.path.join
+                result = transfer.get("dir/file", local="downloads/")
+                mock_os.makedirs.assert_called_once_with("/local/downloads/")
+                assert result.local == "/local/downloads/file"
+                client.get.assert_called_with(
+                    remotepath="/remote/dir/file",
+                    localpath="/local/downloads/file",
+                )
+
+            def local_is_formatted_with_connection_info(self, sftp):
+                transfer, client, mock_os = sftp
+                cxn = transfer.connection
+                result = transfer.get("file", local="{user}@{host}-{port}.txt")
+                expected = "/local/{}@{}-{}.txt".format(
+                    cxn.user, cxn.host, cxn.port
+                )
+                assert result.local == expected
+
+            def other_braces_in_local_are_left_alone(self, sftp):
+                transfer, client, mock_os = sftp
+                result = transfer.get("file", local="out{1}{foo}-{host}.txt")
+                expected = "/local/out{{1}}{{foo}}-{}.txt".format(
+                    transfer.connection.host
+                )
+                assert result.local == expected
+
             @raises(TypeError)
             def remote_arg_is_required(self, transfer):
                 transfer.get()
@@ -217,3 +260,718 @@ class Transfer_:
                 transfer, client = sftp_objs
                 transfer.put("file", preserve_mode=False)
                 assert not client.chmod.called
+
+
+def _write(path, data=b"", mode=None):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, "wb") as fd:
+        fd.write(data)
+    if mode is not None:
+        os.chmod(path, mode)
+
+
+def _read(path):
+    with open(path, "rb") as fd:
+        return fd.read()
+
+
+def _tree(root):
+    _write(os.path.join(root, "top.txt"), b"top", 0o600)
+    _write(os.path.join(root, "sub", "one.txt"), b"one" * 50000, 0o755)
+    _write(os.path.join(root, "sub", "deeper", "two.txt"), b"two")
+    _write(os.path.join(root, "sub", "empty"))
+
+
+def _assert_tree(root):
+    assert _read(os.path.join(root, "top.txt")) == b"top"
+    assert _read(os.path.join(root, "sub", "one.txt")) == b"one" * 50000
+    deeper = os.path.join(root, "sub", "deeper", "two.txt")
+    assert _read(deeper) == b"two"
+    assert _read(os.path.join(root, "sub", "empty")) == b""
+    mode = os.stat(os.path.join(root, "top.txt")).st_mode
+    assert stat.S_IMODE(mode) == 0o600
+    mode = os.stat(os.path.join(root, "sub", "one.txt")).st_mode
+    assert stat.S_IMODE(mode) == 0o755
+
+
+def _linked_tree(root):
+    _tree(root)
+    os.symlink(os.path.join(root, "sub"), os.path.join(root, "link"))
+    # A cycle, which mustn't be followed forever.
+    os.symlink(root, os.path.join(root, "sub", "up"))
+
+
+def _assert_linked_tree(root):
+    _assert_tree(root)
+    listing = sorted(os.listdir(os.path.join(root, "sub")))
+    assert sorted(os.listdir(os.path.join(root, "link"))) == listing
+    assert "up" not in listing
+
+
+class trees:
+    "recursive directory transfers"
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.local = os.path.join(self.tmp, "local")
+        self.remote = os.path.join(self.tmp, "remote")
+        os.makedirs(self.remote)
+        self.sftp = LocalSFTP(self.remote)
+        cxn = Connection("host")
+        cxn.sftp = Mock(return_value=self.sftp)
+        # For tar transfers: exec channels run their commands locally.
+        self.channels = []
+        cxn.create_session = Mock(side_effect=self._create_session)
+        self.transfer = Transfer(cxn)
+
+    def _create_session(self):
+        channel = LocalExecChannel(self.remote)
+        self.channels.append(channel)
+        return channel
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    class put:
+
+        def uploads_directories_recursively(self):
+            _tree(self.local)
+            result = self.transfer.put(self.local, "/dest")
+            assert result.remote == "/dest"
+            assert result.local == self.local
+            _assert_tree(os.path.join(self.remote, "dest"))
+
+        def defaults_remote_to_local_basename(self):
+            _tree(self.local)
+            result = self.transfer.put(self.local)
+            assert result.remote == "/local"
+            _assert_tree(os.path.join(self.remote, "local"))
+
+        def trailing_separator_still_defaults_remote_to_basename(self):
+            _tree(self.local)
+            result = self.transfer.put(os.path.join(self.local, ""))
+            assert result.remote == "/local"
+            _assert_tree(os.path.join(self.remote, "local"))
+
+        def follows_symlinked_directories(self):
+            _linked_tree(self.local)
+            self.transfer.put(self.local, "/dest")
+            _assert_linked_tree(os.path.join(self.remote, "dest"))
+
+        def pipelines_requests(self):
+            _tree(self.local)
+            self.transfer.put(self.local, "/dest")
+            assert self.sftp.most_outstanding > 1
+
+        def merges_into_existing_directories(self):
+            _tree(self.local)
+            _write(os.path.join(self.remote, "dest", "sub", "other"), b"x")
+            self.transfer.put(self.local, "/dest")
+            _assert_tree(os.path.join(self.remote, "dest"))
+            other = os.path.join(self.remote, "dest", "sub", "other")
+            assert _read(other) == b"x"
+
+        def existing_files_in_the_way_are_errors(self):
+            _tree(self.local)
+            _write(os.path.join(self.remote, "dest", "sub"), b"x")
+            with pytest.raises(IOError):
+                self.transfer.put(self.local, "/dest")
+
+        def modes_may_be_left_alone(self):
+            _tree(self.local)
+            self.transfer.put(self.local, "/dest", preserve_mode=False)
+            path = os.path.join(self.remote, "dest", "top.txt")
+            assert stat.S_IMODE(os.stat(path).st_mode) != 0o600
+
+        def limits_requests_in_flight(self):
+            _tree(self.local)
+            with patch.object(_Pipeline, "window", 4):
+                self.transfer.put(self.local, "/dest")
+            _assert_tree(os.path.join(self.remote, "dest"))
+            assert self.sftp.most_outstanding <= 4
+
+    class get:
+
+        def downloads_directories_recursively(self):
+            _tree(os.path.join(self.remote, "src"))
+            result = self.transfer.get("src", os.path.join(self.local, ""))
+            assert result.remote == "/src"
+            assert result.local == os.path.join(self.local, "src")
+            _assert_tree(os.path.join(self.local, "src"))
+
+        def reads_large_files_in_pipelined_chunks(self):
+            data = os.urandom(100000)
+            _write(os.path.join(self.remote, "src", "big"), data)
+            with patch.object(_Pipeline, "window", 8):
+                self.transfer.get("src", self.local)
+            assert _read(os.path.join(self.local, "big")) == data
+            assert 1 < self.sftp.most_outstanding <= 8
+
+        def skips_non_regular_files(self):
+            _tree(os.path.join(self.remote, "src"))
+            link = os.path.join(self.remote, "src", "link")
+            os.symlink("top.txt", link)
+            self.transfer.get("src", self.local)
+            assert not os.path.lexists(os.path.join(self.local, "link"))
+
+        @raises(ValueError)
+        def file_like_local_is_rejected(self):
+            os.makedirs(os.path.join(self.remote, "src"))
+            self.transfer.get("src", StringIO())
+
+    class tar:
+
+        def puts_trees_through_one_exec_channel(self):
+            _tree(self.local)
+            result = self.transfer.put(self.local, "dest", method="tar")
+            _assert_tree(os.path.join(self.remote, "dest"))
+            assert len(self.channels) == 1
+            assert not self.transfer.connection.sftp.called
+            assert result.method == "tar"
+            assert result.exited == 0
+            assert result.remote == "dest"
+            assert result.local == self.local
+
+        def puts_follow_symlinked_directories(self):
+            _linked_tree(self.local)
+            self.transfer.put(self.local, "dest", method="tar")
+            _assert_linked_tree(os.path.join(self.remote, "dest"))
+
+        def puts_may_be_compressed(self):
+            _tree(self.local)
+            self.transfer.put(self.local, "dest", method="tar", compress=True)
+            _assert_tree(os.path.join(self.remote, "dest"))
+            assert "z" in self.channels[0].command.split()[-2]
+
+        def put_modes_may_be_left_alone(self):
+            _tree(self.local)
+            self.transfer.put(
+                self.local, "dest", method="tar", preserve_mode=False
+            )
+            path = os.path.join(self.remote, "dest", "top.txt")
+            assert stat.S_IMODE(os.stat(path).st_mode) != 0o600
+
+        @raises(ValueError)
+        def puts_require_directories(self):
+            _write(os.path.join(self.local, "file"), b"x")
+            self.transfer.put(
+                os.path.join(self.local, "file"), "dest", method="tar"
+            )
+
+        def failed_puts_raise_with_exit_status_and_stderr(self):
+            _tree(self.local)
+            _write(os.path.join(self.remote, "dest"), b"in the way")
+            with pytest.raises(TransferFailed) as info:
+                self.transfer.put(self.local, "dest", method="tar")
+            result = info.value.result
+            assert result.exited != 0
+            assert "dest" in result.stderr
+            assert "exited with status" in str(info.value)
+
+        def gets_trees_through_one_exec_channel(self):
+            _tree(os.path.join(self.remote, "src"))
+            local = os.path.join(self.local, "")
+            result = self.transfer.get("src/", local, method="tar")
+            _assert_tree(os.path.join(self.local, "src"))
+            assert len(self.channels) == 1
+            assert not self.transfer.connection.sftp.called
+            assert result.remote == "src"
+            assert result.local == os.path.join(self.local, "src")
+            assert result.exited == 0
+
+        def gets_may_be_compressed(self):
+            _tree(os.path.join(self.remote, "src"))
+            self.transfer.get("src", self.local, method="tar", compress=True)
+            _assert_tree(self.local)
+
+        def gets_skip_non_regular_files(self):
+            _tree(os.path.join(self.remote, "src"))
+            os.symlink("top.txt", os.path.join(self.remote, "src", "link"))
+            self.transfer.get("src", self.local, method="tar")
+            assert not os.path.lexists(os.path.join(self.local, "link"))
+
+        def failed_gets_raise_with_exit_status_and_stderr(self):
+            with pytest.raises(TransferFailed) as info:
+                self.transfer.get("nope", self.local, method="tar")
+            result = info.value.result
+            assert result.exited != 0
+            assert "nope" in result.stderr
+
+        @raises(ValueError)
+        def unknown_methods_are_rejected(self):
+            self.transfer.get("src", self.local, method="carrier-pigeon")
+
+        @raises(ValueError)
+        def may_not_be_the_configured_default(self):
+            self.transfer.connection.config.transfer.method = "tar"
+            self.transfer.get("src", self.local)
+
+
+class delta:
+    "delta (rsync-style) uploads"
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.local = os.path.join(self.tmp, "local")
+        self.remote = os.path.join(self.tmp, "remote")
+        self.channels = []
+        cxn = Connection("host")
+        cxn.sftp = Mock()
+        cxn.create_session = Mock(side_effect=self._create_session)
+        self.transfer = Transfer(cxn)
+        self.data = os.urandom(200000)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    def _create_session(self):
+        channel = LocalExecChannel(self.tmp)
+        self.channels.append(channel)
+        return channel
+
+    def _update(self, old, new, **kwargs):
+        if old is not None:
+            _write(self.remote, old)
+        _write(self.local, new)
+        self.transfer.put(self.local, "remote", delta=True, **kwargs)
+        assert _read(self.remote) == new
+        # Signature, then patch.
+        assert len(self.channels) == 2
+        return self.channels[1].written
+
+    def creates_new_files(self):
+        sent = self._update(None, self.data)
+        assert sent > len(self.data)
+
+    def sends_only_changed_blocks(self):
+        new = self.data[:100000] + b"changed!" + self.data[100008:]
+        assert self._update(self.data, new) < 5000
+
+    def finds_moved_data(self):
+        new = b"inserted" + self.data[:150000] + b"more" + self.data[150000:]
+        assert self._update(self.data, new) < 10000
+
+    def handles_shrinking_and_empty_files(self):
+        self._update(self.data, self.data[:1000])
+        self.channels = []
+        self._update(self.data, b"")
+
+    def result_reports_method_and_exit_status(self):
+        _write(self.local, self.data)
+        result = self.transfer.put(self.local, "remote", delta=True)
+        assert result.method == "delta"
+        assert result.exited == 0
+        assert result.remote == "remote"
+        assert not self.transfer.connection.sftp.called
+
+    def preserves_mode_by_default(self):
+        _write(self.remote, self.data, 0o600)
+        _write(self.local, self.data, 0o755)
+        self.transfer.put(self.local, "remote", delta=True)
+        assert stat.S_IMODE(os.stat(self.remote).st_mode) == 0o755
+
+    def otherwise_leaves_existing_mode_alone(self):
+        _write(self.remote, self.data, 0o600)
+        _write(self.local, self.data + b"x", 0o755)
+        self.transfer.put(
+            self.local, "remote", delta=True, preserve_mode=False
+        )
+        assert stat.S_IMODE(os.stat(self.remote).st_mode) == 0o600
+
+    def missing_remote_python_raises_TransferFailed(self):
+        _write(self.local, self.data)
+        with patch.object(_Delta, "python", "no-such-python"):
+            with pytest.raises(TransferFailed) as info:
+                self.transfer.put(self.local, "remote", delta=True)
+        assert info.value.result.exited != 0
+        assert "no-such-python" in info.value.result.stderr
+        assert len(self.channels) == 1
+
+    @raises(ValueError)
+    def requires_a_file(self):
+        os.makedirs(self.local)
+        self.transfer.put(self.local, "remote", delta=True)
+
+    @raises(ValueError)
+    def rejects_file_like_objects(self):
+        self.transfer.put(StringIO("x"), "remote", delta=True)
+
+    class ops:
+        "_ops"
+
+        def _literal(self, old, new, size=2048):
+            # Checks _ops' output rebuilds 'new' from 'old', returning how
+            # many bytes it sent literally.
+            blocks = [old[i:i + size] for i in range(0, len(old), size)]
+            signatures = {}
+            for index, block in enumerate(blocks):
+                table = signatures.setdefault(zlib.adler32(block), {})
+                table[hashlib.sha256(block).hexdigest()] = index
+            ops = list(_Delta(None)._ops(new, size, signatures))
+            rebuilt = []
+            for op in ops:
+                if op[0] == "C":
+                    rebuilt.extend(blocks[op[1]:op[1] + op[2]])
+                else:
+                    rebuilt.append(new[op[1]:op[2]])
+            assert b"".join(rebuilt) == new
+            return sum(x[2] - x[1] for x in ops if x[0] == "L")
+
+        def reconstruct_the_local_data(self):
+            old = os.urandom(50000)
+            new = old[:9000] + os.urandom(3000) + old[7000:] + old[:4000]
+            # Only what no whole old block covers: the new data plus the
+            # partial blocks either side of it, and the partial old blocks
+            # at the end of each copy of old data.
+            literal = self._literal(old, new)
+            assert literal == (808 + 3000 + 1192) + (848 + 1952)
+
+        def resync_after_long_unaligned_insertions(self):
+            old = os.urandom(200 * 2048)
+            # Longer than give_up blocks, and not a whole number of them.
+            inserted = os.urandom((_Delta.give_up + 4) * 2048 + 7)
+            new = old[:1000] + inserted + old[1000:]
+            literal = self._literal(old, new)
+            assert literal < len(inserted) + 4 * 2048
+
+
+class skip_unchanged:
+    "skip_unchanged"
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.local = os.path.join(self.tmp, "local")
+        self.remote = os.path.join(self.tmp, "remote")
+        self.channels = []
+        cxn = Connection("host")
+        # Remote paths are real (absolute) paths, for SFTP & commands alike.
+        self.sftp = LocalSFTP("/")
+        cxn.sftp = Mock(return_value=self.sftp)
+        cxn.create_session = Mock(side_effect=self._create_session)
+        self.transfer = Transfer(cxn)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    def _create_session(self):
+        channel = LocalExecChannel(self.tmp)
+        self.channels.append(channel)
+        return channel
+
+    def _same(self, mtime=1500000000):
+        for path in (self.local, self.remote):
+            _write(path, b"same")
+            os.utime(path, (mtime, mtime))
+
+    class by_size_and_mtime:
+
+        def skips_matching_puts(self):
+            self._same()
+            with patch.object(self.sftp, "put") as put:
+                result = self.transfer.put(
+                    self.local, self.remote, skip_unchanged="size_mtime"
+                )
+            assert result.skipped
+            assert not put.called
+
+        def skips_matching_gets(self):
+            self._same()
+            with patch.object(self.sftp, "get") as get:
+                result = self.transfer.get(
+                    self.remote, self.local, skip_unchanged="size_mtime"
+                )
+            assert result.skipped
+            assert not get.called
+
+        def transfers_on_differing_mtimes(self):
+            self._same()
+            os.utime(self.local, (1600000000, 1600000000))
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="size_mtime"
+            )
+            assert not result.skipped
+
+        def transfers_on_differing_sizes(self):
+            self._same()
+            _write(self.local, b"different")
+            os.utime(self.local, (1500000000, 1500000000))
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="size_mtime"
+            )
+            assert not result.skipped
+            assert _read(self.remote) == b"different"
+
+        def transfers_when_destination_is_missing(self):
+            _write(self.local, b"new")
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="size_mtime"
+            )
+            assert not result.skipped
+            assert _read(self.remote) == b"new"
+
+        def puts_copy_mtime_so_next_time_is_skipped(self):
+            _write(self.local, b"new")
+            os.utime(self.local, (1500000000, 1500000000))
+            self.transfer.put(
+                self.local, self.remote, skip_unchanged="size_mtime"
+            )
+            assert os.stat(self.remote).st_mtime == 1500000000
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="size_mtime"
+            )
+            assert result.skipped
+
+        def gets_copy_mtime_too(self):
+            _write(self.remote, b"new")
+            os.utime(self.remote, (1500000000, 1500000000))
+            self.transfer.get(
+                self.remote, self.local, skip_unchanged="size_mtime"
+            )
+            assert os.stat(self.local).st_mtime == 1500000000
+
+    class by_hash:
+
+        def skips_matching_files_regardless_of_mtime(self):
+            self._same()
+            os.utime(self.local, (1600000000, 1600000000))
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="hash"
+            )
+            assert result.skipped
+            assert self.channels[0].command.startswith("sha256sum ")
+            result = self.transfer.get(
+                self.remote, self.local, skip_unchanged="hash"
+            )
+            assert result.skipped
+
+        def handles_non_ascii_remote_paths(self):
+            self._same()
+            remote = os.path.join(self.tmp, u"caf\u00e9.txt")
+            os.rename(self.remote, remote)
+            result = self.transfer.put(
+                self.local, remote, skip_unchanged="hash"
+            )
+            assert result.skipped
+
+        def transfers_differing_files(self):
+            self._same()
+            _write(self.local, b"different")
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="hash"
+            )
+            assert not result.skipped
+            assert _read(self.remote) == b"different"
+
+        def transfers_when_remote_is_missing(self):
+            _write(self.local, b"new")
+            result = self.transfer.put(
+                self.local, self.remote, skip_unchanged="hash"
+            )
+            assert not result.skipped
+            assert _read(self.remote) == b"new"
+
+        def does_not_run_remote_command_when_local_is_missing(self):
+            _write(self.remote, b"new")
+            result = self.transfer.get(
+                self.remote, self.local, skip_unchanged="hash"
+            )
+            assert not result.skipped
+            assert not self.channels
+            assert _read(self.local) == b"new"
+
+        def combines_with_delta(self):
+            self._same()
+            result = self.transfer.put(
+                self.local, self.remote, delta=True, skip_unchanged="hash"
+            )
+            assert result.skipped
+            assert result.method == "delta"
+            assert len(self.channels) == 1
+
+        def caches_local_digests_in_configured_manifest(self):
+            self._same()
+            cache = os.path.join(self.tmp, "manifest")
+            self.transfer.connection.config.transfer.manifest = cache
+            try:
+                with patch(
+                    "fabric.manifest.file_digest", side_effect=file_digest
+                ) as hashes:
+                    for _ in range(2):
+                        result = self.transfer.put(
+                            self.local, self.remote, skip_unchanged="hash"
+                        )
+                        assert result.skipped
+                assert hashes.call_count == 1
+                assert len(manifest(cache)) == 1
+            finally:
+                manifest_module._manifests.clear()
+
+    @raises(ValueError)
+    def rejects_unknown_values(self):
+        self.transfer.put(self.local, self.remote, skip_unchanged="vibes")
+
+    @raises(ValueError)
+    def rejects_directories(self):
+        os.makedirs(self.local)
+        self.transfer.put(self.local, self.remote, skip_unchanged="hash")
+
+    @raises(ValueError)
+    def rejects_file_like_objects(self):
+        self._same()
+        self.transfer.get(self.remote, StringIO(), skip_unchanged="hash")
+
+    def results_are_not_skipped_by_default(self):
+        _write(self.local, b"new")
+        assert not self.transfer.put(self.local, self.remote).skipped
+
+
+@pytest.mark.skipif(
+    not any(
+        os.access(os.path.join(x, "scp"), os.X_OK)
+        for x in os.environ.get("PATH", "").split(os.pathsep)
+    ),
+    reason="Needs an scp binary (whose server modes stand in for a remote)",
+)
+class scp:
+    "method='scp'"
+
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.local = os.path.join(self.tmp, "local")
+        self.remote = os.path.join(self.tmp, "remote")
+        os.makedirs(self.remote)
+        self.channels = []
+        cxn = Connection("host")
+        cxn.sftp = Mock()
+        cxn.create_session = Mock(side_effect=self._create_session)
+        self.transfer = Transfer(cxn)
+
+    def teardown(self):
+        shutil.rmtree(self.tmp)
+
+    def _create_session(self):
+        channel = LocalExecChannel(self.remote)
+        self.channels.append(channel)
+        return channel
+
+    class put:
+
+        def uploads_files_with_one_command_and_no_sftp(self):
+            _write(self.local, b"data", 0o640)
+            result = self.transfer.put(self.local, "file", method="scp")
+            assert _read(os.path.join(self.remote, "file")) == b"data"
+            assert len(self.channels) == 1
+            assert self.channels[0].command.startswith("scp -t -p ")
+            assert not self.transfer.connection.sftp.called
+            assert result.method == "scp"
+            assert result.exited == 0
+            assert result.remote == "file"
+            assert result.local == self.local
+
+        def preserves_mode_of_existing_files(self):
+            _write(os.path.join(self.remote, "file"), b"old", 0o600)
+            _write(self.local, b"new", 0o755)
+            self.transfer.put(self.local, "file", method="scp")
+            mode = os.stat(os.path.join(self.remote, "file")).st_mode
+            assert stat.S_IMODE(mode) == 0o755
+
+        def or_leaves_it_alone(self):
+            _write(os.path.join(self.remote, "file"), b"old", 0o600)
+            _write(self.local, b"new", 0o755)
+            self.transfer.put(
+                self.local, "file", method="scp", preserve_mode=False
+            )
+            path = os.path.join(self.remote, "file")
+            assert _read(path) == b"new"
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+        def uploads_into_existing_directories_by_local_name(self):
+            _write(self.local, b"data")
+            os.makedirs(os.path.join(self.remote, "dir"))
+            self.transfer.put(self.local, "dir", method="scp")
+            assert _read(os.path.join(self.remote, "dir", "local")) == b"data"
+
+        def uploads_file_like_objects(self):
+            self.transfer.put(BytesIO(b"bytes"), "one", method="scp")
+            assert _read(os.path.join(self.remote, "one")) == b"bytes"
+            text = StringIO(u"t\xe9xt")
+            text.seek(2)
+            self.transfer.put(text, "two", method="scp")
+            two = _read(os.path.join(self.remote, "two"))
+            assert two == u"t\xe9xt".encode("utf-8")
+            assert text.tell() == 2
+
+        def uploads_directories_recursively(self):
+            _tree(self.local)
+            self.transfer.put(self.local, "dest", method="scp")
+            _assert_tree(os.path.join(self.remote, "dest"))
+
+        def follows_symlinked_directories(self):
+            _linked_tree(self.local)
+            self.transfer.put(self.local, "dest", method="scp")
+            _assert_linked_tree(os.path.join(self.remote, "dest"))
+
+        def may_be_selected_by_config(self):
+            _write(self.local, b"data")
+            self.transfer.connection.config.transfer.method = "scp"
+            assert self.transfer.put(self.local, "file").method == "scp"
+            assert not self.transfer.connection.sftp.called
+
+        def remote_errors_raise_TransferFailed(self):
+            _write(self.local, b"data")
+            with pytest.raises(TransferFailed) as info:
+                self.transfer.put(self.local, "nope/file", method="scp")
+            result = info.value.result
+            assert result.exited != 0
+            assert "No such file or directory" in result.stderr
+
+    class get:
+
+        def downloads_files_with_one_command_and_no_sftp(self):
+            _write(os.path.join(self.remote, "file"), b"data", 0o640)
+            result = self.transfer.get("file", self.local, method="scp")
+            assert _read(self.local) == b"data"
+            assert stat.S_IMODE(os.stat(self.local).st_mode) == 0o640
+            assert len(self.channels) == 1
+            assert not self.transfer.connection.sftp.called
+            assert result.method == "scp"
+            assert result.exited == 0
+            assert result.remote == "file"
+            assert result.local == self.local
+
+        def modes_may_be_left_alone(self):
+            _write(os.path.join(self.remote, "file"), b"data", 0o640)
+            _write(self.local, b"old", 0o600)
+            self.transfer.get(
+                "file", self.local, method="scp", preserve_mode=False
+            )
+            assert _read(self.local) == b"data"
+            assert stat.S_IMODE(os.stat(self.local).st_mode) == 0o600
+
+        def downloads_into_file_like_objects(self):
+            _write(os.path.join(self.remote, "file"), b"data")
+            fd = BytesIO()
+            self.transfer.get("file", fd, method="scp")
+            assert fd.getvalue() == b"data"
+
+        def downloads_directories_recursively(self):
+            _tree(os.path.join(self.remote, "src"))
+            result = self.transfer.get(
+                "src", os.path.join(self.local, ""), method="scp"
+            )
+            assert result.local == os.path.join(self.local, "src")
+            _assert_tree(os.path.join(self.local, "src"))
+
+        @raises(ValueError)
+        def directories_cannot_go_into_file_like_objects(self):
+            os.makedirs(os.path.join(self.remote, "src"))
+            self.transfer.get("src", BytesIO(), method="scp")
+
+        def remote_errors_raise_TransferFailed(self):
+            with pytest.raises(TransferFailed) as info:
+                self.transfer.get("nope", self.local, method="scp")
+            result = info.value.result
+            assert result.exited != 0
+            assert "No such file or directory" in result.stderr
+            assert not os.path.exists(self.local)